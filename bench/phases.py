@@ -0,0 +1,168 @@
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from bench.tree import vocabulary
+
+# Every phase runs in its own fresh process, so the peak RSS it reports is its
+# own. The index location comes from PYINDEX_INDEX_DIR, set by the runner.
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def quiet(coroutine):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(coroutine)
+
+
+def timed(coroutine):
+    start = time.perf_counter()
+    result = quiet(coroutine)
+    return time.perf_counter() - start, result
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(samples):
+    ordered = sorted(sample * 1000 for sample in samples)
+    return {
+        "p50_ms": round(percentile(ordered, 0.50), 3),
+        "p90_ms": round(percentile(ordered, 0.90), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "max_ms": round(ordered[-1], 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+    }
+
+
+def load_index():
+    # The benchmark index holds the generated tree as its only root.
+    from utlis.load import load_data
+    from utlis.roots import roots
+    seconds, _ = timed(load_data())
+    if not roots:
+        raise RuntimeError("no index to load; run the index phase first")
+    return seconds, next(iter(roots.values())).store
+
+
+def run_index(root, options):
+    from core.index import index
+    seconds, built = timed(index(root))
+    if not built:
+        raise RuntimeError(f"indexing {root} failed")
+    store = built[0].store
+    return {
+        "seconds": round(seconds, 3),
+        "files": store.file_count,
+        "folders": store.folder_count,
+        "files_per_second": round(store.file_count / seconds),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_load(root, options):
+    seconds, store = load_index()
+    return {
+        "seconds": round(seconds, 3),
+        "files": store.file_count,
+        "files_per_second": round(store.file_count / seconds),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_reindex(root, options):
+    # A reindex with nothing to do, then one after adding files to a sample
+    # of directories and one after removing them again, which also leaves
+    # the tree as it was generated.
+    from core.reindex import reindex_file
+    from utlis.save import wait_for_compaction
+    _, store = load_index()
+    noop, _ = timed(reindex_file(root))
+
+    rnd = random.Random(options["seed"])
+    dir_paths = sorted(store.dir_path(dir_id) for dir_id in store.iter_folders())
+    dirs = rnd.sample(dir_paths, min(len(dir_paths), options["churn_dirs"]))
+    created = []
+    for dir_path in dirs:
+        for i in range(options["churn_files"]):
+            path = os.path.join(dir_path, f'bench_churn_{i}.tmp')
+            open(path, 'wb').close()
+            created.append(path)
+    added, _ = timed(reindex_file(root))
+    for path in created:
+        os.remove(path)
+    removed, _ = timed(reindex_file(root))
+    wait_for_compaction()
+    return {
+        "noop_seconds": round(noop, 3),
+        "add_seconds": round(added, 3),
+        "remove_seconds": round(removed, 3),
+        "changed_dirs": len(dirs),
+        "changed_files": len(created),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def query_plan(options):
+    # (label, kind, text, limit). Queries come from the tree's vocabulary:
+    # the first word is the most common name, the last one of the rarest.
+    from utlis.config import SEARCH_LIMIT
+    words = vocabulary(options["seed"], options["vocab_size"])
+    common, rare = words[0], words[-1]
+    typo = common[1] + common[0] + common[2:]
+    return [
+        ("substring_common", "search", common, SEARCH_LIMIT),
+        ("substring_common_all", "search", common, None),
+        ("substring_rare", "search", rare, SEARCH_LIMIT),
+        ("substring_short", "search", common[:2], SEARCH_LIMIT),
+        ("path", "search", os.path.join('d1', 'd2'), SEARCH_LIMIT),
+        ("folders", "search", '-f d3', SEARCH_LIMIT),
+        ("files_and_folders", "search", f'-s {common}', SEARCH_LIMIT),
+        ("fuzzy", "search", f'-z {typo}', SEARCH_LIMIT),
+        ("glob", "search", f'-g *{common}*.txt', SEARCH_LIMIT),
+        ("regex", "search", f'-r ^{common}_[0-9]+', SEARCH_LIMIT),
+        ("extension", "exsearch", '.log', SEARCH_LIMIT),
+        ("filter", "filter", 'size<1K ext:.py', SEARCH_LIMIT),
+    ]
+
+
+def run_queries(root, options):
+    from search.exSearch import search_ext
+    from search.filters import search_filter
+    from search.search import search_files
+    from utlis.config import query_cache
+    functions = {"search": search_files, "exsearch": search_ext, "filter": search_filter}
+    load_index()
+    # Every repetition has to do the full work.
+    query_cache.max_entries = 0
+    results = {}
+    for label, kind, text, limit in query_plan(options):
+        samples = []
+        count = 0
+        for _ in range(options["repeat"]):
+            seconds, found = timed(functions[kind](text, limit))
+            samples.append(seconds)
+            count = len(found)
+        results[label] = {"query": text, "results": count, **latency_summary(samples)}
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+PHASES = {
+    "index": run_index,
+    "load": run_load,
+    "reindex": run_reindex,
+    "queries": run_queries,
+}
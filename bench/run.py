@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from bench.phases import PHASES
+from bench.tree import generate_tree
+
+# Metrics compared between runs; anything else (counts, queries, the noisy
+# tail latencies) is context.
+LOWER_IS_BETTER = ('seconds', 'p50_ms', 'p90_ms', 'mean_ms', 'rss_mb')
+HIGHER_IS_BETTER = ('per_second',)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark indexing, loading, reindexing and queries "
+                                                 "on a generated file tree")
+    parser.add_argument('--files', type=int, default=100_000, help="files in the generated tree")
+    parser.add_argument('--depth', type=int, default=4, help="directory levels below the root")
+    parser.add_argument('--fanout', type=int, default=8, help="subdirectories per directory")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent of the name distribution")
+    parser.add_argument('--unique-ratio', type=float, default=0.3, help="share of files with a unique name")
+    parser.add_argument('--vocab-size', type=int, default=5000, help="distinct words names are drawn from")
+    parser.add_argument('--file-bytes', type=int, default=0, help="bytes written to every file")
+    parser.add_argument('--tree', help="where to generate the tree (default: a temp dir keyed by the parameters)")
+    parser.add_argument('--phases', default=','.join(PHASES), help="comma-separated subset of " + ', '.join(PHASES))
+    parser.add_argument('--repeat', type=int, default=20, help="runs of every query")
+    parser.add_argument('--churn-dirs', type=int, default=50, help="directories changed for the reindex phase")
+    parser.add_argument('--churn-files', type=int, default=20, help="files added to each changed directory")
+    parser.add_argument('--out', help="write the results as JSON to this file")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare against an earlier JSON result")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="percent change counted as a regression (default 10)")
+    parser.add_argument('--remove-tree', action='store_true',
+                        help="delete the tree afterwards instead of keeping it for the next run")
+    return parser.parse_args()
+
+
+def tree_params(args):
+    return {"files": args.files, "depth": args.depth, "fanout": args.fanout, "seed": args.seed,
+            "skew": args.skew, "unique_ratio": args.unique_ratio, "vocab_size": args.vocab_size,
+            "file_bytes": args.file_bytes}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_phase(name, root, options):
+    # A fresh spawned process per phase: nothing is shared between phases but
+    # the index on disk, and the peak RSS belongs to that phase alone.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(PHASES[name], root, options).result()
+
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(results, baseline, threshold):
+    # Prints every shared metric with its change and returns the regressions.
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    print(f"\n{'metric':<44}{'baseline':>12}{'current':>12}{'change':>10}")
+    for key in sorted(current.keys() & previous.keys()):
+        lower = key.endswith(LOWER_IS_BETTER)
+        if not lower and not key.endswith(HIGHER_IS_BETTER):
+            continue
+        old, new = previous[key], current[key]
+        if not old:
+            continue
+        change = (new - old) / old * 100
+        worse = change > threshold if lower else change < -threshold
+        marker = '  REGRESSION' if worse else ''
+        print(f"{key:<44}{old:>12}{new:>12}{change:>+9.1f}%{marker}")
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def print_summary(results):
+    for phase, metrics in results.items():
+        print(f"\n[{phase}]")
+        for key, value in metrics.items():
+            if isinstance(value, dict):
+                print(f"  {key:<22} p50 {value['p50_ms']:>9} ms  p99 {value['p99_ms']:>9} ms  "
+                      f"results {value['results']}")
+            else:
+                print(f"  {key:<22} {value}")
+
+
+def main():
+    args = parse_args()
+    phases = [phase.strip() for phase in args.phases.split(',') if phase.strip()]
+    unknown = [phase for phase in phases if phase not in PHASES]
+    if unknown:
+        sys.exit(f"Unknown phases: {', '.join(unknown)}")
+
+    params = tree_params(args)
+    key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:10]
+    root = os.path.abspath(args.tree or os.path.join(tempfile.gettempdir(), f'pyindex-bench-{key}'))
+    print(f"Generating tree in {root}...")
+    start = time.perf_counter()
+    stamp = generate_tree(root, **params)
+    print(f"Tree ready in {time.perf_counter() - start:.1f}s: {stamp['created']} files in {stamp['dirs']} directories.")
+
+    options = {**params, "repeat": args.repeat, "churn_dirs": args.churn_dirs, "churn_files": args.churn_files}
+    index_dir = tempfile.mkdtemp(prefix='pyindex-bench-index-')
+    # Read by utlis.config in every phase process, so the real index is never
+    # touched.
+    os.environ['PYINDEX_INDEX_DIR'] = index_dir
+    results = {}
+    try:
+        if phases and phases[0] != 'index':
+            # Every other phase reads the index, which starts out empty, so it
+            # is built first without being reported.
+            print("Building the index for the selected phases...")
+            run_phase('index', root, options)
+        for phase in phases:
+            print(f"Running {phase}...")
+            results[phase] = run_phase(phase, root, options)
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+        if args.remove_tree:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "tree": {**params, "dirs": stamp["dirs"]},
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    print_summary(results)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.out}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("tree") != report["meta"]["tree"]:
+            print("\nWarning: the baseline was measured on a different tree.")
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.threshold:g}%.")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import json
+import os
+import random
+import shutil
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'ba', 'de', 'fi', 'go', 'hu', 'ja', 'pe',
+             'qui', 'ro', 'su', 'ta', 'un', 'ver', 'wa', 'xo', 'yu', 'zor', 'an', 'el', 'is', 'or')
+EXTENSIONS = (('.txt', 20), ('.log', 10), ('.py', 12), ('.js', 10), ('.json', 8), ('.md', 5), ('.jpg', 10),
+              ('.png', 8), ('.pdf', 4), ('.csv', 4), ('.tar.gz', 2), ('', 3))
+STAMP = '.bench_tree.json'
+
+
+def vocabulary(seed, size):
+    # Deterministic pseudo-words, so the runner can derive its queries from
+    # the same list the tree was generated from.
+    rnd = random.Random(seed)
+    words = []
+    seen = set()
+    while len(words) < size:
+        word = ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def zipf_weights(count, skew):
+    # Cumulative weights where rank r is picked with probability ~ 1 / r^skew.
+    total = 0.0
+    weights = []
+    for rank in range(1, count + 1):
+        total += 1 / rank ** skew
+        weights.append(total)
+    return weights
+
+
+def dir_layout(depth, fanout):
+    # Relative directory paths of a full tree, parents before children.
+    dirs = ['']
+    level = ['']
+    for _ in range(depth):
+        level = [os.path.join(parent, f'd{i}') for parent in level for i in range(fanout)]
+        dirs.extend(level)
+    return dirs
+
+
+def write_stamp(path, stamp):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(stamp, f)
+
+
+def generate_tree(root, files, depth=4, fanout=8, seed=0, skew=1.1, unique_ratio=0.3, vocab_size=5000,
+                  file_bytes=0):
+    # Builds (or reuses) a tree of empty files under root. Names are drawn from
+    # a Zipf-distributed vocabulary with a share of unique names, so both very
+    # common and very rare names exist. Returns the parameters and counts.
+    params = {"files": files, "depth": depth, "fanout": fanout, "seed": seed, "skew": skew,
+              "unique_ratio": unique_ratio, "vocab_size": vocab_size, "file_bytes": file_bytes}
+    stamp_path = os.path.join(root, STAMP)
+    try:
+        with open(stamp_path, encoding='utf-8') as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        stamp = None
+    if stamp is not None:
+        if stamp.get("params") == params and stamp.get("complete"):
+            return stamp
+        # Generated with other parameters, or interrupted.
+        shutil.rmtree(root)
+    elif os.path.isdir(root) and os.listdir(root):
+        raise ValueError(f"{root} is not empty and was not generated by the benchmark")
+    os.makedirs(root, exist_ok=True)
+    write_stamp(stamp_path, {"params": params, "complete": False})
+
+    rnd = random.Random(seed)
+    words = vocabulary(seed, vocab_size)
+    word_weights = zipf_weights(len(words), skew)
+    extensions = [ext for ext, _ in EXTENSIONS]
+    ext_weights = []
+    total = 0
+    for _, weight in EXTENSIONS:
+        total += weight
+        ext_weights.append(total)
+
+    dirs = dir_layout(depth, fanout)
+    payload = b'x' * file_bytes
+    created = 0
+    unique = 0
+    for i, rel_dir in enumerate(dirs):
+        dir_path = os.path.join(root, rel_dir)
+        os.makedirs(dir_path, exist_ok=True)
+        count = files // len(dirs) + (1 if i < files % len(dirs) else 0)
+        names = set()
+        while len(names) < count:
+            if rnd.random() < unique_ratio:
+                stem = f'{rnd.choice(words)}_{unique}'
+                unique += 1
+            else:
+                stem = rnd.choices(words, cum_weights=word_weights)[0]
+            name = stem + rnd.choices(extensions, cum_weights=ext_weights)[0]
+            if name in names:
+                name = f'{stem}_{len(names)}{os.path.splitext(name)[1]}'
+            names.add(name)
+        for name in names:
+            with open(os.path.join(dir_path, name), 'wb') as f:
+                if payload:
+                    f.write(payload)
+            created += 1
+
+    stamp = {"params": params, "complete": True, "dirs": len(dirs), "created": created}
+    write_stamp(stamp_path, stamp)
+    return stamp
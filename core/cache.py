@@ -0,0 +1,125 @@
+import os
+from collections import OrderedDict
+from core.store import StoreListener
+
+# Rough per-result overhead on top of the path text itself.
+RESULT_OVERHEAD = 64
+# Past this many queued changes, checking every entry against each of them
+# costs more than recomputing the queries, so everything is dropped.
+MAX_PENDING = 4096
+
+
+class CacheFeed(StoreListener):
+    # Listens to one store and queues its changes on the shared cache.
+    def __init__(self, cache, store):
+        self.cache = cache
+        self.store = store
+
+    def clear(self):
+        self.cache.invalidate_all()
+
+    def rebuild(self):
+        self.cache.invalidate_all()
+
+    def files_added(self, file_ids):
+        if self.cache.entries:
+            for file_id in file_ids:
+                self.file_removed(file_id)
+
+    def file_removed(self, file_id):
+        if self.cache.entries:
+            self.cache.queue(self.store, True, self.store.file_dir[file_id], self.store.file_name[file_id])
+
+    def folder_added(self, dir_id):
+        if self.cache.entries:
+            self.cache.queue(self.store, False, dir_id, self.store.dir_name[dir_id])
+
+    def folder_removed(self, dir_id):
+        self.folder_added(dir_id)
+
+
+class QueryCache:
+    # LRU cache of result pages, keyed by query and mode. Every entry carries
+    # a predicate telling whether a given file or folder could appear in its
+    # results; store changes are queued by a feed per store and checked
+    # against those predicates on the next lookup, so only entries that could
+    # have changed are dropped.
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.entries = OrderedDict()
+        self.size = 0
+        self._pending = []
+
+    def feed(self, store):
+        return CacheFeed(self, store)
+
+    def queue(self, store, is_file, dir_id, name_id):
+        self._pending.append((store, is_file, dir_id, name_id))
+        if len(self._pending) > MAX_PENDING:
+            self.invalidate_all()
+
+    def invalidate_all(self):
+        self.invalidations += len(self.entries)
+        self.entries = OrderedDict()
+        self.size = 0
+        self._pending = []
+
+    def _apply_pending(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        for store, is_file, dir_id, name_id in pending:
+            if not self.entries:
+                break
+            name = store.names[name_id]
+            path = store.dir_path(dir_id)
+            if is_file:
+                path = os.path.join(path, name)
+            stale = [key for key, (_, predicate, _) in self.entries.items() if predicate(is_file, name, path)]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
+
+    def _drop(self, key):
+        _, _, size = self.entries.pop(key)
+        self.size -= size
+
+    def get(self, key):
+        self._apply_pending()
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, results, predicate):
+        self._apply_pending()
+        size = sum(len(path) + RESULT_OVERHEAD for path in results)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (results, predicate, size)
+        self.size += size
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
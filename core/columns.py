@@ -0,0 +1,78 @@
+import operator
+from core.store import NO_ID
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# A condition is (column, op, value); '&' keeps rows with any of the value's
+# bits set and '!&' rows with none of them.
+OPS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '=': operator.eq,
+    '&': lambda a, b: a & b != 0,
+    '!&': lambda a, b: a & b == 0,
+}
+
+
+def _numpy_check(values, op, value):
+    if op == '&':
+        return values & value != 0
+    if op == '!&':
+        return values & value == 0
+    return OPS[op](values, value)
+
+
+def _select_numpy(store, conditions, candidates):
+    views = []
+
+    def column(name):
+        # Views of the store's own arrays. They pin the arrays' buffers, so
+        # they are dropped before returning.
+        values = getattr(store, name)
+        view = numpy.frombuffer(values, dtype=values.typecode)
+        views.append(view)
+        return view
+
+    try:
+        if candidates is None:
+            mask = column('file_name') != NO_ID
+            for name, op, value in conditions:
+                mask &= _numpy_check(column(name), op, value)
+            return numpy.flatnonzero(mask).tolist()
+        ids = numpy.fromiter(candidates, dtype=numpy.int64)
+        ids.sort()
+        ids = ids[column('file_name')[ids] != NO_ID]
+        for name, op, value in conditions:
+            ids = ids[_numpy_check(column(name)[ids], op, value)]
+        return ids.tolist()
+    finally:
+        views.clear()
+
+
+def select_files(store, conditions, candidates=None):
+    # Sorted ids of live files passing every condition. Whole columns are
+    # compared at once with numpy when it is installed; otherwise each
+    # condition only looks at the rows the previous ones kept.
+    if numpy is not None:
+        return _select_numpy(store, conditions, candidates)
+    file_name = store.file_name
+    if candidates is not None:
+        ids = sorted(file_id for file_id in candidates if file_name[file_id] != NO_ID)
+    elif conditions:
+        # The first condition shares the pass over every row.
+        (name, op, value), conditions = conditions[0], conditions[1:]
+        check = OPS[op]
+        ids = [file_id for file_id, (name_id, row) in enumerate(zip(file_name, getattr(store, name)))
+               if name_id != NO_ID and check(row, value)]
+    else:
+        ids = [file_id for file_id, name_id in enumerate(file_name) if name_id != NO_ID]
+    for name, op, value in conditions:
+        values = getattr(store, name)
+        check = OPS[op]
+        ids = [file_id for file_id in ids if check(values[file_id], value)]
+    return ids
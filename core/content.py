@@ -0,0 +1,312 @@
+import codecs
+import json
+import multiprocessing
+import os
+import re
+import zlib
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import accumulate
+from core.segment import ENCODING, StringTable, open_segment, pack_strings, write_sections
+from core.store import NO_ID, StoreListener
+
+CONTENT_MAGIC = b'PYIDXCNT'
+CONTENT_VERSION = 1
+TOKEN = re.compile(r'\w{2,64}')
+# Binary files almost always hold a NUL byte near the start.
+SNIFF_BYTES = 8192
+# Posting lists longer than this are zlib-compressed; shorter ones are
+# smaller stored raw.
+COMPRESS_MIN_IDS = 16
+BATCH_FILES = 64
+
+
+def decode_text(data):
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return data.decode('utf-16', 'replace')
+    if b'\0' in data[:SNIFF_BYTES]:
+        return None
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+def read_tokens(path, max_bytes):
+    # Returns (mtime, size, sorted unique tokens), or None if the file cannot
+    # be read. Oversized and binary files are recorded with no tokens so they
+    # are not read again until they change.
+    try:
+        stat = os.stat(path)
+        if stat.st_size > max_bytes:
+            return stat.st_mtime_ns, stat.st_size, []
+        with open(path, 'rb') as f:
+            data = f.read(max_bytes)
+    except OSError:
+        return None
+    text = decode_text(data)
+    tokens = [] if text is None else sorted(set(tokenize(text)))
+    return stat.st_mtime_ns, stat.st_size, tokens
+
+
+def tokenize_batch(batch, max_bytes):
+    return [(file_id, read_tokens(path, max_bytes)) for file_id, path in batch]
+
+
+def stat_batch(batch):
+    results = []
+    for file_id, path in batch:
+        try:
+            stat = os.stat(path)
+            results.append((file_id, (stat.st_mtime_ns, stat.st_size)))
+        except OSError:
+            results.append((file_id, None))
+    return results
+
+
+def encode_ids(ids):
+    # Sorted ids as int32 deltas, compressed once the list is long enough.
+    deltas = array('i', [ids[0]])
+    deltas.extend(b - a for a, b in zip(ids, ids[1:]))
+    data = deltas.tobytes()
+    if len(ids) > COMPRESS_MIN_IDS:
+        return b'\1' + zlib.compress(data, 1)
+    return b'\0' + data
+
+
+def decode_ids(blob):
+    data = zlib.decompress(blob[1:]) if blob[0] == 1 else blob[1:]
+    deltas = array('i')
+    deltas.frombytes(data)
+    return accumulate(deltas)
+
+
+class ContentIndex(StoreListener):
+    # Inverted index from word tokens to file ids. The saved part lives in its
+    # own file as sorted tokens with compressed posting lists, so a lookup is a
+    # bisect and one decode. Files tokenized since the last save sit in an
+    # in-memory overlay; ids whose saved postings went stale are masked out
+    # until the next save folds everything back together.
+    def __init__(self, store, path, enabled, max_bytes, workers, skip_extensions):
+        self.store = store
+        self.path = path
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.skip_extensions = skip_extensions
+        self.clear()
+
+    def clear(self):
+        self.tokens = StringTable()
+        self.offsets = array('q', [0])
+        self.blob = b''
+        self.overlay = {}
+        self.overlay_files = {}
+        self.replaced = set()
+        self.file_state = {}
+        self.pending = set()
+        # Nothing in memory matches the saved file any more.
+        self.dirty = True
+
+    def copy_from(self, other):
+        # The saved part is never changed in place, only replaced, so the
+        # copy shares it.
+        self.tokens, self.offsets, self.blob = other.tokens, other.offsets, other.blob
+        self.overlay = {token: set(ids) for token, ids in other.overlay.items()}
+        self.overlay_files = dict(other.overlay_files)
+        self.replaced = set(other.replaced)
+        self.file_state = dict(other.file_state)
+        self.pending = set(other.pending)
+        self.dirty = other.dirty
+
+    def queue_all(self):
+        self.pending.update(self.store.iter_files())
+
+    def files_added(self, file_ids):
+        if self.enabled:
+            self.pending.update(file_ids)
+
+    def file_removed(self, file_id):
+        self.pending.discard(file_id)
+        if file_id in self.file_state:
+            del self.file_state[file_id]
+            self._forget(file_id)
+
+    def _forget(self, file_id):
+        self.replaced.add(file_id)
+        for token in self.overlay_files.pop(file_id, ()):
+            ids = self.overlay[token]
+            ids.discard(file_id)
+            if not ids:
+                del self.overlay[token]
+        self.dirty = True
+
+    def _wanted(self, file_id):
+        name = self.store.names[self.store.file_name[file_id]]
+        dot = name.rfind('.')
+        return dot < 0 or name[dot:].lower() not in self.skip_extensions
+
+    def update(self, check_existing=True, lock=nullcontext()):
+        # Tokenizes new files and, when check_existing is set, every indexed
+        # file whose size or mtime changed. Returns the number of files read.
+        # Files are read without `lock`; it is held while each batch is
+        # applied.
+        store = self.store
+        todo = {file_id for file_id in self.pending if store.file_name[file_id] != NO_ID and self._wanted(file_id)}
+        self.pending = set()
+        if check_existing and self.file_state:
+            known = [(file_id, store.file_path(file_id)) for file_id in self.file_state]
+            chunks = [known[i:i + 1024] for i in range(0, len(known), 1024)]
+            with ThreadPoolExecutor(max_workers=self.workers * 4) as executor:
+                for results in executor.map(stat_batch, chunks):
+                    for file_id, state in results:
+                        if state != self.file_state[file_id]:
+                            todo.add(file_id)
+        if not todo:
+            return 0
+        batches = []
+        batch = []
+        for file_id in sorted(todo):
+            batch.append((file_id, store.file_path(file_id)))
+            if len(batch) == BATCH_FILES:
+                batches.append(batch)
+                batch = []
+        if batch:
+            batches.append(batch)
+        if len(batches) == 1 or self.workers < 2:
+            # Not worth starting worker processes for.
+            for batch in batches:
+                self._apply_batch(tokenize_batch(batch, self.max_bytes), lock)
+            return len(todo)
+        # Spawned, not forked, for the same reason as the query workers.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            for results in executor.map(tokenize_batch, batches, [self.max_bytes] * len(batches)):
+                self._apply_batch(results, lock)
+        return len(todo)
+
+    def _apply_batch(self, results, lock):
+        with lock:
+            for file_id, result in results:
+                self._apply(file_id, result)
+
+    def _apply(self, file_id, result):
+        if file_id in self.file_state:
+            del self.file_state[file_id]
+            self._forget(file_id)
+        if result is None:
+            return
+        mtime, size, tokens = result
+        self.file_state[file_id] = (mtime, size)
+        self.overlay_files[file_id] = tokens
+        for token in tokens:
+            self.overlay.setdefault(token, set()).add(file_id)
+        self.dirty = True
+
+    def _saved_ids(self, i):
+        ids = decode_ids(self.blob[self.offsets[i]:self.offsets[i + 1]])
+        if not self.replaced:
+            return ids
+        replaced = self.replaced
+        return (file_id for file_id in ids if file_id not in replaced)
+
+    def _token_range(self, token, prefix):
+        tokens = self.tokens
+        start = bisect_left(tokens, token)
+        if not prefix:
+            end = start + 1 if start < len(tokens) and tokens[start] == token else start
+        else:
+            end = start
+            while end < len(tokens) and tokens[end].startswith(token):
+                end += 1
+        return range(start, end)
+
+    def lookup(self, token, prefix=False):
+        # File ids containing the token, or any token starting with it.
+        file_ids = set()
+        for i in self._token_range(token, prefix):
+            file_ids.update(self._saved_ids(i))
+        if prefix:
+            for overlay_token, ids in self.overlay.items():
+                if overlay_token.startswith(token):
+                    file_ids |= ids
+        else:
+            file_ids |= self.overlay.get(token, set())
+        return file_ids
+
+    def merged_postings(self):
+        postings = {token: list(ids) for token, ids in self.overlay.items()}
+        for i, token in enumerate(self.tokens):
+            ids = self._saved_ids(i)
+            if token in postings:
+                postings[token].extend(ids)
+            else:
+                postings[token] = list(ids)
+        return postings
+
+    def save(self):
+        if not self.dirty:
+            return
+        postings = self.merged_postings()
+        tokens = sorted(token for token, ids in postings.items() if ids)
+        blob = bytearray()
+        offsets = array('q', [0])
+        for token in tokens:
+            blob += encode_ids(sorted(postings[token]))
+            offsets.append(len(blob))
+        tokens_blob, tokens_offsets = pack_strings(tokens)
+        file_ids = array('i', self.file_state)
+        mtimes = array('q', (state[0] for state in self.file_state.values()))
+        sizes = array('q', (state[1] for state in self.file_state.values()))
+        meta = {"files": len(self.file_state), "tokens": len(tokens)}
+        write_sections(self.path, [
+            ('tokens_blob', tokens_blob),
+            ('tokens_offsets', tokens_offsets),
+            ('postings_blob', bytes(blob)),
+            ('postings_offsets', offsets),
+            ('file_ids', file_ids),
+            ('file_mtimes', mtimes),
+            ('file_sizes', sizes),
+            ('meta', json.dumps(meta).encode(ENCODING)),
+        ], magic=CONTENT_MAGIC, version=CONTENT_VERSION)
+        self.tokens = StringTable(tokens_blob, tokens_offsets)
+        self.offsets = offsets
+        self.blob = bytes(blob)
+        self.overlay = {}
+        self.overlay_files = {}
+        self.replaced = set()
+        self.dirty = False
+
+    def load(self):
+        self.clear()
+        if not os.path.exists(self.path):
+            return False
+        buffer, sections, swap = open_segment(self.path, CONTENT_MAGIC, CONTENT_VERSION)
+        try:
+            def raw(name):
+                _, offset, length = sections[name]
+                return buffer[offset:offset + length]
+
+            def load_array(name):
+                values = array(sections[name][0])
+                values.frombytes(raw(name))
+                if swap:
+                    values.byteswap()
+                return values
+
+            # Copied out of the mapping so the file can be replaced on save.
+            self.tokens = StringTable(raw('tokens_blob'), load_array('tokens_offsets'))
+            self.offsets = load_array('postings_offsets')
+            self.blob = raw('postings_blob')
+            mtimes, sizes = load_array('file_mtimes'), load_array('file_sizes')
+            self.file_state = {file_id: (mtimes[i], sizes[i]) for i, file_id in enumerate(load_array('file_ids'))}
+        finally:
+            buffer.close()
+        self.dirty = False
+        return True
@@ -0,0 +1,160 @@
+import json
+import os
+from core.segment import ENCODING, ERRORS, sync_dir
+from core.store import NO_ID, StoreListener
+
+# Past this many buffered changes a full rewrite of the base is cheaper than
+# the log, so recording stops until the next one.
+MAX_PENDING = 100_000
+
+
+class DeltaLog(StoreListener):
+    # Append-only record of the store changes made since the base segment was
+    # written, one JSON line per change. The first line names the base it
+    # belongs to, so a log left over from an older base is never replayed.
+    # Changes are buffered in memory and appended by flush(); a torn last line
+    # from a crash is cut off on the next load.
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+        self.token = None
+        self.size = 0
+        self.records = []
+
+    def clear(self):
+        # Memory no longer derives from the saved base.
+        self.token = None
+        self.records = []
+
+    def copy_from(self, other):
+        # Continues another store's log, changes not yet flushed included.
+        self.token = other.token
+        self.size = other.size
+        self.records = list(other.records)
+
+    @property
+    def active(self):
+        return self.token is not None
+
+    def _record(self, *record):
+        if self.token is not None:
+            self.records.append(record)
+            if len(self.records) > MAX_PENDING:
+                self.clear()
+
+    def files_added(self, file_ids):
+        if self.token is None or not file_ids:
+            return
+        store = self.store
+        names = store.names
+        self._record('F', store.dir_path(store.file_dir[file_ids[0]]),
+                     [(names[store.file_name[file_id]], store.file_size[file_id], store.file_mtime[file_id],
+                       store.file_kind[file_id]) for file_id in file_ids])
+
+    def file_removed(self, file_id):
+        if self.token is not None:
+            store = self.store
+            self._record('R', store.dir_path(store.file_dir[file_id]), store.names[store.file_name[file_id]])
+
+    def folder_added(self, dir_id):
+        if self.token is not None:
+            self._record('D', self.store.dir_path(dir_id))
+
+    def folder_removed(self, dir_id):
+        if self.token is not None:
+            self._record('X', self.store.dir_path(dir_id))
+
+    def dir_scanned(self, dir_id):
+        if self.token is not None:
+            self._record('M', self.store.dir_path(dir_id), self.store.dir_mtime[dir_id])
+
+    def file_stat_changed(self, file_id):
+        if self.token is not None:
+            store = self.store
+            self._record('S', store.dir_path(store.file_dir[file_id]), store.names[store.file_name[file_id]],
+                         store.file_size[file_id], store.file_mtime[file_id], store.file_kind[file_id])
+
+    def reset(self, token):
+        # Called right after a new base was written: starts an empty log for it.
+        data = (json.dumps({"base": token}) + '\n').encode(ENCODING, ERRORS)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        sync_dir(self.path)
+        self.token = token
+        self.size = len(data)
+        self.records = []
+
+    def flush(self):
+        # Appends the buffered changes and syncs them to disk. Returns the
+        # number of changes written.
+        if self.token is None or not self.records:
+            return 0
+        data = b''.join((json.dumps(record) + '\n').encode(ENCODING, ERRORS) for record in self.records)
+        with open(self.path, 'r+b') as f:
+            # Anything past the last complete line is a torn write.
+            f.seek(self.size)
+            f.truncate()
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.size += len(data)
+        written = len(self.records)
+        self.records = []
+        return written
+
+    def replay(self, token):
+        # Applies the log on top of a freshly loaded base whose token is given.
+        # Returns the number of changes applied, or None when the log is
+        # missing or belongs to another base.
+        self.token = None
+        if token is None or not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        lines = data.split(b'\n')
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return None
+        if header.get("base") != token:
+            return None
+        size = len(lines[0]) + 1
+        applied = 0
+        # The last element is empty, or a line the crash cut short.
+        for line in lines[1:-1]:
+            try:
+                self.apply(json.loads(line))
+            except (ValueError, TypeError, IndexError):
+                break
+            size += len(line) + 1
+            applied += 1
+        self.token = token
+        self.size = size
+        self.records = []
+        return applied
+
+    def apply(self, record):
+        store = self.store
+        op, path = record[0], record[1]
+        if op == 'F':
+            store.add_files(path, [entry[0] for entry in record[2]], [entry[1:] for entry in record[2]])
+        elif op == 'D':
+            store.add_folder(path)
+        elif op == 'M':
+            store.set_dir_mtime(store.intern_dir(path), record[2])
+        elif op in ('R', 'S'):
+            file_id = store.find_file(os.path.join(path, record[2]))
+            if file_id == NO_ID:
+                return
+            if op == 'R':
+                store.remove_file(file_id)
+            else:
+                store.set_file_stat(file_id, *record[3:])
+        elif op == 'X':
+            dir_id = store.find_dir(path)
+            if dir_id != NO_ID:
+                store.remove_folder(dir_id)
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import mmap
+import os
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from core.segment import ENCODING, StringTable, open_segment, pack_strings, write_sections
+from core.store import NO_ID
+
+HASH_MAGIC = b'PYIDXHSH'
+HASH_VERSION = 1
+DIGEST_SIZE = 16
+# Full hashes are fed to the hash in slices of the mapping; hashlib drops the
+# GIL for each one, so the pool's threads hash in parallel.
+HASH_CHUNK = 1024 * 1024
+
+
+def new_hash():
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+def partial_hash(path, size, block):
+    # First and last block. Files no larger than two blocks are read whole,
+    # which makes this their full hash as well.
+    digest = new_hash()
+    with open(path, 'rb') as f:
+        if size <= 2 * block:
+            digest.update(f.read())
+        else:
+            digest.update(f.read(block))
+            f.seek(-block, os.SEEK_END)
+            digest.update(f.read(block))
+    return digest.digest()
+
+
+def full_hash(path):
+    digest = new_hash()
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for start in range(0, len(mapped), HASH_CHUNK):
+                    digest.update(view[start:start + HASH_CHUNK])
+            finally:
+                view.release()
+    return digest.digest()
+
+
+def stat_file(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+class HashCache:
+    # Partial and full content hashes keyed by path, valid only while the
+    # file's size and mtime are unchanged. Kept in its own segment file next
+    # to the index; each run of the duplicate finder drops what it no longer
+    # needed.
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.loaded = False
+        self.dirty = False
+
+    def clear(self):
+        self.entries = {}
+        self.dirty = True
+
+    def get(self, path, size, mtime):
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != size or entry[1] != mtime:
+            return None, None
+        return entry[2], entry[3]
+
+    def put(self, path, size, mtime, partial, full=None):
+        entry = self.entries.get(path)
+        if entry is not None and entry[:3] == (size, mtime, partial) and entry[3] is not None and full is None:
+            full = entry[3]
+        self.entries[path] = (size, mtime, partial, full)
+        self.dirty = True
+
+    def keep(self, paths, min_size):
+        # Drops entries a run over files of at least min_size did not use.
+        stale = [path for path, entry in self.entries.items() if entry[0] >= min_size and path not in paths]
+        for path in stale:
+            del self.entries[path]
+        if stale:
+            self.dirty = True
+
+    def load(self):
+        self.loaded = True
+        self.entries = {}
+        if not os.path.exists(self.path):
+            return False
+        buffer, sections, swap = open_segment(self.path, HASH_MAGIC, HASH_VERSION)
+        try:
+            def raw(name):
+                _, offset, length = sections[name]
+                return buffer[offset:offset + length]
+
+            def load_array(name):
+                values = array(sections[name][0])
+                values.frombytes(raw(name))
+                if swap:
+                    values.byteswap()
+                return values
+
+            paths = StringTable(raw('paths_blob'), load_array('paths_offsets'))
+            sizes, mtimes = load_array('sizes'), load_array('mtimes')
+            partials, fulls, has_full = raw('partials'), raw('fulls'), raw('has_full')
+        finally:
+            buffer.close()
+        for i, path in enumerate(paths):
+            start = i * DIGEST_SIZE
+            full = fulls[start:start + DIGEST_SIZE] if has_full[i] else None
+            self.entries[path] = (sizes[i], mtimes[i], partials[start:start + DIGEST_SIZE], full)
+        self.dirty = False
+        return True
+
+    def save(self):
+        if not self.dirty:
+            return
+        paths = list(self.entries)
+        entries = [self.entries[path] for path in paths]
+        paths_blob, paths_offsets = pack_strings(paths)
+        empty = bytes(DIGEST_SIZE)
+        write_sections(self.path, [
+            ('paths_blob', paths_blob),
+            ('paths_offsets', paths_offsets),
+            ('sizes', array('q', (entry[0] for entry in entries))),
+            ('mtimes', array('q', (entry[1] for entry in entries))),
+            ('partials', b''.join(entry[2] for entry in entries)),
+            ('fulls', b''.join(entry[3] or empty for entry in entries)),
+            ('has_full', bytes(entry[3] is not None for entry in entries)),
+            ('meta', json.dumps({"entries": len(paths)}).encode(ENCODING)),
+        ], magic=HASH_MAGIC, version=HASH_VERSION)
+        self.dirty = False
+
+
+def _groups(keyed):
+    # keyed: iterable of (key, item). Returns the lists holding two or more.
+    groups = {}
+    for key, item in keyed:
+        groups.setdefault(key, []).append(item)
+    return [items for items in groups.values() if len(items) > 1]
+
+
+def find_duplicates(stores, cache, workers, block, min_size=1, prune=True):
+    # Returns (size, paths) groups of identical files across the given stores,
+    # largest waste first, plus counters for each stage. Sizes come from the
+    # scan, so only files sharing a size are ever opened; of those, only the
+    # ones whose first and last blocks also agree are read in full. Without
+    # prune the cache keeps entries this run did not look at.
+    if not cache.loaded:
+        try:
+            cache.load()
+        except (ValueError, KeyError, OSError) as e:
+            print(f"Hash cache could not be read ({e}); starting a new one.")
+            cache.clear()
+    stats = {"files": sum(store.file_count for store in stores), "size_candidates": 0, "partial_hashed": 0,
+             "full_candidates": 0, "full_hashed": 0, "cache_hits": 0}
+
+    def live_ids(store):
+        return (file_id for file_id, name_id in enumerate(store.file_name) if name_id != NO_ID)
+
+    def path_of(entry):
+        return entry[0].file_path(entry[1])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        unknown = [(store, file_id) for store in stores for file_id in live_ids(store)
+                   if store.file_size[file_id] == NO_ID]
+        if unknown:
+            # Files from an index that predates the size column.
+            for (store, file_id), result in zip(unknown, executor.map(stat_file, map(path_of, unknown))):
+                if result is not None:
+                    store.set_file_stat(file_id, *result)
+
+        by_size = _groups((store.file_size[file_id], (store, file_id))
+                          for store in stores for file_id in live_ids(store)
+                          if store.file_size[file_id] >= min_size)
+        candidates = [entry for group in by_size for entry in group]
+        stats["size_candidates"] = len(candidates)
+
+        # Sizes may be as old as the last scan; the fresh stat also gives the
+        # cache key.
+        paths = [path_of(entry) for entry in candidates]
+        current = []
+        for (store, file_id), path, result in zip(candidates, paths, executor.map(stat_file, paths)):
+            if result is not None and result[0] >= min_size:
+                store.set_file_stat(file_id, *result)
+                current.append((path, result[0], result[1]))
+
+        def partial(entry):
+            path, size, mtime = entry
+            cached, _ = cache.get(path, size, mtime)
+            if cached is not None:
+                return cached, True
+            try:
+                return partial_hash(path, size, block), False
+            except OSError:
+                return None, False
+
+        same_size = [entry for group in _groups((entry[1], entry) for entry in current) for entry in group]
+        partials = []
+        for entry, (digest, hit) in zip(same_size, executor.map(partial, same_size)):
+            if digest is None:
+                continue
+            if hit:
+                stats["cache_hits"] += 1
+            else:
+                stats["partial_hashed"] += 1
+                cache.put(*entry, digest)
+            partials.append((entry, digest))
+
+        def full(entry):
+            path, size, mtime = entry
+            digest, cached = cache.get(path, size, mtime)
+            if size <= 2 * block:
+                return digest, True
+            if cached is not None:
+                return cached, True
+            try:
+                return full_hash(path), False
+            except (OSError, ValueError):
+                return None, False
+
+        survivors = [entry for group in _groups(((entry[1], digest), entry) for entry, digest in partials)
+                     for entry in group]
+        stats["full_candidates"] = len(survivors)
+        fulls = []
+        for entry, (digest, hit) in zip(survivors, executor.map(full, survivors)):
+            if digest is None:
+                continue
+            if not hit:
+                stats["full_hashed"] += 1
+                cache.put(*entry, cache.get(*entry)[0], digest)
+            fulls.append(((entry[1], digest), entry))
+
+    if prune:
+        cache.keep({entry[0] for entry, _ in partials}, min_size)
+    groups = [(group[0][1], sorted(entry[0] for entry in group)) for group in _groups(fulls)]
+    groups.sort(key=lambda group: (-group[0] * (len(group[1]) - 1), group[1][0]))
+    return groups, stats
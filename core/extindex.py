@@ -0,0 +1,47 @@
+from core.store import StoreListener
+
+
+def extension_key(text):
+    dot = text.rfind('.')
+    if dot < 0:
+        return None
+    return text[dot:].lower()
+
+
+class ExtensionIndex(StoreListener):
+    # Maps the last extension of every name to the ids of names carrying it.
+    # Like the trigram postings, the lists only grow and stay sorted.
+    def __init__(self, store):
+        self.store = store
+        self.clear()
+
+    def clear(self):
+        self.postings = {}
+
+    def name_added(self, name_id, name):
+        key = extension_key(name)
+        if key is not None:
+            self.postings.setdefault(key, []).append(name_id)
+
+    def rebuild(self):
+        self.clear()
+        for name_id, name in enumerate(self.store.names):
+            self.name_added(name_id, name)
+
+    def match(self, ext_lower):
+        key = extension_key(ext_lower)
+        candidates = self.postings.get(key, ())
+        if key == ext_lower:
+            return list(candidates)
+        # Multi-part extensions such as .tar.gz are looked up by their last part.
+        names = self.store.names
+        return [name_id for name_id in candidates if names[name_id].lower().endswith(ext_lower)]
+
+    def posting_lists(self):
+        return {"ext": self.postings}
+
+    def load_posting_lists(self, postings):
+        if "ext" not in postings:
+            return False
+        self.postings = postings["ext"]
+        return True
@@ -0,0 +1,96 @@
+from bisect import bisect_left
+from core.store import StoreListener
+
+# Past this many queued folder changes a full re-sort is cheaper than
+# inserting them one by one.
+MAX_PENDING = 4096
+
+
+def folder_key(path):
+    return path.lower().replace('\\', '/')
+
+
+def subtree_bounds(key):
+    # '/' sorts directly before '0', so every path under key + '/' lies in
+    # [key + '/', key + '0').
+    return key + '/', key + '0'
+
+
+class FolderPathIndex(StoreListener):
+    # Normalised folder paths in sorted order, so the folders below any folder
+    # form one contiguous range found with two bisects. Built on first use and
+    # then patched in place as folders come and go.
+    def __init__(self, store):
+        self.store = store
+        self.clear()
+
+    def clear(self):
+        self.keys = []
+        self.ids = []
+        self._pending = []
+        self._stale = True
+
+    def folder_added(self, dir_id):
+        self._queue(dir_id)
+
+    def folder_removed(self, dir_id):
+        self._queue(dir_id)
+
+    def rebuild(self):
+        self._stale = True
+
+    def _queue(self, dir_id):
+        if self._stale:
+            return
+        self._pending.append(dir_id)
+        if len(self._pending) > MAX_PENDING:
+            self._stale = True
+            self._pending = []
+
+    def refresh(self):
+        store = self.store
+        if self._stale:
+            dir_paths = store.all_dir_paths()
+            entries = sorted((folder_key(dir_paths[dir_id]), dir_id) for dir_id in store.iter_folders())
+            self.keys = [key for key, _ in entries]
+            self.ids = [dir_id for _, dir_id in entries]
+            self._stale = False
+            self._pending = []
+            return
+        pending, self._pending = self._pending, []
+        keys, ids = self.keys, self.ids
+        for dir_id in pending:
+            key = folder_key(store.dir_path(dir_id))
+            pos = bisect_left(keys, key)
+            # Paths differing only in case share a key, so look for this id
+            # within the run of equal keys.
+            while pos < len(keys) and keys[pos] == key and ids[pos] != dir_id:
+                pos += 1
+            present = pos < len(keys) and keys[pos] == key
+            if store.folder_flags[dir_id] and not present:
+                keys.insert(pos, key)
+                ids.insert(pos, dir_id)
+            elif not store.folder_flags[dir_id] and present:
+                del keys[pos]
+                del ids[pos]
+
+    def subtrees(self, dir_ids):
+        # Ids of every folder strictly below any of the given folders. Subtree
+        # ranges are either nested or disjoint, so merging them deduplicates.
+        self.refresh()
+        keys = self.keys
+        ranges = []
+        for dir_id in dir_ids:
+            low, high = subtree_bounds(folder_key(self.store.dir_path(dir_id)))
+            start, end = bisect_left(keys, low), bisect_left(keys, high)
+            if start < end:
+                ranges.append((start, end))
+        ranges.sort()
+        result = []
+        covered = 0
+        for start, end in ranges:
+            start = max(start, covered)
+            if start < end:
+                result.extend(self.ids[start:end])
+                covered = end
+        return result
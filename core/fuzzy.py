@@ -0,0 +1,165 @@
+from bisect import bisect_left, insort
+from collections import Counter
+from core.store import StoreListener
+from core.trigram import trigrams
+
+# Past this many queued names a full re-sort is cheaper than inserting them
+# one by one.
+MAX_PENDING = 4096
+# Sorts after any character that can follow a prefix in practice.
+PREFIX_END = '\U0010ffff'
+
+
+def fuzzy_key(name):
+    # Names are matched on their lowercase stem, so a typo is not drowned out
+    # by the extension.
+    name = name.lower()
+    dot = name.rfind('.')
+    return name[:dot] if dot > 0 else name
+
+
+def max_distance(query):
+    if len(query) < 12:
+        return 1
+    return 2 if len(query) < 20 else 3
+
+
+def next_row(rows, prefix, char, query, max_dist):
+    # One row of the edit-distance table for prefix + char against the query.
+    # Only cells within max_dist of the diagonal can stay within max_dist, so
+    # the rest are left at max_dist + 1. Adjacent transpositions count as a
+    # single edit.
+    row = rows[-1]
+    before = rows[-2] if len(rows) > 1 else None
+    last = prefix[-1] if prefix else None
+    depth = len(rows)
+    cap = max_dist + 1
+    new = [cap] * len(row)
+    if depth <= max_dist:
+        new[0] = depth
+    for j in range(max(1, depth - max_dist), min(len(query), depth + max_dist) + 1):
+        query_char = query[j - 1]
+        cost = min(new[j - 1] + 1, row[j] + 1, row[j - 1] + (query_char != char))
+        if before is not None and j > 1 and query_char == last and query[j - 2] == char:
+            cost = min(cost, before[j - 2] + 1)
+        new[j] = cost if cost < cap else cap
+    return new
+
+
+def edit_distance(text, query, max_dist):
+    # Distance between text and query, or max_dist + 1 if it is larger.
+    rows = [[min(j, max_dist + 1) for j in range(len(query) + 1)]]
+    for i, char in enumerate(text):
+        rows.append(next_row(rows, text[:i], char, query, max_dist))
+    return rows[-1][-1]
+
+
+class FuzzyIndex(StoreListener):
+    # Sorted unique name stems. A query walks the list as if it were a trie:
+    # consecutive keys reuse the edit-distance rows of their shared prefix, and
+    # once every cell of a row exceeds the allowed distance, all keys starting
+    # with that prefix are skipped with one bisect. Built on first use.
+    # Longer queries are answered from the trigram postings instead: a single
+    # edit touches at most four of the query's trigrams, so a close enough
+    # name still shares the rest.
+    def __init__(self, store, trigram_index):
+        self.store = store
+        self.trigram_index = trigram_index
+        self.clear()
+
+    def clear(self):
+        self.keys = []
+        self.key_names = {}
+        self._pending = []
+        self._stale = True
+
+    def name_added(self, name_id, name):
+        if self._stale:
+            return
+        self._pending.append(name_id)
+        if len(self._pending) > MAX_PENDING:
+            self._stale = True
+            self._pending = []
+
+    def rebuild(self):
+        self._stale = True
+
+    def refresh(self):
+        names = self.store.names
+        if self._stale:
+            self.key_names = {}
+            for name_id, name in enumerate(names):
+                self.key_names.setdefault(fuzzy_key(name), []).append(name_id)
+            self.keys = sorted(self.key_names)
+            self._stale = False
+            self._pending = []
+            return
+        pending, self._pending = self._pending, []
+        for name_id in pending:
+            key = fuzzy_key(names[name_id])
+            if key not in self.key_names:
+                self.key_names[key] = []
+                insort(self.keys, key)
+            self.key_names[key].append(name_id)
+
+    def match(self, query_lower, max_dist=None):
+        # Returns (distance, name id) pairs for every name whose stem is within
+        # max_dist edits of the query's stem.
+        query = fuzzy_key(query_lower)
+        if max_dist is None:
+            max_dist = max_distance(query)
+        grams = trigrams(query)
+        shared = len(grams) - 4 * max_dist
+        if shared > 0:
+            return self._match_grams(query, grams, shared, max_dist)
+        return self._match_walk(query, max_dist)
+
+    def _match_grams(self, query, grams, shared, max_dist):
+        postings = self.trigram_index.name_postings
+        counts = Counter()
+        for gram in grams:
+            counts.update(postings.get(gram, ()))
+        names = self.store.names
+        distances = {}
+        matches = []
+        for name_id, count in counts.items():
+            if count < shared:
+                continue
+            key = fuzzy_key(names[name_id])
+            distance = distances.get(key)
+            if distance is None:
+                distance = distances[key] = edit_distance(key, query, max_dist)
+            if distance <= max_dist:
+                matches.append((distance, name_id))
+        return matches
+
+    def _match_walk(self, query, max_dist):
+        self.refresh()
+        keys = self.keys
+        rows = [[min(j, max_dist + 1) for j in range(len(query) + 1)]]
+        prefix = ''
+        matches = []
+        i = 0
+        while i < len(keys):
+            key = keys[i]
+            common = 0
+            limit = min(len(prefix), len(key))
+            while common < limit and prefix[common] == key[common]:
+                common += 1
+            del rows[common + 1:]
+            prefix = key[:common]
+            pruned = False
+            for char in key[common:]:
+                rows.append(next_row(rows, prefix, char, query, max_dist))
+                prefix += char
+                if min(rows[-1]) > max_dist:
+                    pruned = True
+                    break
+            if pruned:
+                i = bisect_left(keys, prefix + PREFIX_END, i + 1)
+                continue
+            distance = rows[-1][-1]
+            if distance <= max_dist:
+                matches.extend((distance, name_id) for name_id in self.key_names[key])
+            i += 1
+        return matches
@@ -1,185 +1,218 @@
-import json
+import os
+import queue
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from functools import partial
 from pathlib import Path
-from utlis.config import INDEX_FILE, file_index, folder_index, ensure_index_dir
-
-def show_progress(current, total, prefix='Progress', suffix='Complete', length=50):
-    if total == 0:
-        return
-    percent = "{0:.1f}".format(100 * (current / float(total)))
-    filled_length = int(length * current // total)
-    bar = '█' * filled_length + '-' * (length - filled_length)
-    print(f'\r{prefix} |{bar}| {percent}% {suffix} ({current}/{total})', end='\r')
-    if current == total:
-        print()
-
-def scan_directory_chunk(path, skip_dirs=None):
-    if skip_dirs is None:
-        skip_dirs = set()
-
-    files = []
-    folders = []
-    scanned_dirs = []
+from core.jobs import BuildJob, active_job, run_jobs
+from core.scanner import scan_tree
+from utlis.config import SCAN_WORKERS, SCAN_QUEUE_SIZE, INDEX_FLUSH_FILES, metrics
+from utlis.roots import IndexRoot, name_for_path, roots
+from utlis.save import save_data
+
+def save_checkpoint(root, path, complete):
+    root.meta["root"] = path
+    root.meta["complete"] = complete
+    root.meta["scan_timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    # What each exclusion rule kept out of the last full scan.
+    root.meta["excluded"] = dict(root.rules.hits)
+    save_data(root, full=True)
+
+def print_progress(scanned_dirs, file_count):
+    if scanned_dirs % 1000 == 0 and not metrics.quiet:
+        print(f"\rScanned: {scanned_dirs} directories, found {file_count} files...", end='')
+
+def ingest_tree(store, path, checkpoint=None, on_dir=None, progress=print_progress, rules=None, lock=nullcontext()):
+    # Scanner workers hand finished directories to this single writer through
+    # a bounded queue, so nothing accumulates beyond the index itself. The
+    # time the writer spends applying records is the 'merge' phase; `lock`
+    # is held for each record applied, never while scanning.
+    start = time.perf_counter()
+    records = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            errors.extend(scan_tree(path, records.put, rules, stop=stop))
+        finally:
+            records.put(None)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    scanned_dirs = 0
+    scanned_files = 0
+    merging = 0.0
     try:
-        path_obj = Path(path)
-        if not path_obj.exists():
-            return files, folders, scanned_dirs
-
-        print(f"Scanning directory: {path}")
-        scanned_dirs.append(str(path))
-
-        for item in path_obj.iterdir():
-            if item.is_file():
-                name = item.name
-                if not name.startswith('.') and not name.endswith(('android', '.')):
-                    files.append((name, str(item)))
-            elif item.is_dir() and not item.name.startswith('.') and item.name not in skip_dirs:
-                full_path_lower = str(item).lower()
-                if 'appdata' in full_path_lower:
-                    print(f"Skipping AppData directory: {item}")
-                    continue
-                folders.append((item.name, str(item)))
-                sub_files, sub_folders, sub_dirs = scan_directory_chunk(item, skip_dirs)
-                for sub_file in sub_files:
-                    files.append(sub_file)
-                for sub_folder in sub_folders:
-                    folders.append(sub_folder)
-                scanned_dirs.extend(sub_dirs)
-    except (PermissionError, OSError):
-        print(f"Permission denied or error accessing: {path}")
-        pass
-    return files, folders, scanned_dirs
-
-def process_files_batch(files_batch):
-    batch_index = {}
-    for file, file_path in files_batch:
-        if file not in batch_index:
-            batch_index[file] = []
-        batch_index[file].append(file_path)
-    return batch_index
-
-async def index(path):
-    total = 0
+        while True:
+            record = records.get()
+            if record is None:
+                break
+            merge_start = time.perf_counter()
+            dir_path, files, file_stats, subdirs, mtime = record
+            scanned_files += len(files)
+            with lock:
+                dir_id = store.add_files(dir_path, files, file_stats)
+                store.set_dir_mtime(dir_id, mtime)
+                for subdir in subdirs:
+                    store.add_folder(subdir)
+            if on_dir is not None:
+                on_dir(dir_path, mtime)
+            scanned_dirs += 1
+            merging += time.perf_counter() - merge_start
+            progress(scanned_dirs, store.file_count)
+            if checkpoint is not None:
+                checkpoint()
+    finally:
+        stop.set()
+        while producer.is_alive():
+            try:
+                records.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    # One stat per file plus one per directory for its mtime.
+    metrics.add_scan(scanned_dirs, scanned_files, scanned_files + scanned_dirs, len(errors),
+                     time.perf_counter() - start)
+    metrics.add_phase('scan', time.perf_counter() - start)
+    metrics.add_phase('merge', merging)
+    return scanned_dirs, errors
+
+def update_content(root, check_existing=True, log=print):
+    log(f"Indexing file contents of '{root.name}'...")
+    start = time.time()
+    try:
+        with metrics.timer('content'):
+            read = root.content_index.update(check_existing)
+        log(f"Read {read} files for the content index in {time.time() - start:.2f}s.")
+    except Exception as e:
+        log(f"Error while indexing file contents: {e}")
+
+def build_root(root, path, log=print, progress=print_progress, checkpoints=True):
+    # Scans path into the root from scratch and saves it. Returns whether
+    # anything was indexed. Without checkpoints nothing is written before the
+    # scan is complete.
     start = time.time()
-    file_index.clear()
+    store = root.store
+    store.clear()
+    root.meta["root"] = path
+    rules = root.rules
+    rules.reset()
 
-    print("Indexing files...")
+    log(f"Indexing {path} as root '{root.name}'...")
 
     try:
-        path_obj = Path(path)
-        if not path_obj.exists():
-            print(f"Path does not exist: {path}")
-            return file_index
+        log(f"Scanning with {SCAN_WORKERS} workers...")
+        next_flush = [INDEX_FLUSH_FILES]
 
-        subdirs = [path]
-        if path_obj.is_dir():
-            try:
-                for item in path_obj.iterdir():
-                    if item.is_dir() and not item.name.startswith('.'):
-                        subdirs.append(str(item))
-            except (PermissionError, OSError):
-                pass
+        def checkpoint():
+            # Checkpoints double in size so the total flush cost stays linear.
+            if store.file_count >= next_flush[0]:
+                save_checkpoint(root, path, False)
+                next_flush[0] *= 2
+
+        scanned_dirs, errors = ingest_tree(store, path, checkpoint if checkpoints else None, progress=progress,
+                                           rules=rules)
+
+        if errors:
+            log(f"\nPermission denied or error accessing {len(errors)} directories")
+
+        log(f"\nFound {store.file_count} files total in '{root.name}'")
+        log(f"Found {store.folder_count} folders total")
+        log(f"Scanned {scanned_dirs} directories total")
+        if rules.hits:
+            top = ', '.join(f"{label}: {hits}" for label, hits in rules.hits.most_common(5))
+            log(f"Excluded {sum(rules.hits.values())} entries ({top})")
 
-        if len(subdirs) > 8:
-            new_subdirs = []
-            for i in range(8):
-                new_subdirs.append(subdirs[i])
-            subdirs = new_subdirs
-
-        print(f"Scanning {len(subdirs)} directories in parallel...")
-
-        with ThreadPoolExecutor(max_workers=min(6, len(subdirs))) as executor:
-            futures = {}
-            for subdir in subdirs:
-                futures[executor.submit(scan_directory_chunk, subdir)] = subdir
-
-            all_files = []
-            all_folders = []
-            all_scanned_dirs = []
-            completed = 0
-
-            for future in as_completed(futures):
-                subdir = futures[future]
-                try:
-                    files, folders, dirs = future.result()
-                    for file_info in files:
-                        all_files.append(file_info)
-                    for folder_info in folders:
-                        all_folders.append(folder_info)
-                    all_scanned_dirs.extend(dirs)
-                    completed += 1
-                    print(f"\rScanned: {completed}/{len(subdirs)} directories, found {len(all_files)} files...", end='')
-                except Exception as e:
-                    print(f"\nError scanning {subdir}: {e}")
-
-        print(f"\nFound {len(all_files)} files total")
-        print(f"Found {len(all_folders)} folders total")
-        print(f"Scanned {len(all_scanned_dirs)} directories total")
-
-        # Process folders
-        folder_index.clear()
-        for folder_name, folder_path in all_folders:
-            if folder_name not in folder_index:
-                folder_index[folder_name] = []
-            folder_index[folder_name].append(folder_path)
-
-        if not all_files:
-            print("No files found to index.")
-            return file_index
-
-        batch_size = 1000
-        batches = []
-        for i in range(0, len(all_files), batch_size):
-            batch = []
-            for j in range(i, min(i + batch_size, len(all_files))):
-                batch.append(all_files[j])
-            batches.append(batch)
-
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            futures = []
-            for batch in batches:
-                futures.append(executor.submit(process_files_batch, batch))
-
-            processed = 0
-            for future in as_completed(futures):
-                batch_result = future.result()
-
-                for file, paths in batch_result.items():
-                    if file not in file_index:
-                        file_index[file] = []
-                    for path_item in paths:
-                        file_index[file].append(path_item)
-                        total += 1
-
-                processed += 1
-                show_progress(processed, len(batches), 'Processing', 'batches completed')
+        if not store.file_count:
+            log("No files found to index.")
+            return False
 
     except Exception as e:
-        print(f"Error during indexing: {e}")
-        return file_index
+        log(f"Error during indexing: {e}")
+        return False
 
-    print(f"\nTotal files indexed: {total}")
+    total = store.file_count
+    log(f"\nTotal files indexed: {total}")
+
+    if root.content_index.enabled:
+        update_content(root, check_existing=False, log=log)
 
     try:
-        ensure_index_dir()
-        print("Saving index file...")
-        with open(INDEX_FILE, 'w') as f:
-            json.dump({
-                "file_index": file_index,
-                "folder_index": folder_index,
-                "total_files": total,
-                "total_folders": len(all_folders),
-                "scanned_directories": all_scanned_dirs,
-                "scan_timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-            }, f, indent=2)
-        print("Index file saved successfully!")
+        log("Saving index file...")
+        save_checkpoint(root, path, True)
+        log("Index file saved successfully!")
     except Exception as e:
-        print(f"Error saving index: {e}")
+        log(f"Error saving index: {e}")
 
     build_time = time.time() - start
-    unique_names = len(file_index)
+    unique_names = store.file_names()
     files_per_second = total / build_time if build_time > 0 else 0
-    print(f"Index built in {build_time:.2f}s. Indexed {total} files with {unique_names} unique filenames.")
-    print(f"Speed: {files_per_second:.0f} files/second")
-    return file_index
+    log(f"Root '{root.name}' built in {build_time:.2f}s. Indexed {total} files with {unique_names} unique filenames.")
+    log(f"Speed: {files_per_second:.0f} files/second")
+    return True
+
+def build_fresh(settings, job):
+    # Job work: a new root object, so the loaded one is never touched.
+    job.root = IndexRoot(job.name)
+    job.root.meta.update(settings)
+    job.phase = 'scanning'
+    # A checkpoint is written over the root's files on disk, so a rebuild
+    # keeps the last complete index there until it has a complete one too.
+    previous = roots.get(job.name)
+    checkpoints = (not os.path.exists(job.root.index_file)
+                   or (previous is not None and previous.meta.get('complete') is False))
+    if not build_root(job.root, job.path, job.log, job.progress, checkpoints):
+        return None
+    return job.root
+
+def same_path(a, b):
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+def index_jobs(paths, name=None, on_done=None, echo=False, exclude=None, gitignore=None):
+    # One unstarted build job per path. A path indexed before keeps its root
+    # unless a name is given; a path inside another root is refused. exclude
+    # and gitignore replace the root's scan settings, which are kept
+    # otherwise.
+    if isinstance(paths, str):
+        paths = [paths]
+    if name is not None and len(paths) != 1:
+        raise ValueError("a root name needs exactly one path")
+    planned = []
+    for path in paths:
+        if not Path(path).exists():
+            print(f"Path does not exist: {path}")
+            continue
+        outer = [root for root in roots.values()
+                 if root.contains(path) and not same_path(root.path, path)]
+        if outer:
+            print(f"{path} is already part of root '{outer[0].name}'. Use 'reindex' to refresh it.")
+            continue
+        existing = [root for root in roots.values() if root.path and same_path(root.path, path)]
+        taken = {job.name for job in planned}
+        root_name = name or (existing[0].name if existing else name_for_path(path, taken))
+        if active_job(root_name) is not None or root_name in taken:
+            print(f"Root '{root_name}' is already being built.")
+            continue
+        previous = roots.get(root_name)
+        settings = {key: previous.meta[key] for key in ('exclude', 'gitignore')
+                    if previous is not None and key in previous.meta}
+        if exclude is not None:
+            settings['exclude'] = list(exclude)
+        if gitignore is not None:
+            settings['gitignore'] = gitignore
+        planned.append(BuildJob('index', root_name, path, partial(build_fresh, settings), replace_covered=True,
+                                on_done=on_done, echo=echo))
+    return planned
+
+async def index(paths, name=None, exclude=None, gitignore=None):
+    # Builds one root per path, all of them at once, and waits for them off
+    # the event loop. Returns the roots that were built.
+    start = time.time()
+    planned = index_jobs(paths, name, echo=True, exclude=exclude, gitignore=gitignore)
+    await run_jobs(planned)
+    built = [job.root for job in planned if job.phase == 'done']
+    if len(planned) > 1:
+        print(f"Built {len(built)} roots in {time.time() - start:.2f}s.")
+    return built
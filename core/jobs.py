@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from utlis.config import index_lock, metrics, query_cache
+from utlis.roots import remove_root, roots
+from utlis.save import save_data
+
+MAX_MESSAGES = 20
+# Finished jobs kept around for 'status'.
+MAX_FINISHED = 10
+
+jobs = []
+
+
+class BuildJob:
+    # Builds or reindexes one root on its own thread. `work(job)` fills a fresh
+    # IndexRoot and returns it; the loaded root keeps answering queries until
+    # the new one is complete and swapped in under the index lock. With
+    # replace_covered, roots inside the new root's folder are dropped at the
+    # swap. Progress is kept on the job for 'status'; with echo it is printed
+    # as well. on_done(job) runs on the job's thread when it finishes, whether
+    # it succeeded or not, before waiters are woken.
+    def __init__(self, kind, name, path, work, replace_covered=False, on_done=None, echo=False):
+        self.kind = kind
+        self.name = name
+        self.path = path
+        self.work = work
+        self.replace_covered = replace_covered
+        self.on_done = on_done
+        self.echo = echo
+        self.root = None
+        self.phase = 'queued'
+        self.dirs = 0
+        self.error = None
+        self.removed = []
+        self.started = None
+        self.finished = None
+        self.messages = deque(maxlen=MAX_MESSAGES)
+        self.done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        jobs.append(self)
+        finished = [job for job in jobs if job.done.is_set()]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            jobs.remove(job)
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name=f'index-{self.kind}-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def log(self, message):
+        if message.strip():
+            self.messages.append(message.strip())
+        if self.echo:
+            print(message)
+
+    def progress(self, scanned_dirs, file_count):
+        self.dirs = scanned_dirs
+        if self.echo and scanned_dirs % 1000 == 0 and not metrics.quiet:
+            print(f"\rScanned: {scanned_dirs} directories, found {file_count} files...", end='')
+
+    @property
+    def files(self):
+        root = self.root
+        return root.store.file_count if root is not None else 0
+
+    @property
+    def running(self):
+        return self.started is not None and not self.done.is_set()
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started if self.started else 0.0
+
+    def _run(self):
+        try:
+            old = roots.get(self.name)
+            if old is not None and old.compaction is not None:
+                old.compaction.join()
+            root = self.work(self)
+            if root is None:
+                self.phase = 'failed'
+                self._restore(old)
+            else:
+                self._swap(root)
+                self.phase = 'done'
+        except Exception as e:
+            self.error = str(e)
+            self.phase = 'failed'
+            self.log(f"{self.kind} of '{self.name}' failed: {e}")
+            self._restore(roots.get(self.name))
+        finally:
+            self.finished = time.time()
+            if self.on_done is not None:
+                try:
+                    self.on_done(self)
+                except Exception as e:
+                    self.log(f"Error after {self.kind} of '{self.name}': {e}")
+            self.done.set()
+
+    def _swap(self, root):
+        self.phase = 'swapping'
+        with index_lock:
+            old = roots.get(self.name)
+            roots[self.name] = root
+            root.attach_cache()
+            if self.replace_covered:
+                for other in list(roots.values()):
+                    if other is not root and other.path and root.contains(other.path):
+                        remove_root(other.name)
+                        self.removed.append(other.name)
+                        self.log(f"Root '{other.name}' ({other.path}) is now covered by '{root.name}' and was removed.")
+            # Results cached from the old snapshot may not hold for the new one.
+            query_cache.invalidate_all()
+        if old is not None:
+            old.shard_executor.shutdown()
+        self.log(f"Root '{self.name}' is up to date ({root.store.file_count} files, {self.elapsed():.2f}s).")
+
+    def _restore(self, old):
+        # A failed build may have written part of a new base over the old
+        # root's files; the old snapshot is saved again in full.
+        if old is None or roots.get(self.name) is not old:
+            return
+        with index_lock:
+            try:
+                save_data(old, full=True)
+            except Exception as e:
+                self.log(f"Could not save root '{self.name}' again: {e}")
+
+
+def active_job(name):
+    for job in jobs:
+        if job.name == name and not job.done.is_set():
+            return job
+    return None
+
+def running_jobs():
+    return [job for job in jobs if job.started is not None and not job.done.is_set()]
+
+def wait_for_jobs(selected=None):
+    for job in list(jobs if selected is None else selected):
+        if job.started is not None:
+            job.done.wait()
+
+async def run_jobs(selected):
+    # Starts the jobs and waits for them without blocking the event loop.
+    for job in selected:
+        job.start()
+    await asyncio.gather(*(asyncio.to_thread(job.done.wait) for job in selected))
@@ -0,0 +1,188 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the query latency buckets, in seconds.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+COUNTERS = {
+    'dirs_scanned': "Directories listed by scans, reindexes and the watcher.",
+    'files_scanned': "Files seen in those listings.",
+    'stat_calls': "stat calls made while scanning and checking directories.",
+    'scan_errors': "Directories that could not be read, mostly for lack of permission.",
+    'files_added': "Files added to the index by reindexes and the watcher.",
+    'files_removed': "Files removed from the index by reindexes and the watcher.",
+}
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, fraction):
+        # Interpolated inside the bucket the quantile falls in.
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                low = LATENCY_BUCKETS[i - 1] if i else 0.0
+                high = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.max
+                return min(self.max, low + (high - low) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+
+class Metrics:
+    # Process-wide performance numbers: time spent per phase (scan, merge,
+    # persist, load, ...), scan counters, query latency histograms per search
+    # mode and the peak RSS seen at the end of each phase. Recording takes one
+    # short lock, so it is safe from job and watcher threads; the scanner adds
+    # its counts once per scan rather than per directory.
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.phases = {}
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.queries = {}
+            self.last_scan = None
+            self.memory = {}
+
+    def report(self, message):
+        # Per-query and progress output, dropped in quiet mode.
+        if not self.quiet:
+            print(message)
+
+    @contextmanager
+    def timer(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, time.perf_counter() - start)
+
+    def add_phase(self, phase, seconds):
+        peak = peak_rss_bytes()
+        with self._lock:
+            runs, total, _, longest = self.phases.get(phase, (0, 0.0, 0.0, 0.0))
+            self.phases[phase] = (runs + 1, total + seconds, seconds, max(longest, seconds))
+            if peak is not None:
+                self.memory[phase] = max(self.memory.get(phase, 0), peak)
+
+    def count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def add_scan(self, dirs, files, stat_calls, errors, seconds):
+        self.count(dirs_scanned=dirs, files_scanned=files, stat_calls=stat_calls, scan_errors=errors)
+        with self._lock:
+            self.last_scan = (dirs, files, seconds)
+
+    def observe(self, mode, start):
+        # Records a query that began at perf_counter() `start`; returns its
+        # duration for the caller's own message.
+        seconds = time.perf_counter() - start
+        with self._lock:
+            histogram = self.queries.get(mode)
+            if histogram is None:
+                histogram = self.queries[mode] = Histogram()
+            histogram.observe(seconds)
+        return seconds
+
+    def snapshot(self):
+        with self._lock:
+            scan = None
+            if self.last_scan is not None:
+                dirs, files, seconds = self.last_scan
+                scan = {"dirs": dirs, "files": files, "seconds": round(seconds, 4),
+                        "dirs_per_second": round(dirs / seconds) if seconds > 0 else None,
+                        "files_per_second": round(files / seconds) if seconds > 0 else None}
+            return {
+                "uptime": round(time.time() - self.started, 1),
+                "phases": {phase: {"runs": runs, "seconds": round(total, 4), "last_seconds": round(last, 4),
+                                   "max_seconds": round(longest, 4)}
+                           for phase, (runs, total, last, longest) in self.phases.items()},
+                "counters": dict(self.counters),
+                "last_scan": scan,
+                "queries": {mode: {"count": h.count, "seconds": round(h.sum, 4),
+                                   "p50_ms": round(h.quantile(0.5) * 1000, 3),
+                                   "p90_ms": round(h.quantile(0.9) * 1000, 3),
+                                   "p99_ms": round(h.quantile(0.99) * 1000, 3),
+                                   "max_ms": round(h.max * 1000, 3)}
+                            for mode, h in self.queries.items()},
+                "memory": {"peak_rss_bytes": peak_rss_bytes(),
+                           "peak_rss_bytes_by_phase": dict(self.memory)},
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        # The text exposition format, for a scraper or a file collector.
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP pyindex_{name} {help_text}")
+            lines.append(f"# TYPE pyindex_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"pyindex_{name}{labels} {value}")
+
+        with self._lock:
+            phases = dict(self.phases)
+            counters = dict(self.counters)
+            queries = {mode: (list(h.buckets), h.count, h.sum) for mode, h in self.queries.items()}
+            memory = dict(self.memory)
+        metric('phase_seconds_total', 'counter', "Time spent per phase.",
+               [(f'{{phase="{phase}"}}', f'{total:.6f}') for phase, (_, total, _, _) in phases.items()])
+        metric('phase_runs_total', 'counter', "Completed runs per phase.",
+               [(f'{{phase="{phase}"}}', runs) for phase, (runs, _, _, _) in phases.items()])
+        for name, help_text in COUNTERS.items():
+            metric(f'{name}_total', 'counter', help_text, [('', counters[name])])
+        samples = []
+        for mode, (buckets, count, total) in queries.items():
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket
+                samples.append((f'_bucket{{mode="{mode}",le="{bound}"}}', cumulative))
+            samples.append((f'_sum{{mode="{mode}"}}', f'{total:.6f}'))
+            samples.append((f'_count{{mode="{mode}"}}', count))
+        lines.append("# HELP pyindex_query_seconds Query latency per search mode.")
+        lines.append("# TYPE pyindex_query_seconds histogram")
+        lines.extend(f"pyindex_query_seconds{labels} {value}" for labels, value in samples)
+        peak = peak_rss_bytes()
+        metric('peak_rss_bytes', 'gauge', "Peak resident set size of the process.",
+               [('', peak)] if peak is not None else [])
+        metric('phase_peak_rss_bytes', 'gauge', "Peak resident set size at the end of each phase.",
+               [(f'{{phase="{phase}"}}', value) for phase, value in memory.items()])
+        return '\n'.join(lines) + '\n'
@@ -1,202 +1,211 @@
 import os
-import json
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
-from utlis.config import INDEX_FILE, file_index, ensure_index_dir
-
-def show_progress(current, total, prefix='Progress', suffix='Complete', length=50):
-    if total == 0:
-        return
-    percent = "{0:.1f}".format(100 * (current / float(total)))
-    filled_length = int(length * current // total)
-    bar = '█' * filled_length + '-' * (length - filled_length)
-    print(f'\r{prefix} |{bar}| {percent}% {suffix} ({current}/{total})', end='\r')
-    if current == total:
-        print()
-
-def check_files_batch(file_paths_batch):
-    existing = []
-    for file_path in file_paths_batch:
-        if os.path.exists(file_path):
-            existing.append(file_path)
-    return existing
-
-def scan_directory_chunk(path, skip_dirs=None):
-    if skip_dirs is None:
-        skip_dirs = set()
-
-    files = []
+from core.index import ingest_tree, print_progress, update_content
+from core.jobs import BuildJob, active_job, run_jobs
+from core.scanner import scan_dir
+from core.store import NO_ID
+from utlis.config import SCAN_WORKERS, index_lock, metrics
+from utlis.roots import root_for_path, roots
+from utlis.save import save_data
+
+def stat_dirs(store, dirs):
+    # Returns (dir_id, mtime) pairs; mtime is None once the directory is gone.
+    results = []
+    for dir_id, dir_path in dirs:
+        try:
+            results.append((dir_id, os.stat(dir_path).st_mtime_ns))
+        except (FileNotFoundError, NotADirectoryError):
+            results.append((dir_id, None))
+        except OSError:
+            results.append((dir_id, store.dir_mtime[dir_id]))
+    return results
+
+def list_dir(dir_id, dir_path, matcher):
     try:
-        path_obj = Path(path)
-        if not path_obj.exists():
-            return files
-
-        for item in path_obj.iterdir():
-            if item.is_file():
-                name = item.name
-                if not name.startswith('.') and not name.endswith(('android', '.')):
-                    files.append((name, str(item)))
-            elif item.is_dir() and not item.name.startswith('.') and item.name not in skip_dirs:
-                full_path_lower = str(item).lower()
-                if 'appdata' in full_path_lower:
-                    continue
-                sub_files = scan_directory_chunk(item, skip_dirs)
-                for sub_file in sub_files:
-                    files.append(sub_file)
-    except (PermissionError, OSError):
-        pass
-    return files
-
-async def reindex_file(path):
+        return dir_id, dir_path, scan_dir(dir_path, matcher)[:4]
+    except (FileNotFoundError, NotADirectoryError):
+        return dir_id, dir_path, None
+    except OSError:
+        return dir_id, dir_path, ()
+
+def apply_listing(store, dir_id, dir_path, listing, new_dirs):
+    added = removed = 0
+    files, file_stats, subdirs, mtime = listing
+    names = store.names
+
+    stored = {names[store.file_name[file_id]]: file_id for file_id in store.files_in_dir(dir_id)}
+    current = dict(zip(files, file_stats))
+    for name, file_id in stored.items():
+        if name not in current:
+            store.remove_file(file_id)
+            removed += 1
+        else:
+            store.set_file_stat(file_id, *current[name])
+    fresh = [name for name in files if name not in stored]
+    store.add_files(dir_path, fresh, [current[name] for name in fresh])
+    added += len(fresh)
+
+    known = {names[store.dir_name[child_id]]: child_id
+             for child_id in store.child_dirs(dir_id) if store.folder_flags[child_id]}
+    current_dirs = {os.path.basename(subdir): subdir for subdir in subdirs}
+    for name, child_id in known.items():
+        if name not in current_dirs:
+            removed += store.remove_subtree(child_id)
+    for name, subdir in current_dirs.items():
+        if name not in known:
+            new_dirs.append(subdir)
+
+    store.set_dir_mtime(dir_id, mtime)
+    return added, removed
+
+def find_changed_dirs(store, root_id, executor, lock=nullcontext()):
+    # Only directory mtimes are checked; a directory's mtime changes whenever
+    # an entry is added, removed or renamed inside it. `lock` is held while
+    # the store is read and changed, not during the stat calls.
+    start = time.perf_counter()
+    with lock:
+        dir_paths = store.all_dir_paths()
+        watched = [(dir_id, dir_paths[dir_id]) for dir_id in store.subtree_dirs(root_id)
+                   if dir_id == root_id or store.folder_flags[dir_id]]
+    chunk = max(256, len(watched) // (SCAN_WORKERS * 4) + 1)
+    chunks = [watched[i:i + chunk] for i in range(0, len(watched), chunk)]
+    stats = list(executor.map(lambda dirs: stat_dirs(store, dirs), chunks))
+    changed = []
+    removed = 0
+    with lock:
+        for results in stats:
+            for dir_id, mtime in results:
+                if mtime is None:
+                    removed += store.remove_subtree(dir_id)
+                elif mtime != store.dir_mtime[dir_id]:
+                    changed.append(dir_id)
+        # remove_subtree may have dropped a changed directory's parent.
+        changed = [(dir_id, dir_paths[dir_id]) for dir_id in changed
+                   if dir_id == root_id or store.folder_flags[dir_id]]
+    metrics.count(stat_calls=len(watched), files_removed=removed)
+    metrics.add_phase('check', time.perf_counter() - start)
+    return changed, removed, len(watched)
+
+def refresh_dirs(store, changed, executor, rules, on_dir=None, progress=print_progress, lock=nullcontext()):
+    # The changed directories are listed, and new folders scanned, without
+    # `lock`; it is held only while the differences are applied.
+    added = removed = 0
+    new_dirs = []
+    cache = {}
+    # Built up front: the matchers share the cache, which is not thread-safe.
+    changed = [(dir_id, dir_path, rules.matcher(os.path.dirname(dir_path), cache)) for dir_id, dir_path in changed]
+    listings = list(executor.map(lambda item: list_dir(*item), changed))
+    merging = 0.0
+    listed = 0
+    with lock:
+        for dir_id, dir_path, listing in listings:
+            start = time.perf_counter()
+            if listing is None:
+                removed += store.remove_subtree(dir_id)
+            elif listing:
+                listed += len(listing[0])
+                dir_added, dir_removed = apply_listing(store, dir_id, dir_path, listing, new_dirs)
+                added += dir_added
+                removed += dir_removed
+            merging += time.perf_counter() - start
+        for new_dir in new_dirs:
+            store.add_folder(new_dir)
+    if changed:
+        metrics.count(dirs_scanned=len(changed), files_scanned=listed, stat_calls=listed + len(changed))
+        metrics.add_phase('merge', merging)
+    if new_dirs:
+        before = store.file_count
+        ingest_tree(store, new_dirs, on_dir=on_dir, progress=progress, rules=rules, lock=lock)
+        added += store.file_count - before
+    metrics.count(files_added=added, files_removed=removed)
+    return added, removed
+
+def refresh_root(root, path, log=print, progress=print_progress):
+    # Brings the part of the root under path up to date and saves it.
+    store = root.store
     total_new = 0
+    total_removed = 0
     start = time.time()
 
-    print("Checking existing files...")
-    all_file_paths = []
-    for filename, paths in file_index.items():
-        for file_path in paths:
-            all_file_paths.append(file_path)
-
-    if all_file_paths:
-        batch_size = max(100, len(all_file_paths) // 8)
-        batches = []
-        for i in range(0, len(all_file_paths), batch_size):
-            batch = []
-            for j in range(i, min(i + batch_size, len(all_file_paths))):
-                batch.append(all_file_paths[j])
-            batches.append(batch)
-
-        valid_paths = set()
-        with ThreadPoolExecutor(max_workers=6) as executor:
-            futures = []
-            for batch in batches:
-                futures.append(executor.submit(check_files_batch, batch))
-
-            processed = 0
-            for future in as_completed(futures):
-                batch_result = future.result()
-                for valid_path in batch_result:
-                    valid_paths.add(valid_path)
-                processed += 1
-                show_progress(processed, len(batches), 'Checking', 'batches verified')
-
-        print(f"\nCleaning up missing files...")
-        files_to_remove = []
-        for filename, paths in list(file_index.items()):
-            new_paths = []
-            for p in paths:
-                if p in valid_paths:
-                    new_paths.append(p)
-            if new_paths:
-                file_index[filename] = new_paths
-            else:
-                files_to_remove.append(filename)
-
-        for filename in files_to_remove:
-            del file_index[filename]
-
-        removed_count = len(all_file_paths) - len(valid_paths)
-        print(f"Removed {removed_count} missing files")
-
-    print("Scanning for new files...")
-
     try:
         path_obj = Path(path)
         if not path_obj.exists():
-            print(f"Path does not exist: {path}")
-            return
-
-        subdirs = [path]
-        if path_obj.is_dir():
-            try:
-                for item in path_obj.iterdir():
-                    if item.is_dir() and not item.name.startswith('.'):
-                        subdirs.append(str(item))
-            except (PermissionError, OSError):
-                pass
-
-        if len(subdirs) > 8:
-            new_subdirs = []
-            for i in range(8):
-                new_subdirs.append(subdirs[i])
-            subdirs = new_subdirs
-
-        print(f"Scanning {len(subdirs)} directories in parallel...")
-
-        with ThreadPoolExecutor(max_workers=min(6, len(subdirs))) as executor:
-            futures = {}
-            for subdir in subdirs:
-                futures[executor.submit(scan_directory_chunk, subdir)] = subdir
-
-            all_files = []
-            completed = 0
-
-            for future in as_completed(futures):
-                subdir = futures[future]
-                try:
-                    result = future.result()
-                    for file_info in result:
-                        all_files.append(file_info)
-                    completed += 1
-                    print(f"\rScanned: {completed}/{len(subdirs)} directories, found {len(all_files)} files...", end='')
-                except Exception as e:
-                    print(f"\nError scanning {subdir}: {e}")
-
-        print(f"\nFound {len(all_files)} files total")
-
-        if not all_files:
-            print("No new files found.")
-            return
-
-        existing_file_paths = set()
-        for paths in file_index.values():
-            for path_item in paths:
-                existing_file_paths.add(path_item)
-
-        new_files = []
-        for file, file_path in all_files:
-            if file_path not in existing_file_paths:
-                new_files.append((file, file_path))
-
-        if new_files:
-            batch_size = 1000
-            batches = []
-            for i in range(0, len(new_files), batch_size):
-                batch = []
-                for j in range(i, min(i + batch_size, len(new_files))):
-                    batch.append(new_files[j])
-                batches.append(batch)
-
-            processed = 0
-            for batch in batches:
-                for file, file_path in batch:
-                    if file not in file_index:
-                        file_index[file] = []
-                    file_index[file].append(file_path)
-                    total_new += 1
-
-                processed += 1
-                show_progress(processed, len(batches), 'Adding', 'new files processed')
-
-        print(f"\nAdded {total_new} new files to index...")
+            log(f"Path does not exist: {path}")
+            return False
+
+        root_id = store.find_dir(path)
+        if root_id == NO_ID or store.dir_mtime[root_id] == NO_ID:
+            log("Path has not been scanned before, indexing it in full...")
+            if root_id != NO_ID:
+                total_removed += store.remove_subtree(root_id)
+            before = store.file_count
+            ingest_tree(store, path, progress=progress, rules=root.rules)
+            total_new += store.file_count - before
+        else:
+            with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+                changed, total_removed, checked = find_changed_dirs(store, root_id, executor)
+                log(f"Checked {checked} directories in '{root.name}', rescanning {len(changed)} changed directories...")
+                total_new, removed = refresh_dirs(store, changed, executor, root.rules, progress=progress)
+                total_removed += removed
+
+        log(f"\nRemoved {total_removed} missing files")
+        log(f"Added {total_new} new files to index...")
+
+        if root.content_index.enabled:
+            update_content(root, log=log)
 
     except Exception as e:
-        print(f"Error during reindexing: {e}")
+        log(f"Error during reindexing: {e}")
 
     try:
-        ensure_index_dir()
-        print("Saving updated index file...")
-        with open(INDEX_FILE, 'w') as f:
-            total_files = 0
-            for paths in file_index.values():
-                total_files += len(paths)
-            json.dump({"file_index": file_index, "total_files": total_files}, f, indent=2)
-        print("Index file saved successfully!")
+        log("Saving updated index file...")
+        save_data(root)
+        log("Index file saved successfully!")
     except Exception as e:
-        print(f"Error saving reindex: {e}")
+        log(f"Error saving reindex: {e}")
 
     reindex_time = time.time() - start
     files_per_second = total_new / reindex_time if reindex_time > 0 else 0
-    print(f"Reindex completed in {reindex_time:.2f}s. Added {total_new} new files.")
-    print(f"Speed: {files_per_second:.0f} files/second")
+    log(f"Reindex of '{root.name}' completed in {reindex_time:.2f}s. Added {total_new} new files.")
+    log(f"Speed: {files_per_second:.0f} files/second")
+    return True
+
+def refresh_snapshot(job):
+    # Job work: the loaded root is copied in memory, and the copy is refreshed
+    # while the original keeps serving queries.
+    old = job.root = roots.get(job.name)
+    if old is None:
+        return None
+    job.phase = 'copying'
+    with index_lock:
+        clone = old.clone()
+    job.root = clone
+    job.phase = 'scanning'
+    if not refresh_root(clone, job.path, job.log, job.progress):
+        return None
+    return clone
+
+def reindex_jobs(targets, on_done=None, echo=False):
+    # Unstarted refresh jobs for (root, path) pairs; roots already being
+    # built or refreshed are skipped.
+    planned = []
+    for root, path in targets:
+        if active_job(root.name) is not None or any(job.name == root.name for job in planned):
+            print(f"Root '{root.name}' is already being built.")
+            continue
+        planned.append(BuildJob('reindex', root.name, path, refresh_snapshot, on_done=on_done, echo=echo))
+    return planned
+
+async def reindex_file(path):
+    root = root_for_path(path)
+    if root is None:
+        print(f"{path} is not inside an indexed root. Use 'index' to add it.")
+        return
+    await run_jobs(reindex_jobs([(root, path)], echo=True))
+
+async def reindex_roots(selected):
+    # Every root is refreshed by its own job; they share no state.
+    await run_jobs(reindex_jobs([(root, root.path) for root in selected if root.path], echo=True))
@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+from collections import Counter
+
+GITIGNORE = '.gitignore'
+
+
+class Rule:
+    # One gitignore-style pattern. `label` names it in the hit counts.
+    def __init__(self, pattern, label):
+        self.label = label
+        self.negate = pattern.startswith('!')
+        if self.negate:
+            pattern = pattern[1:]
+        elif pattern.startswith('\\'):
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        # A slash anywhere but at the end ties the pattern to the folder the
+        # rule comes from; otherwise it matches a name at any depth.
+        self.anchored = '/' in pattern
+        self.pattern = pattern.lstrip('/')
+        self.literal = not self.anchored and not any(c in self.pattern for c in '*?[\\')
+
+    def regex(self):
+        return glob_regex(self.pattern)
+
+
+def glob_regex(pattern):
+    # Translates a gitignore glob: '*' and '?' stay within one path part,
+    # '**' spans any number of them.
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i) and (i == 0 or pattern[i - 1] == '/'):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i) and i + 2 == len(pattern) and (i == 0 or pattern[i - 1] == '/'):
+            out.append('.*')
+            i += 2
+        elif c == '*':
+            out.append('[^/]*')
+            i += 1
+        elif c == '?':
+            out.append('[^/]')
+            i += 1
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            out.append('[' + body.replace('\\', '\\\\') + ']')
+            i = end + 1
+        elif c == '\\' and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return ''.join(out)
+
+
+def parse_lines(lines, source=None):
+    # Rules from a gitignore file or a config list; blanks and comments are
+    # skipped.
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip()
+        if not line or line.startswith('#') or line in ('!', '/'):
+            continue
+        rules.append(Rule(line, f'{line} ({source})' if source else line))
+    return rules
+
+
+class RuleSet:
+    # A list of rules compiled once: literal names go into dicts, every other
+    # pattern into one alternation per entry kind, listed last rule first so
+    # the first alternative that matches is the rule that wins. Anchored
+    # patterns match the path below `base`.
+    def __init__(self, rules, base):
+        self.rules = rules
+        self.base = base.rstrip(os.sep) if base != os.sep else base
+        self.prefix = len(self.base) + (0 if self.base.endswith(os.sep) else 1)
+        self.literal_any = {}
+        self.literal_dir = {}
+        for index, rule in enumerate(rules):
+            if rule.literal:
+                (self.literal_dir if rule.dir_only else self.literal_any)[rule.pattern] = index
+        self.name_any = self._compile(rules, anchored=False, dirs=False)
+        self.name_dir = self._compile(rules, anchored=False, dirs=True)
+        self.path_any = self._compile(rules, anchored=True, dirs=False)
+        self.path_dir = self._compile(rules, anchored=True, dirs=True)
+
+    @staticmethod
+    def _compile(rules, anchored, dirs):
+        parts = [f'(?P<r{index}>{rule.regex()})' for index, rule in reversed(list(enumerate(rules)))
+                 if rule.anchored == anchored and not rule.literal and (dirs or not rule.dir_only)]
+        return re.compile('|'.join(parts), re.DOTALL) if parts else None
+
+    def match(self, name, path, is_dir):
+        # The last rule matching the entry, or None.
+        best = self.literal_any.get(name, -1)
+        if is_dir:
+            best = max(best, self.literal_dir.get(name, -1))
+        regex = self.name_dir if is_dir else self.name_any
+        if regex is not None:
+            found = regex.fullmatch(name)
+            if found:
+                best = max(best, int(found.lastgroup[1:]))
+        regex = self.path_dir if is_dir else self.path_any
+        if regex is not None:
+            relative = path[self.prefix:]
+            if os.sep != '/':
+                relative = relative.replace(os.sep, '/')
+            found = regex.fullmatch(relative)
+            if found:
+                best = max(best, int(found.lastgroup[1:]))
+        return self.rules[best] if best >= 0 else None
+
+
+class Matcher:
+    # The rule sets in effect inside one folder, innermost .gitignore first,
+    # the configured rules last. Folders without a .gitignore share their
+    # parent's matcher.
+    def __init__(self, owner, rule_sets):
+        self.owner = owner
+        self.rule_sets = rule_sets
+
+    def excluded(self, name, path, is_dir):
+        # The excluding rule, or None when the entry is kept.
+        for rule_set in self.rule_sets:
+            rule = rule_set.match(name, path, is_dir)
+            if rule is not None:
+                return None if rule.negate else rule
+        return None
+
+    def enter(self, dir_path, names=None):
+        # The matcher for dir_path's entries. `names` is its listing when
+        # known, which saves looking for a .gitignore that is not there.
+        if not self.owner.gitignore or (names is not None and GITIGNORE not in names):
+            return self
+        try:
+            with open(os.path.join(dir_path, GITIGNORE), encoding='utf-8', errors='replace') as f:
+                lines = f.readlines()
+        except OSError:
+            return self
+        source = os.path.relpath(os.path.join(dir_path, GITIGNORE), self.owner.root)
+        rules = parse_lines(lines, source.replace(os.sep, '/'))
+        if not rules:
+            return self
+        return Matcher(self.owner, (RuleSet(rules, dir_path),) + self.rule_sets)
+
+    def record(self, hits):
+        self.owner.record(hits)
+
+
+class ScanRules:
+    # The exclusion rules of one root: the configured patterns, anchored at
+    # the root folder, plus optionally every .gitignore found below it.
+    # Excluded folders are never entered. `hits` counts the entries each rule
+    # kept out of the index.
+    def __init__(self, patterns, root, gitignore=False):
+        self.patterns = tuple(patterns)
+        self.root = root
+        self.gitignore = gitignore
+        self.hits = Counter()
+        self._lock = threading.Lock()
+        self.base = Matcher(self, (RuleSet(parse_lines(self.patterns), root),))
+
+    def matcher(self, dir_path, cache=None):
+        # The matcher inside dir_path, reading the .gitignore files from the
+        # root down to it. `cache` maps folders to matchers already built.
+        if not self.gitignore:
+            return self.base
+        relative = os.path.relpath(dir_path, self.root)
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            return self.base
+        if cache is not None and dir_path in cache:
+            return cache[dir_path]
+        if relative == os.curdir:
+            matcher = self.base.enter(self.root)
+        else:
+            matcher = self.matcher(os.path.dirname(dir_path), cache).enter(dir_path)
+        if cache is not None:
+            cache[dir_path] = matcher
+        return matcher
+
+    def record(self, hits):
+        with self._lock:
+            self.hits.update(hits)
+
+    def reset(self):
+        with self._lock:
+            self.hits.clear()
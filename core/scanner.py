@@ -0,0 +1,111 @@
+import os
+import queue
+import threading
+from core.store import KIND_EXEC, KIND_LINK, NO_ID
+from utlis.config import SCAN_WORKERS
+
+
+def scan_dir(path, matcher=None):
+    # Returns file names, their (size, mtime, kind) triples, subdirectories,
+    # the directory's own mtime and the matcher its subdirectories inherit.
+    # `matcher` holds the exclusion rules in effect in the parent folder;
+    # excluded subdirectories are left out, so nothing below them is read.
+    files = []
+    file_stats = []
+    subdirs = []
+    hits = {}
+    # Taken before the listing, so a change made mid-scan shows up as a newer
+    # mtime on the next reindex rather than being missed.
+    mtime = os.stat(path).st_mtime_ns
+    with os.scandir(path) as entries:
+        entries = list(entries)
+    if matcher is not None:
+        matcher = matcher.enter(path, [entry.name for entry in entries])
+    for entry in entries:
+        name = entry.name
+        # DirEntry caches the d_type from the directory read, so these checks
+        # normally cost no extra stat calls.
+        if entry.is_file():
+            if matcher is not None:
+                rule = matcher.excluded(name, entry.path, False)
+                if rule is not None:
+                    hits[rule.label] = hits.get(rule.label, 0) + 1
+                    continue
+            files.append(name)
+            try:
+                stat = entry.stat()
+                kind = KIND_LINK if entry.is_symlink() else 0
+                if stat.st_mode & 0o111:
+                    kind |= KIND_EXEC
+                file_stats.append((stat.st_size, stat.st_mtime_ns, kind))
+            except OSError:
+                file_stats.append((NO_ID, NO_ID, 0))
+        elif entry.is_dir(follow_symlinks=False):
+            if matcher is not None:
+                rule = matcher.excluded(name, entry.path, True)
+                if rule is not None:
+                    hits[rule.label] = hits.get(rule.label, 0) + 1
+                    continue
+            subdirs.append(entry.path)
+    if hits:
+        matcher.record(hits)
+    return files, file_stats, subdirs, mtime, matcher
+
+
+def scan_tree(root, emit, rules=None, workers=SCAN_WORKERS, stop=None):
+    # Every worker pulls directories from one shared queue and pushes the
+    # subdirectories it finds back onto it, so a single deep subtree is spread
+    # over all workers instead of pinning one thread. Each directory travels
+    # with the matcher of its parent, so .gitignore files are read once.
+    roots = [root] if isinstance(root, str) else list(root)
+    if not roots:
+        return []
+    pending = queue.SimpleQueue()
+    errors = []
+    failures = []
+    remaining = [len(roots)]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            path, matcher = item
+            files, file_stats, subdirs, mtime = [], [], [], -1
+            if stop is None or not stop.is_set():
+                try:
+                    files, file_stats, subdirs, mtime, matcher = scan_dir(path, matcher)
+                except OSError:
+                    errors.append(path)
+            with lock:
+                remaining[0] += len(subdirs)
+            for subdir in subdirs:
+                pending.put((subdir, matcher))
+            if stop is None or not stop.is_set():
+                try:
+                    emit((path, files, file_stats, subdirs, mtime))
+                except Exception as e:
+                    failures.append(e)
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    done.set()
+
+    # New folders found by a reindex can lie anywhere in the root, so each
+    # starts from the rules of its parent.
+    cache = {}
+    for path in roots:
+        pending.put((path, rules.matcher(os.path.dirname(path), cache) if rules is not None else None))
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    done.wait()
+    for _ in threads:
+        pending.put(None)
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0]
+    return errors
@@ -0,0 +1,230 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+from array import array
+
+MAGIC = b'PYIDXSEG'
+SEGMENT_VERSION = 2
+HEADER = struct.Struct('<8sIBxxxI')
+SECTION = struct.Struct('<24sc7xQQ')
+ALIGN = 8
+ENCODING = 'utf-8'
+ERRORS = 'surrogatepass'
+
+STORE_ARRAYS = ('name_files', 'name_folders', 'dir_parent', 'dir_name', 'dir_files',
+                'dir_next_folder', 'dir_child', 'dir_next_sibling', 'dir_mtime',
+                'file_dir', 'file_name', 'file_next_name', 'file_next_dir', 'file_size', 'file_mtime',
+                'file_kind')
+POSTING_PARTS = ('grams', 'gram_offsets', 'ids', 'bounds')
+LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+class StringTable:
+    # Append-only string list. Strings loaded from a segment stay encoded in the
+    # mapped file and are decoded one at a time on access.
+    def __init__(self, buffer=None, offsets=None, start=0):
+        self._buffer = buffer
+        self._offsets = offsets if offsets is not None else array('q', [0])
+        self._start = start
+        self._base = len(self._offsets) - 1
+        self._extra = []
+
+    def __len__(self):
+        return self._base + len(self._extra)
+
+    def __getitem__(self, i):
+        if i < self._base:
+            start = self._start
+            offsets = self._offsets
+            return self._buffer[start + offsets[i]:start + offsets[i + 1]].decode(ENCODING, ERRORS)
+        return self._extra[i - self._base]
+
+    def __iter__(self):
+        for i in range(self._base):
+            yield self[i]
+        yield from self._extra
+
+    def append(self, text):
+        self._extra.append(text)
+
+    def copy(self):
+        # The mapped part is read-only, so the copy shares it.
+        table = StringTable(self._buffer, self._offsets, self._start)
+        table._extra = list(self._extra)
+        return table
+
+    def detach(self):
+        if self._buffer is not None:
+            self._extra = list(self)
+            self._buffer = None
+            self._offsets = array('q', [0])
+            self._start = self._base = 0
+
+    def pack(self):
+        start = self._start
+        blob = bytearray(self._buffer[start:start + self._offsets[-1]] if self._base else b'')
+        offsets = array('q', self._offsets)
+        for text in self._extra:
+            blob += text.encode(ENCODING, ERRORS)
+            offsets.append(len(blob))
+        return bytes(blob), offsets
+
+
+def pack_strings(strings):
+    table = StringTable()
+    for text in strings:
+        table.append(text)
+    return table.pack()
+
+
+def pack_postings(postings):
+    grams = list(postings)
+    blob, gram_offsets = pack_strings(grams)
+    ids = array('i')
+    bounds = array('q', [0])
+    for gram in grams:
+        ids.extend(postings[gram])
+        bounds.append(len(ids))
+    return blob, gram_offsets, ids, bounds
+
+
+def unpack_postings(blob, gram_offsets, ids, bounds):
+    grams = StringTable(blob, gram_offsets)
+    return {grams[i]: ids[bounds[i]:bounds[i + 1]] for i in range(len(grams))}
+
+
+def write_segment(path, store, postings, meta, backup=None):
+    names_blob, names_offsets = store.names.pack()
+    sections = [
+        ('names_blob', names_blob),
+        ('names_offsets', names_offsets),
+    ]
+    for name in STORE_ARRAYS:
+        sections.append((name, getattr(store, name)))
+    sections.append(('folder_flags', bytes(store.folder_flags)))
+    for kind, lists in postings.items():
+        for suffix, data in zip(POSTING_PARTS, pack_postings(lists)):
+            sections.append((f'{kind}_{suffix}', data))
+    sections.append(('meta', json.dumps(meta).encode(ENCODING)))
+    # Windows refuses to replace a file that is still mapped.
+    write_sections(path, sections, release=store.names.detach, backup=backup)
+
+
+def sync_dir(path):
+    # Makes a rename inside the directory durable. Not possible on Windows,
+    # where renames are durable once they return.
+    try:
+        fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def replace_file(tmp_path, path, backup=None):
+    # The live file stays in place throughout: the backup is a second link to
+    # it (a copy where links are not supported) and the new file replaces it
+    # in a single rename.
+    if backup is not None and os.path.exists(path):
+        backup_tmp = backup + '.tmp'
+        if os.path.exists(backup_tmp):
+            os.remove(backup_tmp)
+        try:
+            os.link(path, backup_tmp)
+        except OSError:
+            shutil.copyfile(path, backup_tmp)
+        os.replace(backup_tmp, backup)
+    os.replace(tmp_path, path)
+
+
+def write_sections(path, sections, magic=MAGIC, version=SEGMENT_VERSION, release=None, backup=None):
+    # Write next to the target and swap it in, so a live mapping of the old
+    # file is never truncated underneath its readers and a crash leaves
+    # either the old file or the new one, never a torn mix. With backup set,
+    # the old file is kept under that name.
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        offset = HEADER.size + SECTION.size * len(sections)
+        table = []
+        for name, data in sections:
+            offset += -offset % ALIGN
+            typecode = data.typecode if isinstance(data, array) else 'B'
+            length = len(data) * (data.itemsize if isinstance(data, array) else 1)
+            table.append(SECTION.pack(name.encode(), typecode.encode(), offset, length))
+            offset += length
+        f.write(HEADER.pack(magic, version, 1 if LITTLE_ENDIAN else 0, len(sections)))
+        f.write(b''.join(table))
+        for name, data in sections:
+            f.write(b'\0' * (-f.tell() % ALIGN))
+            if isinstance(data, array):
+                data.tofile(f)
+            else:
+                f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        replace_file(tmp_path, path, backup)
+    except PermissionError:
+        if release is None:
+            raise
+        release()
+        replace_file(tmp_path, path, backup)
+    sync_dir(path)
+
+
+def open_segment(path, expected_magic=MAGIC, max_version=SEGMENT_VERSION):
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, little, count = HEADER.unpack_from(buffer, 0)
+    if magic != expected_magic:
+        raise ValueError("not a PyIndexSearch segment")
+    if not 1 <= version <= max_version:
+        raise ValueError(f"unsupported segment version {version}")
+    sections = {}
+    for i in range(count):
+        name, typecode, offset, length = SECTION.unpack_from(buffer, HEADER.size + i * SECTION.size)
+        sections[name.rstrip(b'\0').decode()] = (typecode.decode(), offset, length)
+    return buffer, sections, bool(little) != LITTLE_ENDIAN
+
+
+def read_segment(path, store, with_postings=True):
+    # Returns the metadata and every posting-list index found in the segment;
+    # callers rebuild any index the segment predates. Readers that only need
+    # the store columns can skip unpacking the postings.
+    buffer, sections, swap = open_segment(path)
+    view = memoryview(buffer)
+
+    def raw(name):
+        _, offset, length = sections[name]
+        return view[offset:offset + length]
+
+    def load_array(name):
+        typecode, offset, length = sections[name]
+        values = array(typecode)
+        values.frombytes(view[offset:offset + length])
+        if swap:
+            values.byteswap()
+        return values
+
+    try:
+        store.load_columns(
+            StringTable(buffer, load_array('names_offsets'), sections['names_blob'][1]),
+            {name: load_array(name) for name in STORE_ARRAYS if name in sections},
+            bytearray(raw('folder_flags')),
+        )
+        postings = {}
+        for section in sections:
+            if with_postings and section.endswith('_grams'):
+                kind = section[:-len('_grams')]
+                postings[kind] = unpack_postings(bytes(raw(section)), load_array(f'{kind}_gram_offsets'),
+                                                 load_array(f'{kind}_ids'), load_array(f'{kind}_bounds'))
+        return json.loads(bytes(raw('meta')).decode(ENCODING)), postings
+    finally:
+        view.release()
@@ -0,0 +1,128 @@
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from core.segment import read_segment
+from core.store import NO_ID, PathStore
+
+# Each worker process keeps the last segment it opened. Names stay in the
+# shared page cache through the mapping; only the id columns are copied.
+_worker = {}
+
+
+def make_check(mode, pattern):
+    if mode == 'substring':
+        return lambda text: pattern in text.lower()
+    if mode == 'search':
+        return pattern.search
+    return pattern.match
+
+
+def _open_store(path, token):
+    if _worker.get('token') != token:
+        _worker.clear()
+        stat = os.stat(path)
+        if (stat.st_mtime_ns, stat.st_size) != token:
+            raise ValueError("index file changed since the query was issued")
+        store = PathStore()
+        read_segment(path, store, with_postings=False)
+        _worker['token'] = token
+        _worker['store'] = store
+    return _worker['store']
+
+
+def scan_names(path, token, shard, shards, mode, pattern):
+    # Name ids of this shard whose name passes the check.
+    store = _open_store(path, token)
+    check = make_check(mode, pattern)
+    names = store.names
+    return [name_id for name_id in range(shard, len(names), shards) if check(names[name_id])]
+
+
+def scan_paths(path, token, shard, shards, mode, pattern):
+    # File ids of this shard whose full path passes the check. Paths are
+    # checked with '/' separators, like the in-process search does.
+    store = _open_store(path, token)
+    dir_paths = _worker.get('dir_paths')
+    if dir_paths is None:
+        dir_paths = _worker['dir_paths'] = [dir_path.replace('\\', '/') for dir_path in store.all_dir_paths()]
+    check = make_check(mode, pattern)
+    names, file_dir, file_name = store.names, store.file_dir, store.file_name
+    matches = []
+    for file_id in range(shard, len(file_name), shards):
+        name_id = file_name[file_id]
+        if name_id != NO_ID:
+            dir_path = dir_paths[file_dir[file_id]]
+            separator = '' if dir_path.endswith('/') else '/'
+            if check(dir_path + separator + names[name_id]):
+                matches.append(file_id)
+    return matches
+
+
+class ShardExecutor:
+    # Fans full scans out to a process pool. Shard k of N covers the ids
+    # congruent to k modulo N, and every worker reads the saved segment instead
+    # of receiving a copy of the index. Returns None whenever the scan should
+    # run in-process instead: no pool configured, too little to scan, or
+    # changes in memory that the segment on disk does not have yet.
+    def __init__(self, store, path, workers, min_rows):
+        self.store = store
+        self.path = path
+        self.workers = workers
+        self.min_rows = min_rows
+        self.saved_generation = None
+        self.token = None
+        self._pool = None
+
+    def mark_saved(self):
+        # Called whenever memory and the segment file are known to agree.
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self.token = None
+            return
+        self.saved_generation = self.store.generation
+        self.token = (stat.st_mtime_ns, stat.st_size)
+
+    def copy_saved(self, other):
+        # For a copy of other's store: it matches the segment when other did.
+        if other.token is not None and other.saved_generation == other.store.generation:
+            self.mark_saved()
+
+    def available(self, rows):
+        return (self.workers > 1 and rows >= self.min_rows and self.token is not None
+                and self.saved_generation == self.store.generation)
+
+    def _run(self, task, mode, pattern):
+        if self._pool is None:
+            # Workers are spawned rather than forked: the watcher and scanner
+            # threads may be holding locks at the time of the fork.
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        futures = [self._pool.submit(task, self.path, self.token, shard, self.workers, mode, pattern)
+                   for shard in range(self.workers)]
+        try:
+            return list(heapq.merge(*(future.result() for future in futures)))
+        except BrokenProcessPool:
+            print("Query workers stopped unexpectedly; searching in-process instead.")
+            self.shutdown()
+            self.workers = 0
+            return None
+        except (ValueError, OSError):
+            return None
+
+    def scan_names(self, mode, pattern):
+        if not self.available(len(self.store.names)):
+            return None
+        return self._run(scan_names, mode, pattern)
+
+    def scan_paths(self, mode, pattern):
+        if not self.available(len(self.store.file_name)):
+            return None
+        return self._run(scan_paths, mode, pattern)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
@@ -0,0 +1,414 @@
+import os
+from array import array
+from core.segment import STORE_ARRAYS, StringTable
+
+NO_ID = -1
+# Bits of the file_kind column.
+KIND_LINK = 1
+KIND_EXEC = 2
+
+
+def id_array(values=()):
+    return array('i', values)
+
+
+def int64_array(values=()):
+    return array('q', values)
+
+
+def kind_array(values=()):
+    return array('B', values)
+
+
+class StoreListener:
+    # Secondary indexes subscribe to store changes through these hooks.
+    # Names and directories are never removed from the store, only folders
+    # and files, so most indexes just grow.
+    def clear(self):
+        pass
+
+    def name_added(self, name_id, name):
+        pass
+
+    def dir_added(self, dir_id, dir_path):
+        pass
+
+    def files_added(self, file_ids):
+        pass
+
+    def file_removed(self, file_id):
+        pass
+
+    def folder_added(self, dir_id):
+        pass
+
+    def folder_removed(self, dir_id):
+        pass
+
+    def dir_scanned(self, dir_id):
+        pass
+
+    def file_stat_changed(self, file_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def posting_lists(self):
+        return {}
+
+    def load_posting_lists(self, postings):
+        return True
+
+
+class PathStore:
+    # Columnar file/folder store. Directories are interned as (parent id, name id)
+    # pairs so shared prefixes are stored once, files are two integers, and the
+    # per-name and per-directory chains are singly linked lists threaded through
+    # integer arrays. Full paths are only rebuilt for results.
+    def __init__(self):
+        self.listeners = []
+        # Bumped on every change, so readers of a saved copy can tell whether
+        # it still matches memory.
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        self.names = StringTable()
+        self._name_ids = {}
+        self.name_files = id_array()
+        self.name_folders = id_array()
+
+        self.dir_parent = id_array()
+        self.dir_name = id_array()
+        self.dir_files = id_array()
+        self.dir_next_folder = id_array()
+        self.dir_child = id_array()
+        self.dir_next_sibling = id_array()
+        self.dir_mtime = int64_array()
+        self.folder_flags = bytearray()
+        self._dir_keys = {}
+
+        self.file_dir = id_array()
+        self.file_name = id_array()
+        self.file_next_name = id_array()
+        self.file_next_dir = id_array()
+        # Size, mtime and kind bits as last seen by a scan; NO_ID sizes and
+        # mtimes were never seen.
+        self.file_size = int64_array()
+        self.file_mtime = int64_array()
+        self.file_kind = kind_array()
+
+        self.file_count = 0
+        self.folder_count = 0
+        self.generation += 1
+        self._last_dir = (None, NO_ID)
+        for listener in self.listeners:
+            listener.clear()
+
+    # The lookup dicts are only needed to intern or resolve paths, so a freshly
+    # loaded segment builds them on first use instead of at startup.
+    @property
+    def name_ids(self):
+        if self._name_ids is None:
+            self._name_ids = {name: i for i, name in enumerate(self.names)}
+        return self._name_ids
+
+    @property
+    def dir_keys(self):
+        if self._dir_keys is None:
+            self._dir_keys = {(parent_id << 32) | name_id: i
+                              for i, (parent_id, name_id) in enumerate(zip(self.dir_parent, self.dir_name))}
+        return self._dir_keys
+
+    def intern_name(self, name):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self.name_ids[name] = name_id
+            self.name_files.append(NO_ID)
+            self.name_folders.append(NO_ID)
+            for listener in self.listeners:
+                listener.name_added(name_id, name)
+        return name_id
+
+    def intern_dir(self, path):
+        last_path, last_id = self._last_dir
+        if path == last_path:
+            return last_id
+        head, tail = os.path.split(path)
+        if not tail:
+            if head != path:
+                return self.intern_dir(head)
+            parent_id, tail = NO_ID, path
+        else:
+            parent_id = self.intern_dir(head)
+        name_id = self.intern_name(tail)
+        key = (parent_id << 32) | name_id
+        dir_id = self.dir_keys.get(key)
+        if dir_id is None:
+            dir_id = len(self.dir_parent)
+            self.dir_keys[key] = dir_id
+            self.dir_parent.append(parent_id)
+            self.dir_name.append(name_id)
+            self.dir_files.append(NO_ID)
+            self.dir_next_folder.append(NO_ID)
+            self.dir_child.append(NO_ID)
+            self.dir_next_sibling.append(NO_ID)
+            self.dir_mtime.append(NO_ID)
+            self.folder_flags.append(0)
+            if parent_id != NO_ID:
+                self.dir_next_sibling[dir_id] = self.dir_child[parent_id]
+                self.dir_child[parent_id] = dir_id
+            for listener in self.listeners:
+                listener.dir_added(dir_id, path)
+        self._last_dir = (path, dir_id)
+        return dir_id
+
+    def find_dir(self, path):
+        head, tail = os.path.split(path)
+        if not tail:
+            if head != path:
+                return self.find_dir(head)
+            parent_id, tail = NO_ID, path
+        else:
+            parent_id = self.find_dir(head)
+            if parent_id == NO_ID:
+                return NO_ID
+        name_id = self.name_ids.get(tail)
+        if name_id is None:
+            return NO_ID
+        return self.dir_keys.get((parent_id << 32) | name_id, NO_ID)
+
+    def dir_path(self, dir_id):
+        parts = []
+        while dir_id != NO_ID:
+            parts.append(self.names[self.dir_name[dir_id]])
+            dir_id = self.dir_parent[dir_id]
+        parts.reverse()
+        return os.path.join(*parts)
+
+    def all_dir_paths(self):
+        # Parents are always interned before their children, so one forward pass
+        # resolves every directory path.
+        paths = []
+        names = self.names
+        for parent_id, name_id in zip(self.dir_parent, self.dir_name):
+            if parent_id == NO_ID:
+                paths.append(names[name_id])
+            else:
+                paths.append(os.path.join(paths[parent_id], names[name_id]))
+        return paths
+
+    def add_file(self, name, file_path, size=NO_ID, mtime=NO_ID, kind=0):
+        file_id = self._link_file(self.intern_dir(os.path.dirname(file_path)), self.intern_name(name),
+                                  size, mtime, kind)
+        for listener in self.listeners:
+            listener.files_added(range(file_id, file_id + 1))
+        return file_id
+
+    def add_files(self, dir_path, names, file_stats=None):
+        dir_id = self.intern_dir(dir_path)
+        first = len(self.file_dir)
+        if file_stats is None:
+            for name in names:
+                self._link_file(dir_id, self.intern_name(name), NO_ID, NO_ID, 0)
+        else:
+            for name, (size, mtime, kind) in zip(names, file_stats):
+                self._link_file(dir_id, self.intern_name(name), size, mtime, kind)
+        # Files added together get consecutive ids.
+        for listener in self.listeners:
+            listener.files_added(range(first, len(self.file_dir)))
+        return dir_id
+
+    def _link_file(self, dir_id, name_id, size, mtime, kind):
+        file_id = len(self.file_dir)
+        self.file_dir.append(dir_id)
+        self.file_name.append(name_id)
+        self.file_next_name.append(self.name_files[name_id])
+        self.file_next_dir.append(self.dir_files[dir_id])
+        self.file_size.append(size)
+        self.file_mtime.append(mtime)
+        self.file_kind.append(kind)
+        self.name_files[name_id] = file_id
+        self.dir_files[dir_id] = file_id
+        self.file_count += 1
+        self.generation += 1
+        return file_id
+
+    def set_file_stat(self, file_id, size, mtime, kind=None):
+        # Not a structural change, so the generation stays put.
+        if kind is None:
+            kind = self.file_kind[file_id]
+        if (self.file_size[file_id], self.file_mtime[file_id], self.file_kind[file_id]) == (size, mtime, kind):
+            return
+        self.file_size[file_id] = size
+        self.file_mtime[file_id] = mtime
+        self.file_kind[file_id] = kind
+        for listener in self.listeners:
+            listener.file_stat_changed(file_id)
+
+    def set_dir_mtime(self, dir_id, mtime):
+        self.dir_mtime[dir_id] = mtime
+        for listener in self.listeners:
+            listener.dir_scanned(dir_id)
+
+    def add_folder(self, folder_path):
+        dir_id = self.intern_dir(folder_path)
+        if not self.folder_flags[dir_id]:
+            name_id = self.dir_name[dir_id]
+            self.folder_flags[dir_id] = 1
+            self.dir_next_folder[dir_id] = self.name_folders[name_id]
+            self.name_folders[name_id] = dir_id
+            self.folder_count += 1
+            self.generation += 1
+            for listener in self.listeners:
+                listener.folder_added(dir_id)
+        return dir_id
+
+    def find_file(self, file_path):
+        dir_id = self.find_dir(os.path.dirname(file_path))
+        name_id = self.name_ids.get(os.path.basename(file_path))
+        if dir_id == NO_ID or name_id is None:
+            return NO_ID
+        for file_id in self.files_in_dir(dir_id):
+            if self.file_name[file_id] == name_id:
+                return file_id
+        return NO_ID
+
+    def remove_file(self, file_id):
+        name_id = self.file_name[file_id]
+        if name_id == NO_ID:
+            return
+        for listener in self.listeners:
+            listener.file_removed(file_id)
+        _unlink(self.name_files, name_id, self.file_next_name, file_id)
+        _unlink(self.dir_files, self.file_dir[file_id], self.file_next_dir, file_id)
+        self.file_name[file_id] = NO_ID
+        self.file_count -= 1
+        self.generation += 1
+
+    def remove_folder(self, dir_id):
+        if not self.folder_flags[dir_id]:
+            return
+        _unlink(self.name_folders, self.dir_name[dir_id], self.dir_next_folder, dir_id)
+        self.folder_flags[dir_id] = 0
+        self.folder_count -= 1
+        self.generation += 1
+        for listener in self.listeners:
+            listener.folder_removed(dir_id)
+
+    def remove_subtree(self, dir_id):
+        # Directory ids stay interned so a re-created folder reuses them; only
+        # its files, folder flag and recorded mtime are dropped.
+        removed = 0
+        stack = [dir_id]
+        while stack:
+            current = stack.pop()
+            for file_id in list(self.files_in_dir(current)):
+                self.remove_file(file_id)
+                removed += 1
+            self.remove_folder(current)
+            if self.dir_mtime[current] != NO_ID:
+                self.set_dir_mtime(current, NO_ID)
+            stack.extend(self.child_dirs(current))
+        return removed
+
+    def child_dirs(self, dir_id):
+        return _walk(self.dir_child[dir_id], self.dir_next_sibling)
+
+    def subtree_dirs(self, dir_id):
+        # Parents precede their children, so membership settles in one pass.
+        inside = bytearray(len(self.dir_parent))
+        inside[dir_id] = 1
+        for child_id in range(dir_id + 1, len(self.dir_parent)):
+            parent_id = self.dir_parent[child_id]
+            if parent_id != NO_ID and inside[parent_id]:
+                inside[child_id] = 1
+        return [i for i in range(dir_id, len(inside)) if inside[i]]
+
+    def files_named(self, name_id):
+        return _walk(self.name_files[name_id], self.file_next_name)
+
+    def files_in_dir(self, dir_id):
+        return _walk(self.dir_files[dir_id], self.file_next_dir)
+
+    def folders_named(self, name_id):
+        return _walk(self.name_folders[name_id], self.dir_next_folder)
+
+    def file_path(self, file_id):
+        return os.path.join(self.dir_path(self.file_dir[file_id]), self.names[self.file_name[file_id]])
+
+    def iter_files(self):
+        for file_id, name_id in enumerate(self.file_name):
+            if name_id != NO_ID:
+                yield file_id
+
+    def iter_folders(self):
+        for dir_id, flag in enumerate(self.folder_flags):
+            if flag:
+                yield dir_id
+
+    def file_names(self):
+        return sum(1 for head in self.name_files if head != NO_ID)
+
+    def folder_names(self):
+        return sum(1 for head in self.name_folders if head != NO_ID)
+
+    def copy_from(self, other):
+        # Replaces the contents with a copy of another store's, lookup dicts
+        # included.
+        self.load_columns(other.names.copy(), {attr: getattr(other, attr)[:] for attr in STORE_ARRAYS},
+                          bytearray(other.folder_flags))
+        if other._name_ids is not None:
+            self._name_ids = dict(other._name_ids)
+        if other._dir_keys is not None:
+            self._dir_keys = dict(other._dir_keys)
+
+    def load_columns(self, names, arrays, folder_flags):
+        self.clear()
+        self.names = names
+        self._name_ids = None
+        self._dir_keys = None
+        for attr, values in arrays.items():
+            setattr(self, attr, values)
+        self.folder_flags = folder_flags
+        dir_total = len(self.dir_parent)
+        if len(self.dir_child) != dir_total:
+            # Older indexes carry no child links or mtimes, so every directory
+            # counts as unscanned until the next reindex visits it.
+            self.dir_child = id_array([NO_ID]) * dir_total
+            self.dir_next_sibling = id_array([NO_ID]) * dir_total
+            self.dir_mtime = int64_array([NO_ID]) * dir_total
+            for dir_id, parent_id in enumerate(self.dir_parent):
+                if parent_id != NO_ID:
+                    self.dir_next_sibling[dir_id] = self.dir_child[parent_id]
+                    self.dir_child[parent_id] = dir_id
+        if len(self.file_size) != len(self.file_name):
+            # Sizes and mtimes are unknown until a scan or stat fills them in.
+            self.file_size = int64_array([NO_ID]) * len(self.file_name)
+            self.file_mtime = int64_array([NO_ID]) * len(self.file_name)
+        if len(self.file_kind) != len(self.file_name):
+            self.file_kind = kind_array([0]) * len(self.file_name)
+        self.file_count = len(self.file_name) - self.file_name.count(NO_ID)
+        self.folder_count = self.folder_flags.count(1)
+
+
+def _walk(item_id, next_ids):
+    while item_id != NO_ID:
+        yield item_id
+        item_id = next_ids[item_id]
+
+
+def _unlink(heads, head_id, next_ids, item_id):
+    current = heads[head_id]
+    if current == item_id:
+        heads[head_id] = next_ids[item_id]
+        return
+    while current != NO_ID:
+        following = next_ids[current]
+        if following == item_id:
+            next_ids[current] = next_ids[item_id]
+            return
+        current = following
@@ -0,0 +1,98 @@
+from core.store import StoreListener
+
+SEPARATORS = ('/', '\\')
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def intersect_postings(postings, grams):
+    lists = []
+    for gram in grams:
+        ids = postings.get(gram)
+        if not ids:
+            return set()
+        lists.append(ids)
+    lists.sort(key=len)
+    result = set(lists[0])
+    for ids in lists[1:]:
+        result.intersection_update(ids)
+        if not result:
+            break
+    return result
+
+
+def last_separator(text):
+    return max(text.rfind(sep) for sep in SEPARATORS)
+
+
+class TrigramIndex(StoreListener):
+    # Posting lists over the store's name and directory tables. Both tables are
+    # append-only, so ids grow monotonically and every list stays sorted.
+    def __init__(self, store):
+        self.store = store
+        self.clear()
+
+    def clear(self):
+        self.name_postings = {}
+        self.dir_postings = {}
+
+    def name_added(self, name_id, name):
+        for gram in trigrams(name.lower()):
+            self.name_postings.setdefault(gram, []).append(name_id)
+
+    def dir_added(self, dir_id, dir_path):
+        for gram in trigrams(dir_path.lower()):
+            self.dir_postings.setdefault(gram, []).append(dir_id)
+
+    def rebuild(self):
+        self.clear()
+        for name_id, name in enumerate(self.store.names):
+            self.name_added(name_id, name)
+        for dir_id, dir_path in enumerate(self.store.all_dir_paths()):
+            self.dir_added(dir_id, dir_path)
+
+    def match_names(self, query_lower):
+        names = self.store.names
+        if len(query_lower) < 3:
+            candidates = range(len(names))
+        else:
+            candidates = sorted(intersect_postings(self.name_postings, trigrams(query_lower)))
+        return [i for i in candidates if query_lower in names[i].lower()]
+
+    def match_dirs(self, query_lower, suffix=False):
+        store = self.store
+        if len(query_lower) < 3:
+            if suffix:
+                paths = enumerate(store.all_dir_paths())
+                return [i for i, path in paths if path.lower().endswith(query_lower)]
+            candidates = range(len(store.dir_parent))
+        else:
+            candidates = sorted(intersect_postings(self.dir_postings, trigrams(query_lower)))
+        dir_path = store.dir_path
+        if suffix:
+            return [i for i in candidates if dir_path(i).lower().endswith(query_lower)]
+        # Parents precede children, so a directory whose parent matched is a
+        # match without rebuilding its path. Otherwise a query without
+        # separators can only occur inside the directory's own name.
+        names, dir_name, dir_parent = store.names, store.dir_name, store.dir_parent
+        spans = last_separator(query_lower) >= 0
+        matched = set()
+        result = []
+        for i in candidates:
+            if dir_parent[i] in matched or (
+                    query_lower in dir_path(i).lower() if spans else query_lower in names[dir_name[i]].lower()):
+                matched.add(i)
+                result.append(i)
+        return result
+
+    def posting_lists(self):
+        return {"name": self.name_postings, "dir": self.dir_postings}
+
+    def load_posting_lists(self, postings):
+        if "name" not in postings or "dir" not in postings:
+            return False
+        self.name_postings = postings["name"]
+        self.dir_postings = postings["dir"]
+        return True
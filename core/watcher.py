@@ -0,0 +1,226 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from core.reindex import find_changed_dirs, refresh_dirs
+from core.store import NO_ID
+from utlis.config import (SCAN_WORKERS, WATCH_BATCH_INTERVAL, WATCH_POLL_INTERVAL,
+                          WATCH_PERSIST_INTERVAL, index_lock)
+from utlis.save import save_data
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.paths = {}
+
+    def add(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), path)
+        # Watching an inode twice returns the same descriptor, so a renamed
+        # directory simply has its path updated here.
+        self.paths[wd] = path
+
+    def read(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size + length
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+            events.append((self.paths.get(wd), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class IndexWatcher:
+    # Keeps one loaded root in sync with its folder. inotify only tells us
+    # which directories changed; those directories are then relisted and diffed
+    # the same way reindex does it. Without inotify the mtime check runs on a
+    # timer.
+    def __init__(self, root):
+        self.root = root
+        self.path = root.path
+        self.mode = None
+        self.events = 0
+        self.batches = 0
+        self.added = 0
+        self.removed = 0
+        self.last_persist = None
+        self._notifier = None
+        self._dirty = set()
+        self._unsaved = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        try:
+            self._notifier = Inotify()
+            self.mode = 'inotify'
+        except (OSError, AttributeError, TypeError):
+            self.mode = 'polling'
+        self._thread = threading.Thread(target=self._run, name=f'index-watcher-{self.root.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._notifier is not None:
+            self._notifier.close()
+            self._notifier = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+            if self.mode == 'inotify':
+                self._watch_all()
+            next_persist = time.monotonic() + WATCH_PERSIST_INTERVAL
+            while not self._stop.is_set():
+                if self.mode == 'inotify':
+                    self._collect(WATCH_BATCH_INTERVAL)
+                    if self._dirty:
+                        self._apply_dirty(executor)
+                elif not self._stop.wait(WATCH_POLL_INTERVAL):
+                    self._poll(executor)
+                if self._unsaved and time.monotonic() >= next_persist:
+                    self._persist()
+                    next_persist = time.monotonic() + WATCH_PERSIST_INTERVAL
+            if self._unsaved:
+                self._persist()
+
+    def _watch_all(self):
+        store = self.root.store
+        with index_lock:
+            root_id = store.find_dir(self.path)
+            if root_id == NO_ID:
+                return
+            dir_paths = store.all_dir_paths()
+            watched = [dir_paths[dir_id] for dir_id in store.subtree_dirs(root_id)
+                       if dir_id == root_id or store.folder_flags[dir_id]]
+        for dir_path in watched:
+            if not self._add_watch(dir_path):
+                return
+
+    def _add_watch(self, dir_path):
+        try:
+            self._notifier.add(dir_path)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                # Out of inotify watches: fall back to polling the whole tree.
+                self._notifier.close()
+                self._notifier = None
+                self.mode = 'polling'
+                return False
+        return True
+
+    def _watch_new(self, dir_path, mtime):
+        if self._notifier is None or not self._add_watch(dir_path):
+            return
+        # Entries created between the listing and the new watch would be
+        # missed, so relist the directory if it changed in that window.
+        try:
+            if os.stat(dir_path).st_mtime_ns != mtime:
+                self._dirty.add(dir_path)
+        except OSError:
+            pass
+
+    def _collect(self, window):
+        deadline = time.monotonic() + window
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._notifier is None:
+                return
+            for dir_path, mask in self._notifier.read(remaining):
+                self.events += 1
+                if mask & IN_Q_OVERFLOW:
+                    self._dirty.add(None)
+                elif dir_path is not None and not mask & IN_IGNORED:
+                    self._dirty.add(dir_path)
+
+    def _apply_dirty(self, executor):
+        dirty, self._dirty = self._dirty, set()
+        if None in dirty:
+            self._poll(executor)
+            return
+        store = self.root.store
+        with index_lock:
+            root_id = store.find_dir(self.path)
+            changed = []
+            for dir_path in dirty:
+                dir_id = store.find_dir(dir_path)
+                if dir_id != NO_ID and (dir_id == root_id or store.folder_flags[dir_id]):
+                    changed.append((dir_id, dir_path))
+        # The watcher is the only writer of a loaded root's store, so the ids
+        # stay valid after the lock is released; refresh_dirs takes it again
+        # only to apply what it found on disk.
+        self._record(*refresh_dirs(store, changed, executor, self.root.rules, on_dir=self._watch_new,
+                                   lock=index_lock))
+
+    def _poll(self, executor):
+        store = self.root.store
+        with index_lock:
+            root_id = store.find_dir(self.path)
+        if root_id == NO_ID:
+            return
+        changed, removed, _ = find_changed_dirs(store, root_id, executor, lock=index_lock)
+        added, more_removed = refresh_dirs(store, changed, executor, self.root.rules, on_dir=self._watch_new,
+                                           lock=index_lock)
+        self._record(added, removed + more_removed)
+
+    def _record(self, added, removed):
+        self.batches += 1
+        self.added += added
+        self.removed += removed
+        if added or removed:
+            self._unsaved = True
+        content_index = self.root.content_index
+        if content_index.enabled and content_index.pending:
+            try:
+                content_index.update(check_existing=False, lock=index_lock)
+            except Exception as e:
+                print(f"\nWatcher could not index file contents: {e}")
+
+    def _persist(self):
+        with index_lock:
+            try:
+                save_data(self.root)
+                self._unsaved = False
+                self.last_persist = time.strftime("%Y-%m-%d %H:%M:%S")
+            except Exception as e:
+                print(f"\nWatcher could not save root '{self.root.name}': {e}")
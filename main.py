@@ -1,5 +1,75 @@
+import argparse
 import asyncio
+import sys
+from utlis.config import SEARCH_LIMIT, SERVER_HOST, SERVER_PORT
+from utlis.cli import FORMATS, QUERIES, run_cli
 from utlis.console import run_console
+from utlis.server import run_server
+
+def patterns(text):
+    return [pattern.strip() for pattern in text.split(',') if pattern.strip()]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fast file indexing and search engine")
+    commands = parser.add_subparsers(dest='command')
+    serve = commands.add_parser('serve', help="answer queries over HTTP or a unix socket")
+    serve.add_argument('--host', default=SERVER_HOST)
+    serve.add_argument('--port', type=int, default=SERVER_PORT)
+    serve.add_argument('--unix', metavar='PATH', help="listen on a unix socket instead of TCP")
+
+    # Shared by every command that prints results.
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('--limit', type=int, default=SEARCH_LIMIT,
+                        help=f"results per query (default {SEARCH_LIMIT}, 0 for all)")
+    output.add_argument('--all', action='store_true', help="return every result")
+    output.add_argument('--root', metavar='A,B', help="only search these roots")
+    output.add_argument('--format', choices=FORMATS, default='plain',
+                        help="one path per line, NUL-terminated paths or JSON lines")
+    output.add_argument('-0', dest='format', action='store_const', const='null', help="same as --format null")
+    output.add_argument('--line-buffered', action='store_true', help="flush after every query")
+    for name, help_text in (('search', "find files by name"),
+                            ('folders', "find folders by name"),
+                            ('exsearch', "find files by extension"),
+                            ('filter', "find files by metadata, e.g. 'size>1G mtime<7d'"),
+                            ('grep', "find files by contents")):
+        command = commands.add_parser(name, parents=[output], help=help_text)
+        command.add_argument('query', nargs='+')
+        command.add_argument('--page', type=int, default=1)
+        if name == 'search':
+            # The console's search modes.
+            modes = command.add_mutually_exclusive_group()
+            for flag, long_flag, mode_help in (('-f', '--folders', "folders below folders matching the name"),
+                                               ('-s', '--names', "files and folders by name"),
+                                               ('-z', '--fuzzy', "typo-tolerant name matches"),
+                                               ('-g', '--glob', "the query is a glob pattern"),
+                                               ('-r', '--regex', "the query is a regular expression")):
+                modes.add_argument(flag, long_flag, dest='mode', action='store_const', const=flag, help=mode_help)
+            command.add_argument('--in', dest='scope', metavar='FOLDER',
+                                 help="with -g or -r, only match below this folder")
+    batch = commands.add_parser('batch', parents=[output],
+                                help="run one query per line from a file or stdin against one loaded index")
+    batch.add_argument('file', nargs='?', help="file with queries (default: stdin)")
+
+    index = commands.add_parser('index', help="build a root per path")
+    index.add_argument('paths', nargs='+')
+    index.add_argument('--name', help="root name, for a single path")
+    index.add_argument('--exclude', type=patterns, default=[], help="comma-separated patterns to leave out")
+    index.add_argument('--include', type=patterns, default=[], help="comma-separated patterns to keep anyway")
+    index.add_argument('--gitignore', action=argparse.BooleanOptionalAction, default=None,
+                       help="honor .gitignore files inside the root")
+    reindex = commands.add_parser('reindex', help="bring roots up to date")
+    reindex.add_argument('path', nargs='?', help="only the part of its root below this path")
+    reindex.add_argument('--root', metavar='A,B', help="only these roots")
+    return parser.parse_args()
 
 if __name__ == '__main__':
-    asyncio.run(run_console())
+    args = parse_args()
+    try:
+        if args.command == 'serve':
+            asyncio.run(run_server(args.host, args.port, args.unix))
+        elif args.command in QUERIES or args.command in ('batch', 'index', 'reindex'):
+            sys.exit(asyncio.run(run_cli(args)))
+        else:
+            asyncio.run(run_console())
+    except KeyboardInterrupt:
+        pass
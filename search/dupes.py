@@ -0,0 +1,29 @@
+import time
+from core.dupes import find_duplicates
+from utlis.config import DUPES_BLOCK, DUPES_WORKERS, hash_cache, metrics
+from utlis.roots import roots, select_roots, total_files
+
+async def search_dupes(min_size=1, root_names=None):
+    try:
+        selected = select_roots(root_names)
+    except ValueError as e:
+        print(f"Invalid root: {e}")
+        return []
+    if not total_files(selected):
+        print("No index loaded.")
+        return []
+    start_time = time.perf_counter()
+    # Copies are found across every selected root. Cached hashes of roots
+    # left out are kept.
+    groups, stats = find_duplicates([root.store for root in selected], hash_cache, DUPES_WORKERS, DUPES_BLOCK,
+                                    min_size, prune=len(selected) == len(roots))
+    try:
+        hash_cache.save()
+    except OSError as e:
+        print(f"Could not save the hash cache: {e}")
+    search_time = metrics.observe('dupes', start_time)
+    metrics.report(f"Duplicate search completed in {search_time:.4f}s. Found {len(groups)} groups.")
+    metrics.report(f"  same size: {stats['size_candidates']}, partial hashes: {stats['partial_hashed']}, "
+                   f"full candidates: {stats['full_candidates']}, full hashes: {stats['full_hashed']}, "
+                   f"cached: {stats['cache_hits']}")
+    return groups
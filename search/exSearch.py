@@ -1,20 +1,37 @@
-import asyncio
-from utlis.config import file_index
+import re
+from search.rank import file_page, root_lengths, root_tiers, top_ranked
+from utlis.config import metrics, query_cache
+from utlis.roots import select_roots, total_files
 import time
-async def search_ext(extension):
-    if not file_index:
+def ext_files(root, exts):
+    name_ids = []
+    for ext in exts:
+        name_ids.extend(root.ext_index.match(ext))
+    return [(file_id for name_id in name_ids for file_id in root.store.files_named(name_id))]
+
+async def search_ext(extension, limit=None, page=1, root_names=None):
+    try:
+        selected = select_roots(root_names)
+    except ValueError as e:
+        print(f"Invalid root: {e}")
+        return []
+    if not total_files(selected):
         print("No index loaded.")
         return []
-    start_time = time.time()
-    paths = []
-    ext_lower = extension.lower()
-    if not ext_lower.startswith('.'):
-        ext_lower = '.' + ext_lower
-    for filename in file_index:
-        if filename.lower().endswith(ext_lower):
-            for filepath in file_index[filename]:
-               paths.append(filepath)
-        await asyncio.sleep(0)
-    search_time = time.time() - start_time
-    print(f"Extension search completed in {search_time:.4f}s")
-    return paths
\ No newline at end of file
+    start_time = time.perf_counter()
+    # Several extensions can be given at once, e.g. ".jpg,.png" or "jpg png".
+    exts = tuple(sorted({ext if ext.startswith('.') else '.' + ext
+                   for ext in re.split(r'[,\s]+', extension.lower()) if ext}))
+    key = ('exsearch', exts, limit, page, tuple(root.name for root in selected))
+    paths = query_cache.get(key)
+    if paths is not None:
+        metrics.report(f"Served from cache in {metrics.observe('cached', start_time):.4f}s")
+        return paths
+    file_length, _ = root_lengths(selected)
+    tiers = root_tiers(selected, lambda root: ext_files(root, exts))
+    file_ids, offset, more = top_ranked(tiers, file_length, limit, page)
+    paths = file_page(file_ids, offset, more)
+    query_cache.put(key, paths, lambda is_file, name, path: is_file and name.lower().endswith(exts))
+    search_time = metrics.observe('extension', start_time)
+    metrics.report(f"Extension search completed in {search_time:.4f}s")
+    return paths
@@ -0,0 +1,116 @@
+import re
+import time
+from core.columns import select_files
+from core.store import KIND_EXEC, KIND_LINK
+from search.rank import file_page, root_lengths, root_tiers, top_ranked
+from utlis.config import metrics
+from utlis.roots import select_roots, total_files
+
+COMPARISON = re.compile(r'(size|mtime)(<=|>=|<|>|=)(.+)')
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+AGE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400, 'y': 365 * 86400}
+DAY_NS = 86400 * 10 ** 9
+# An age turns the comparison around: "mtime<7d" means newer than a week ago.
+FLIPPED = {'<': '>', '<=': '>=', '>': '<', '>=': '<='}
+KINDS = {
+    'link': ('file_kind', '&', KIND_LINK),
+    'exec': ('file_kind', '&', KIND_EXEC),
+    'file': ('file_kind', '!&', KIND_LINK),
+}
+
+def parse_size(text):
+    # "512", "10K", "1.5G" -> bytes.
+    text = text.strip().upper().removesuffix('B')
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * SIZE_UNITS[unit])
+
+def mtime_conditions(op, text, now):
+    age = re.fullmatch(r'(\d+(?:\.\d+)?)([smhdwy])', text.lower())
+    if age:
+        if op == '=':
+            raise ValueError("an age needs <, <=, > or >=, e.g. mtime<7d")
+        seconds = float(age.group(1)) * AGE_UNITS[age.group(2)]
+        return [('file_mtime', FLIPPED[op], int((now - seconds) * 10 ** 9))]
+    try:
+        day = int(time.mktime(time.strptime(text, '%Y-%m-%d')) * 10 ** 9)
+    except ValueError:
+        raise ValueError(f"invalid time '{text}', use an age like 7d or a date like 2024-01-31")
+    # A date stands for the whole day.
+    if op == '=':
+        return [('file_mtime', '>=', day), ('file_mtime', '<', day + DAY_NS)]
+    if op in ('<', '>='):
+        return [('file_mtime', op, day)]
+    return [('file_mtime', '>=' if op == '>' else '<', day + DAY_NS)]
+
+def parse_filter(text, now=None):
+    # Splits "size>1G mtime<7d ext:.log report" into column conditions,
+    # extensions and the remaining name words.
+    now = time.time() if now is None else now
+    conditions = []
+    exts = []
+    words = []
+    for term in text.split():
+        comparison = COMPARISON.fullmatch(term.lower())
+        if comparison:
+            column, op, value = comparison.groups()
+            if column == 'size':
+                try:
+                    size = parse_size(value)
+                except ValueError:
+                    raise ValueError(f"invalid size '{value}', use a number like 500K or 1.5G")
+                conditions.append(('file_size', op, size))
+            else:
+                conditions.extend(mtime_conditions(op, value, now))
+        elif term.lower().startswith('ext:'):
+            exts.extend(ext if ext.startswith('.') else '.' + ext
+                        for ext in term[4:].lower().split(',') if ext)
+        elif term.lower().startswith('kind:'):
+            kind = term[5:].lower()
+            if kind not in KINDS:
+                raise ValueError(f"unknown kind '{kind}', use one of {', '.join(KINDS)}")
+            conditions.append(KINDS[kind])
+        else:
+            words.append(term.lower())
+    # Files whose size or mtime was never seen match no comparison on it.
+    for column in ('file_size', 'file_mtime'):
+        if any(condition[0] == column for condition in conditions):
+            conditions.insert(0, (column, '>=', 0))
+    return conditions, exts, words
+
+def candidate_files(root, exts, words):
+    # Files the name-based terms allow, or None when every file qualifies.
+    name_ids = None
+    if exts:
+        name_ids = {name_id for ext in exts for name_id in root.ext_index.match(ext)}
+    for word in words:
+        matched = set(root.trigram_index.match_names(word))
+        name_ids = matched if name_ids is None else name_ids & matched
+    if name_ids is None:
+        return None
+    return [file_id for name_id in name_ids for file_id in root.store.files_named(name_id)]
+
+async def search_filter(text, limit=None, page=1, root_names=None):
+    try:
+        selected = select_roots(root_names)
+    except ValueError as e:
+        print(f"Invalid root: {e}")
+        return []
+    if not total_files(selected):
+        print("No index loaded.")
+        return []
+    start_time = time.perf_counter()
+    try:
+        conditions, exts, words = parse_filter(text)
+    except ValueError as e:
+        print(f"Invalid filter: {e}")
+        return []
+    # Not cached: sizes and mtimes change without files being added or
+    # removed, which is all the result cache hears about.
+    file_length, _ = root_lengths(selected)
+    tiers = root_tiers(selected, lambda root: [select_files(root.store, conditions,
+                                                            candidate_files(root, exts, words))])
+    file_ids, offset, more = top_ranked(tiers, file_length, limit, page)
+    paths = file_page(file_ids, offset, more)
+    search_time = metrics.observe('filter', start_time)
+    metrics.report(f"Filter search completed in {search_time:.4f}s")
+    return paths
@@ -0,0 +1,48 @@
+import os
+import time
+from core.content import tokenize
+from core.store import NO_ID
+from search.rank import file_page, root_lengths, root_tiers, top_ranked
+from utlis.config import metrics
+from utlis.roots import select_roots, total_files
+
+def content_files(root, tokens, prefix):
+    # Ids of the root's files containing every token.
+    file_ids = None
+    for i, token in enumerate(tokens):
+        matches = root.content_index.lookup(token, prefix and i == len(tokens) - 1)
+        file_ids = matches if file_ids is None else file_ids & matches
+        if not file_ids:
+            return []
+    file_name = root.store.file_name
+    return [(file_id for file_id in file_ids if file_id < len(file_name) and file_name[file_id] != NO_ID)]
+
+async def search_content(term, limit=None, page=1, root_names=None):
+    try:
+        selected = select_roots(root_names)
+    except ValueError as e:
+        print(f"Invalid root: {e}")
+        return []
+    if not total_files(selected):
+        print("No index loaded.")
+        return []
+    selected = [root for root in selected
+                if root.content_index.file_state or os.path.exists(root.content_file)]
+    if not selected:
+        print("No file contents are indexed. Set PYINDEX_CONTENT_INDEX=1 and run 'index' or 'reindex'.")
+        return []
+    start_time = time.perf_counter()
+    # Every word has to occur in the file; a trailing '*' matches any word
+    # starting with the text before it.
+    prefix = term.rstrip().endswith('*')
+    tokens = tokenize(term)
+    if not tokens:
+        print("Search terms need at least two letters or digits.")
+        return []
+    file_length, _ = root_lengths(selected)
+    tiers = root_tiers(selected, lambda root: content_files(root, tokens, prefix))
+    file_ids, offset, more = top_ranked(tiers, file_length, limit, page)
+    paths = file_page(file_ids, offset, more)
+    search_time = metrics.observe('grep', start_time)
+    metrics.report(f"Content search completed in {search_time:.4f}s")
+    return paths
@@ -0,0 +1,108 @@
+import fnmatch
+import re
+from core.trigram import SEPARATORS, trigrams
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+
+def split_scope(query):
+    # "pattern --in folder" limits a pattern query to one folder's subtree.
+    pattern, _, scope = query.partition(' --in ')
+    return pattern.strip(), scope.strip() or None
+
+
+def has_separator(text):
+    return any(sep in text for sep in SEPARATORS)
+
+
+def glob_literals(pattern):
+    # The runs of plain characters between wildcards and [...] sets.
+    literals = []
+    current = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char in '*?[':
+            if current:
+                literals.append(''.join(current))
+                current = []
+            if char == '[':
+                end = pattern.find(']', i + 2)
+                if end < 0:
+                    current.append(char)
+                else:
+                    i = end
+        else:
+            current.append(char)
+        i += 1
+    if current:
+        literals.append(''.join(current))
+    return [literal.lower() for literal in literals]
+
+
+def regex_literals(pattern):
+    # Literal runs every match has to contain. Alternations, optional parts
+    # and classes end a run and contribute nothing.
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, RecursionError):
+        return []
+    literals = []
+    current = []
+
+    def flush():
+        if current:
+            literals.append(''.join(current).lower())
+            current.clear()
+
+    def walk(items):
+        for op, arg in items:
+            if op == sre_parse.LITERAL:
+                current.append(chr(arg))
+            elif op == sre_parse.SUBPATTERN:
+                walk(arg[-1])
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and arg[0] >= 1:
+                flush()
+                walk(arg[2])
+                flush()
+            else:
+                flush()
+
+    walk(parsed)
+    flush()
+    return literals
+
+
+def literal_grams(literals):
+    grams = set()
+    for literal in literals:
+        grams |= trigrams(literal)
+    return grams
+
+
+def compile_glob(pattern, on_path=False):
+    # A path glob that does not start at the root, like 'src/*.py', may start
+    # at any folder boundary of the path it is matched against.
+    regex = fnmatch.translate(pattern)
+    if on_path and not pattern.startswith('/'):
+        regex = '(?:.*/)?' + regex
+    return re.compile(regex, re.IGNORECASE)
+
+
+def compile_regex(pattern):
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def compile_pattern(pattern, regex):
+    # Returns the compiled pattern, the name of the method to match with, its
+    # required literals and whether it applies to full paths. Globs match the
+    # whole name, regexes anywhere in it; either is tried on the full path
+    # instead when it contains a separator.
+    if regex:
+        return compile_regex(pattern), 'search', regex_literals(pattern), '/' in pattern
+    pattern = pattern.replace('\\', '/')
+    on_path = has_separator(pattern)
+    return compile_glob(pattern, on_path), 'match', glob_literals(pattern), on_path
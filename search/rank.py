@@ -0,0 +1,96 @@
+import heapq
+from itertools import chain, zip_longest
+from core.store import NO_ID
+
+TIER_EXACT = 0
+TIER_PREFIX = 1
+TIER_NAME = 2
+TIER_PATH = 3
+
+
+class ResultPage(list):
+    # One page of ranked paths. `offset` is the rank of the first entry and
+    # `more` tells whether anything ranks after the last one.
+    def __init__(self, paths=(), offset=0, more=False):
+        super().__init__(paths)
+        self.offset = offset
+        self.more = more
+
+
+def name_tier(name_lower, query_lower):
+    if name_lower == query_lower:
+        return TIER_EXACT
+    if name_lower.startswith(query_lower):
+        return TIER_PREFIX
+    return TIER_NAME
+
+
+def top_ranked(tiers, length, limit=None, page=1):
+    # `tiers` yields one iterable of items per tier, best tier first. Items in
+    # a tier are ordered by `length` through a bounded heap, and later tiers
+    # are never generated once the requested page is full.
+    offset = (page - 1) * limit if limit else 0
+    needed = offset + limit + 1 if limit else None
+    ranked = []
+    for items in tiers:
+        if needed is None:
+            ranked.extend(sorted(items, key=length))
+            continue
+        ranked.extend(heapq.nsmallest(needed - len(ranked), items, key=length))
+        if len(ranked) >= needed:
+            break
+    if needed is None:
+        return ranked, 0, False
+    return ranked[offset:offset + limit], offset, len(ranked) >= needed
+
+
+def path_lengths(store):
+    # Path lengths from the directory tree, memoised per query, so ranking
+    # never has to build the paths it throws away.
+    dir_lengths = {}
+    names = store.names
+
+    def dir_length(dir_id):
+        length = dir_lengths.get(dir_id)
+        if length is None:
+            parent_id = store.dir_parent[dir_id]
+            length = len(names[store.dir_name[dir_id]])
+            if parent_id != NO_ID:
+                length += dir_length(parent_id) + 1
+            dir_lengths[dir_id] = length
+        return length
+
+    def file_length(file_id):
+        return dir_length(store.file_dir[file_id]) + 1 + len(names[store.file_name[file_id]])
+
+    return file_length, dir_length
+
+
+def tagged(root, tiers):
+    return (((root, item) for item in items) for items in tiers)
+
+
+def root_tiers(selected, make_tiers):
+    # Tier k of the merged ranking holds tier k of every root, each item
+    # paired with its root. Roots produce their tiers as lazily as one root
+    # alone would.
+    streams = [tagged(root, make_tiers(root)) for root in selected]
+    for tiers in zip_longest(*streams, fillvalue=()):
+        yield chain.from_iterable(tiers)
+
+
+def root_lengths(selected):
+    # path_lengths for (root, id) pairs across several roots.
+    lengths = {root: path_lengths(root.store) for root in selected}
+
+    def file_length(entry):
+        return lengths[entry[0]][0](entry[1])
+
+    def dir_length(entry):
+        return lengths[entry[0]][1](entry[1])
+
+    return file_length, dir_length
+
+
+def file_page(ranked, offset, more):
+    return ResultPage((root.store.file_path(file_id) for root, file_id in ranked), offset, more)
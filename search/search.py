@@ -1,73 +1,295 @@
 import asyncio
+import re
 import time
-from utlis.config import file_index, folder_index
-async def search_files(query):
-    if not file_index and not folder_index:
+from core.extindex import extension_key
+from core.fuzzy import edit_distance, fuzzy_key, max_distance
+from core.store import NO_ID
+from core.trigram import intersect_postings, last_separator
+from search.pattern import compile_pattern, literal_grams, split_scope
+from search.rank import ResultPage, file_page, name_tier, root_lengths, root_tiers, top_ranked
+from utlis.config import metrics, query_cache
+from utlis.roots import select_roots
+MODES = ('-f ', '-s ', '-z ', '-g ', '-r ')
+
+def split_mode(query):
+    for mode in MODES:
+        if query.startswith(mode):
+            return mode.strip(), query[len(mode):].strip()
+    return '', query.strip()
+
+def change_predicate(mode, query):
+    # Tells the result cache whether a file or folder added or removed under
+    # this name and path could show up in the results of the query.
+    query_lower = query.lower()
+    if mode == '-f':
+        return lambda is_file, name, path: not is_file and query_lower in path.lower()
+    if mode == '-s':
+        return lambda is_file, name, path: query_lower in name.lower()
+    if mode == '-z':
+        stem = fuzzy_key(query_lower)
+        max_dist = max_distance(stem)
+        return lambda is_file, name, path: is_file and edit_distance(fuzzy_key(name), stem, max_dist) <= max_dist
+    if mode in ('-g', '-r'):
+        pattern, _ = split_scope(query)
+        try:
+            matcher, method, _, on_path = compile_pattern(pattern, mode == '-r')
+        except re.error:
+            return lambda is_file, name, path: False
+        check = getattr(matcher, method)
+        if on_path:
+            return lambda is_file, name, path: is_file and check(path.replace('\\', '/')) is not None
+        return lambda is_file, name, path: is_file and check(name) is not None
+    return lambda is_file, name, path: is_file and query_lower in path.lower()
+
+async def search_files(query, limit=None, page=1, root_names=None):
+    try:
+        selected = select_roots(root_names)
+    except ValueError as e:
+        print(f"Invalid root: {e}")
+        return []
+    if not any(root.store.file_count or root.store.folder_count for root in selected):
         print("No file index found. Please run indexing first.")
         return []
 
+    mode, text = split_mode(query)
+    # Patterns keep their case: a scope folder may be case-sensitive.
+    key = ('search', mode, text if mode in ('-g', '-r') else text.lower(), limit, page,
+           tuple(root.name for root in selected))
+    start = time.perf_counter()
+    results = query_cache.get(key)
+    if results is not None:
+        metrics.observe('cached', start)
+        metrics.report(f"Served from cache. Found {len(results)} matches.")
+        return results
+    results = await run_search(selected, query, limit, page)
+    query_cache.put(key, results, change_predicate(mode, text))
+    return results
+
+async def run_search(selected, query, limit=None, page=1):
     if query.startswith('-f '):
-        return await search_folders_only(query[3:])
+        return await search_folders_only(selected, query[3:], limit, page)
     elif query.startswith('-s '):
-        return await search_both(query[3:])
+        return await search_both(selected, query[3:], limit, page)
+    elif query.startswith('-z '):
+        return await search_fuzzy(selected, query[3:], limit, page)
+    elif query.startswith('-g '):
+        return await search_pattern(selected, query[3:], False, limit, page)
+    elif query.startswith('-r '):
+        return await search_pattern(selected, query[3:], True, limit, page)
     else:
-        return await search_combined(query)
+        return await search_combined(selected, query, limit, page)
+
+def group_names(root, query_lower):
+    # Matching name ids split into exact, prefix and substring tiers.
+    tiers = ([], [], [])
+    names = root.store.names
+    name_ids = None
+    if len(query_lower) < 3:
+        # Too short for trigrams, so every name has to be looked at.
+        name_ids = root.shard_executor.scan_names('substring', query_lower)
+    if name_ids is None:
+        name_ids = root.trigram_index.match_names(query_lower)
+    for name_id in name_ids:
+        tiers[name_tier(names[name_id].lower(), query_lower)].append(name_id)
+    return tiers
+
+def folder_subtrees(root, query_lower):
+    # Only top-most matches with subfolders matter: a match nested in another
+    # lies inside its subtree already.
+    store = root.store
+    matched = {dir_id for dir_id in root.trigram_index.match_dirs(query_lower) if store.folder_flags[dir_id]}
+    tops = [dir_id for dir_id in matched
+            if store.dir_parent[dir_id] not in matched and store.dir_child[dir_id] != NO_ID]
+    return [root.folder_path_index.subtrees(tops)]
 
-async def search_folders_only(query):
-    start = time.time()
-    match_paths = []
+async def search_folders_only(selected, query, limit=None, page=1):
+    start = time.perf_counter()
     query_lower = query.lower()
 
-    for folder_name in folder_index:
-        for folder_path in folder_index[folder_name]:
-            folder_path_lower = folder_path.lower()
-            if query_lower in folder_path_lower:
-                parent_path = folder_path
-                for sub_folder_name in folder_index:
-                    for sub_folder_path in folder_index[sub_folder_name]:
-                        if sub_folder_path.lower().startswith(parent_path.lower() + '\\') or sub_folder_path.lower().startswith(parent_path.lower() + '/'):
-                            if sub_folder_path not in match_paths:
-                                match_paths.append(sub_folder_path)
-        await asyncio.sleep(0)
-
-    search_time = time.time() - start
-    print(f"Folder search completed in {search_time:.4f}s. Found {len(match_paths)} folder matches.")
+    _, dir_length = root_lengths(selected)
+    tiers = root_tiers(selected, lambda root: folder_subtrees(root, query_lower))
+    dir_ids, offset, more = top_ranked(tiers, dir_length, limit, page)
+    match_paths = ResultPage((root.store.dir_path(dir_id) for root, dir_id in dir_ids), offset, more)
+
+    search_time = metrics.observe('folders', start)
+    metrics.report(f"Folder search completed in {search_time:.4f}s. Found {len(match_paths)} folder matches.")
     return match_paths
 
-async def search_both(query):
-    start = time.time()
-    match_paths = []
+def entry_tiers(root, query_lower):
+    # Folders and files sharing the matched names, as (is_file, id) pairs.
+    store = root.store
+
+    def entries(name_ids):
+        for name_id in name_ids:
+            for dir_id in store.folders_named(name_id):
+                yield False, dir_id
+            for file_id in store.files_named(name_id):
+                yield True, file_id
+
+    return map(entries, group_names(root, query_lower))
+
+async def search_both(selected, query, limit=None, page=1):
+    start = time.perf_counter()
     query_lower = query.lower()
+    file_length, dir_length = root_lengths(selected)
 
-    for folder_name in folder_index:
-        if query_lower in folder_name.lower():
-            for folder_path in folder_index[folder_name]:
-                match_paths.append(folder_path)
+    def length(entry):
+        root, (is_file, entry_id) = entry
+        return file_length((root, entry_id)) if is_file else dir_length((root, entry_id))
 
-    for file_name in file_index:
-        if query_lower in file_name.lower():
-            for file_path in file_index[file_name]:
-                match_paths.append(file_path)
-        await asyncio.sleep(0)
+    tiers = root_tiers(selected, lambda root: entry_tiers(root, query_lower))
+    ranked, offset, more = top_ranked(tiers, length, limit, page)
+    match_paths = ResultPage((root.store.file_path(entry_id) if is_file else root.store.dir_path(entry_id)
+                              for root, (is_file, entry_id) in ranked), offset, more)
 
-    search_time = time.time() - start
-    print(f"Combined search completed in {search_time:.4f}s. Found {len(match_paths)} matches.")
+    search_time = metrics.observe('both', start)
+    metrics.report(f"Combined search completed in {search_time:.4f}s. Found {len(match_paths)} matches.")
     return match_paths
 
-async def search_combined(query):
-    start = time.time()
-    match_paths = []
+def path_matches(root, query_lower, matched_names):
+    # Files whose name does not match but whose path does. A path match either
+    # lies inside the directory part or spans the last separator, in which case
+    # the directory must end with the query's head.
+    store = root.store
+    dir_matches = [(dir_id, None) for dir_id in root.trigram_index.match_dirs(query_lower)]
+    split = last_separator(query_lower)
+    if split >= 0:
+        head, tail = query_lower[:split], query_lower[split + 1:]
+        for dir_id in root.trigram_index.match_dirs(head, suffix=True):
+            dir_matches.append((dir_id, tail))
+
+    names = store.names
+    seen = set()
+    for dir_id, tail in dir_matches:
+        for file_id in store.files_in_dir(dir_id):
+            if file_id in seen or store.file_name[file_id] in matched_names:
+                continue
+            if tail is not None:
+                if not names[store.file_name[file_id]].lower().startswith(tail):
+                    continue
+                if query_lower not in store.file_path(file_id).lower():
+                    continue
+            seen.add(file_id)
+            yield file_id
+
+def file_tiers(root, query_lower):
+    store = root.store
+    name_tiers = group_names(root, query_lower)
+    for name_ids in name_tiers:
+        yield (file_id for name_id in name_ids for file_id in store.files_named(name_id))
+    # Only reached when the name tiers did not fill the page.
+    yield path_matches(root, query_lower, {name_id for name_ids in name_tiers for name_id in name_ids})
+
+async def search_combined(selected, query, limit=None, page=1):
+    start = time.perf_counter()
     query_lower = query.lower()
 
-    for file in file_index:
-        for file_path in file_index[file]:
-            file_path_lower = file_path.lower()
-            if query_lower in file.lower():
-                match_paths.append(file_path)
-            elif query_lower in file_path_lower:
-                match_paths.append(file_path)
-        await asyncio.sleep(0)
-
-    search_time = time.time() - start
-    print(f"Search completed in {search_time:.4f}s. Found {len(match_paths)} matches.")
+    file_length, _ = root_lengths(selected)
+    tiers = root_tiers(selected, lambda root: file_tiers(root, query_lower))
+    file_ids, offset, more = top_ranked(tiers, file_length, limit, page)
+    await asyncio.sleep(0)
+    match_paths = file_page(file_ids, offset, more)
+
+    search_time = metrics.observe('substring', start)
+    metrics.report(f"Search completed in {search_time:.4f}s. Found {len(match_paths)} matches.")
+    return match_paths
+
+def fuzzy_tiers(root, query_lower):
+    # An extension in the query has to match exactly; only the stem is fuzzy.
+    store = root.store
+    ext = extension_key(query_lower) if fuzzy_key(query_lower) != query_lower else None
+    max_dist = max_distance(fuzzy_key(query_lower))
+    tiers = [[] for _ in range(max_dist + 1)]
+    names = store.names
+    for distance, name_id in root.fuzzy_index.match(query_lower, max_dist):
+        if ext is None or extension_key(names[name_id]) == ext:
+            tiers[distance].append(name_id)
+    return ((file_id for name_id in name_ids for file_id in store.files_named(name_id)) for name_ids in tiers)
+
+async def search_fuzzy(selected, query, limit=None, page=1):
+    start = time.perf_counter()
+    query_lower = query.strip().lower()
+
+    file_length, _ = root_lengths(selected)
+    tiers = root_tiers(selected, lambda root: fuzzy_tiers(root, query_lower))
+    file_ids, offset, more = top_ranked(tiers, file_length, limit, page)
+    match_paths = file_page(file_ids, offset, more)
+
+    search_time = metrics.observe('fuzzy', start)
+    metrics.report(f"Fuzzy search completed in {search_time:.4f}s. Found {len(match_paths)} matches.")
+    return match_paths
+
+def name_pattern_files(root, matcher, method, literals, scope_dirs):
+    # Only the unique names that contain every literal trigram are tried.
+    store = root.store
+    names = store.names
+    check = getattr(matcher, method)
+    grams = literal_grams(literals)
+    if grams:
+        matched = [name_id for name_id in sorted(intersect_postings(root.trigram_index.name_postings, grams))
+                   if check(names[name_id])]
+    else:
+        matched = root.shard_executor.scan_names(method, matcher)
+        if matched is None:
+            matched = [name_id for name_id in range(len(names)) if check(names[name_id])]
+    if scope_dirs is not None and not grams:
+        matched = set(matched)
+        return (file_id for dir_id in scope_dirs for file_id in store.files_in_dir(dir_id)
+                if store.file_name[file_id] in matched)
+    files = (file_id for name_id in matched for file_id in store.files_named(name_id))
+    if scope_dirs is None:
+        return files
+    return (file_id for file_id in files if store.file_dir[file_id] in scope_dirs)
+
+def path_pattern_files(root, matcher, method, literals, scope_dirs):
+    # Paths have to contain the longest literal, so only files found by the
+    # substring search for it are built and tried.
+    store = root.store
+    check = getattr(matcher, method)
+    literal = max(literals, key=len, default='')
+    if literal:
+        name_ids = root.trigram_index.match_names(literal)
+        candidates = [file_id for name_id in name_ids for file_id in store.files_named(name_id)]
+        candidates.extend(path_matches(root, literal, set(name_ids)))
+        if scope_dirs is not None:
+            candidates = [file_id for file_id in candidates if store.file_dir[file_id] in scope_dirs]
+    elif scope_dirs is not None:
+        candidates = (file_id for dir_id in scope_dirs for file_id in store.files_in_dir(dir_id))
+    else:
+        matched = root.shard_executor.scan_paths(method, matcher)
+        if matched is not None:
+            return iter(matched)
+        candidates = store.iter_files()
+    return (file_id for file_id in candidates if check(store.file_path(file_id).replace('\\', '/')))
+
+async def search_pattern(selected, query, regex, limit=None, page=1):
+    start = time.perf_counter()
+    pattern, scope = split_scope(query)
+
+    try:
+        matcher, method, literals, on_path = compile_pattern(pattern, regex)
+    except re.error as e:
+        print(f"Invalid pattern: {e}")
+        return []
+
+    # A scope folder narrows the search to the roots that index it.
+    scopes = {root: None for root in selected}
+    if scope is not None:
+        scopes = {}
+        for root in selected:
+            scope_id = root.store.find_dir(scope.rstrip('/\\') or scope)
+            if scope_id != NO_ID:
+                scopes[root] = set(root.store.subtree_dirs(scope_id))
+        if not scopes:
+            print(f"Folder not in index: {scope}")
+            return []
+
+    pattern_files = path_pattern_files if on_path else name_pattern_files
+    file_length, _ = root_lengths(scopes)
+    tiers = root_tiers(scopes, lambda root: [pattern_files(root, matcher, method, literals, scopes[root])])
+    file_ids, offset, more = top_ranked(tiers, file_length, limit, page)
+    match_paths = file_page(file_ids, offset, more)
+
+    search_time = metrics.observe('regex' if regex else 'glob', start)
+    metrics.report(f"Pattern search completed in {search_time:.4f}s. Found {len(match_paths)} matches.")
     return match_paths
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# utlis.config reads the index location at import, so the tests point it at a
+# scratch directory before anything from the package is imported.
+os.environ.setdefault('PYINDEX_INDEX_DIR', tempfile.mkdtemp(prefix='pyindex-tests-'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+import core.cache
+from search.search import search_files
+from utlis.config import query_cache
+from utlis.roots import IndexRoot, roots
+
+
+@pytest.fixture
+def root():
+    saved = dict(roots)
+    roots.clear()
+    query_cache.invalidate_all()
+    root = IndexRoot('q')
+    store = root.store
+    store.add_files('/data', ['report.txt', 'budget.xls', 'setup.py'])
+    store.add_files('/data/docs', ['report.md', 'notes.txt'])
+    store.add_folder('/data/src')
+    root.attach_cache()
+    roots['q'] = root
+    yield root
+    roots.clear()
+    roots.update(saved)
+    query_cache.invalidate_all()
+    root.shard_executor.shutdown()
+
+
+def search(*queries):
+    for query in queries:
+        asyncio.run(search_files(query))
+
+
+def cached():
+    # The queries still cached once the queued changes have been checked.
+    query_cache._apply_pending()
+    return sorted(key[2] if not key[1] else f'{key[1]} {key[2]}' for key in query_cache.entries)
+
+
+QUERIES = ['report', 'budget', 'docs/rep', '-f src', '-s notes', '-z reprot', '-g *.py', '-r ^set']
+
+
+# (change, queries it leaves cached)
+CHANGES = [
+    (lambda store: store.add_files('/data', ['old_report.doc']),
+     ['-f src', '-g *.py', '-r ^set', '-s notes', '-z reprot', 'budget', 'docs/rep']),
+    (lambda store: store.add_files('/data/docs', ['repo.txt']),
+     ['-f src', '-g *.py', '-r ^set', '-s notes', '-z reprot', 'budget', 'report']),
+    (lambda store: store.add_files('/data', ['repot.txt']),
+     ['-f src', '-g *.py', '-r ^set', '-s notes', 'budget', 'docs/rep', 'report']),
+    (lambda store: store.add_files('/data/other', ['tool.py']),
+     ['-f src', '-r ^set', '-s notes', '-z reprot', 'budget', 'docs/rep', 'report']),
+    (lambda store: store.add_folder('/data/src/pkg'),
+     ['-g *.py', '-r ^set', '-s notes', '-z reprot', 'budget', 'docs/rep', 'report']),
+    (lambda store: store.add_folder('/data/notes'),
+     ['-f src', '-g *.py', '-r ^set', '-z reprot', 'budget', 'docs/rep', 'report']),
+    (lambda store: store.remove_file(store.find_file('/data/budget.xls')),
+     ['-f src', '-g *.py', '-r ^set', '-s notes', '-z reprot', 'docs/rep', 'report']),
+    (lambda store: store.remove_file(store.find_file('/data/setup.py')),
+     ['-f src', '-s notes', '-z reprot', 'budget', 'docs/rep', 'report']),
+    (lambda store: store.remove_folder(store.find_dir('/data/src')),
+     ['-g *.py', '-r ^set', '-s notes', '-z reprot', 'budget', 'docs/rep', 'report']),
+]
+
+
+@pytest.mark.parametrize('change, kept', CHANGES)
+def test_only_affected_queries_are_dropped(root, change, kept):
+    search(*QUERIES)
+    assert len(cached()) == len(QUERIES)
+    change(root.store)
+    assert cached() == kept
+
+
+def test_dropped_query_sees_the_change(root):
+    search('report')
+    root.store.add_files('/data', ['report_2.txt'])
+    hits = query_cache.hits
+    assert '/data/report_2.txt' in asyncio.run(search_files('report'))
+    assert query_cache.hits == hits
+
+
+def test_clear_drops_everything(root):
+    search(*QUERIES)
+    root.store.clear()
+    assert cached() == []
+
+
+def test_too_many_changes_drop_everything(root, monkeypatch):
+    monkeypatch.setattr(core.cache, 'MAX_PENDING', 2)
+    search('report')
+    root.store.add_files('/data', ['a', 'b', 'c'])
+    assert cached() == []
+
+
+def test_roots_without_the_cache_attached_do_not_invalidate(root):
+    search('report')
+    building = IndexRoot('q')
+    building.store.add_files('/data', ['report_2.txt'])
+    assert cached() == ['report']
+    building.shard_executor.shutdown()
@@ -0,0 +1,58 @@
+import shutil
+import pytest
+from utlis.config import INDEX_DIR
+from utlis.load import load_root
+from utlis.roots import IndexRoot
+from utlis.save import save_data
+
+
+@pytest.fixture(autouse=True)
+def clean_index_dir():
+    shutil.rmtree(INDEX_DIR, ignore_errors=True)
+    yield
+    shutil.rmtree(INDEX_DIR, ignore_errors=True)
+
+
+def snapshot(store):
+    files = {(store.file_path(file_id), store.file_size[file_id]) for file_id in store.iter_files()}
+    return files, {store.dir_path(dir_id) for dir_id in store.iter_folders()}
+
+
+@pytest.fixture
+def root():
+    root = IndexRoot('c')
+    root.meta.update({'root': '/data', 'exclude': ['*.tmp']})
+    root.store.add_files('/data', ['alpha.txt', 'beta.py'], [(1, 1, 0), (2, 2, 0)])
+    root.store.add_folder('/data/src')
+    save_data(root, full=True)
+    # A change the log has not written yet.
+    root.store.add_files('/data/src', ['gamma.py'], [(3, 3, 0)])
+    return root
+
+
+def test_clone_matches_the_original(root):
+    clone = root.clone()
+    assert snapshot(clone.store) == snapshot(root.store)
+    assert clone.meta == root.meta
+    assert clone.trigram_index.match_names('gamma') == root.trigram_index.match_names('gamma')
+    assert clone.ext_index.match('.py') == root.ext_index.match('.py')
+
+
+def test_clone_shares_nothing_that_changes(root):
+    before = snapshot(root.store)
+    clone = root.clone()
+    clone.store.add_files('/data', ['delta.txt'], [(4, 4, 0)])
+    clone.store.remove_file(clone.store.find_file('/data/alpha.txt'))
+    clone.meta['exclude'].append('*.log')
+    assert snapshot(root.store) == before
+    assert root.meta['exclude'] == ['*.tmp']
+    assert root.trigram_index.match_names('delta') == []
+    assert [clone.store.names[name_id] for name_id in clone.trigram_index.match_names('delta')] == ['delta.txt']
+
+
+def test_clone_continues_the_delta_log(root):
+    clone = root.clone()
+    clone.store.add_files('/data', ['delta.txt'], [(4, 4, 0)])
+    save_data(clone)
+    loaded = load_root('c', log=lambda message: None)
+    assert snapshot(loaded.store) == snapshot(clone.store)
@@ -0,0 +1,107 @@
+import time
+import pytest
+import core.columns
+from core.columns import select_files
+from core.store import KIND_EXEC, KIND_LINK, NO_ID
+from search.filters import candidate_files, parse_filter
+from utlis.roots import IndexRoot
+
+NOW = 1_700_000_000
+DAY = 86400
+
+
+def ns(seconds):
+    return int(seconds * 10 ** 9)
+
+
+def day(seconds):
+    return time.strftime('%Y-%m-%d', time.localtime(seconds))
+
+
+@pytest.fixture(params=['python', 'numpy'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        monkeypatch.setattr(core.columns, 'numpy', pytest.importorskip('numpy'))
+    else:
+        monkeypatch.setattr(core.columns, 'numpy', None)
+
+
+@pytest.fixture
+def root(backend):
+    root = IndexRoot('f')
+    store = root.store
+    store.add_files('/data', ['big.iso', 'small.py', 'mid.log', 'link.log', 'unknown.bin', 'removed.py'], [
+        (2 * 1024 ** 3, ns(NOW - 30 * DAY), 0),
+        (500, ns(NOW - 3600), KIND_EXEC),
+        (10 * 1024, ns(NOW - 3 * DAY), 0),
+        (100, ns(NOW - 2 * DAY), KIND_LINK),
+        (NO_ID, NO_ID, 0),
+        (1, ns(NOW), 0),
+    ])
+    store.remove_file(store.find_file('/data/removed.py'))
+    yield root
+    root.shard_executor.shutdown()
+
+
+def select(root, text):
+    conditions, exts, words = parse_filter(text, NOW)
+    file_ids = select_files(root.store, conditions, candidate_files(root, exts, words))
+    return sorted(root.store.names[root.store.file_name[file_id]] for file_id in file_ids)
+
+
+CASES = [
+    ('', ['big.iso', 'link.log', 'mid.log', 'small.py', 'unknown.bin']),
+    ('size>1G', ['big.iso']),
+    ('size<=10K', ['link.log', 'mid.log', 'small.py']),
+    ('size<10K', ['link.log', 'small.py']),
+    ('size=10240', ['mid.log']),
+    ('size>=1.5k', ['big.iso', 'mid.log']),
+    ('size<2', []),
+    ('mtime<7d', ['link.log', 'mid.log', 'small.py']),
+    ('mtime>7d', ['big.iso']),
+    ('mtime<=1d', ['small.py']),
+    ('mtime<2.5d', ['link.log', 'small.py']),
+    (f'mtime={day(NOW - 30 * DAY)}', ['big.iso']),
+    (f'mtime<{day(NOW - 30 * DAY)}', []),
+    (f'mtime>{day(NOW - 30 * DAY)}', ['link.log', 'mid.log', 'small.py']),
+    (f'mtime>={day(NOW - 30 * DAY)}', ['big.iso', 'link.log', 'mid.log', 'small.py']),
+    ('kind:exec', ['small.py']),
+    ('kind:link', ['link.log']),
+    ('kind:file', ['big.iso', 'mid.log', 'small.py', 'unknown.bin']),
+    # Extensions and name words narrow the candidates first.
+    ('ext:log', ['link.log', 'mid.log']),
+    ('ext:.log kind:file', ['mid.log']),
+    ('ext:py,iso size>1K', ['big.iso']),
+    ('ext:py', ['small.py']),
+    ('MID mtime<7d', ['mid.log']),
+    ('unknown size<1G', []),
+]
+
+
+@pytest.mark.parametrize('text, names', CASES)
+def test_select(root, text, names):
+    assert select(root, text) == names
+
+
+def test_parse_filter():
+    conditions, exts, words = parse_filter('size>1.5G mtime<7d ext:LOG,.txt Report', NOW)
+    assert conditions == [
+        ('file_mtime', '>=', 0),
+        ('file_size', '>=', 0),
+        ('file_size', '>', int(1.5 * 1024 ** 3)),
+        ('file_mtime', '>', ns(NOW - 7 * DAY)),
+    ]
+    assert (exts, words) == (['.log', '.txt'], ['report'])
+
+
+@pytest.mark.parametrize('text, message', [
+    ('size>1Q', 'invalid size'),
+    ('size<=big', 'invalid size'),
+    ('mtime=7d', 'an age needs'),
+    ('mtime<yesterday', 'invalid time'),
+    ('mtime>2024-13-01', 'invalid time'),
+    ('kind:dir', 'unknown kind'),
+])
+def test_parse_errors(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse_filter(text, NOW)
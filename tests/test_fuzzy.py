@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from core.fuzzy import edit_distance, fuzzy_key, max_distance
+from search.search import search_fuzzy
+from utlis.roots import IndexRoot
+
+
+@pytest.mark.parametrize('length, allowed', [(1, 1), (11, 1), (12, 2), (19, 2), (20, 3), (40, 3)])
+def test_max_distance(length, allowed):
+    assert max_distance('a' * length) == allowed
+
+
+@pytest.mark.parametrize('text, query, distance', [
+    ('report', 'report', 0),
+    ('reprot', 'report', 1),  # swapped letters are one edit
+    ('reort', 'report', 1),
+    ('repoort', 'report', 1),
+    ('rapert', 'report', 2),
+    ('', 'ab', 2),
+])
+def test_edit_distance(text, query, distance):
+    assert edit_distance(text, query, 3) == distance
+
+
+def test_edit_distance_stops_past_the_limit():
+    assert edit_distance('abcdef', 'uvwxyz', 1) == 2
+    assert edit_distance('rapert', 'report', 1) == 2
+
+
+@pytest.mark.parametrize('name, key', [
+    ('Report.TXT', 'report'),
+    ('archive.tar.gz', 'archive.tar'),
+    ('Makefile', 'makefile'),
+    ('.bashrc', '.bashrc'),
+])
+def test_fuzzy_key_strips_the_extension(name, key):
+    assert fuzzy_key(name) == key
+
+
+# A stem of each length, then names one edit within and one edit past the
+# distance it allows.
+THRESHOLDS = [
+    ('fiel', 'file.txt', 'fail.txt'),
+    ('abcdefghijk', 'abcdefghijx.txt', 'abcdefghixx.txt'),
+    ('abcdefghijkl', 'abcdefghixxl.txt', 'abcdefghxxxl.txt'),
+    ('abcdefghijklmnopqrs', 'abcdefghijklmnopxxs.py', 'abcdefghijklmnoxxxs.py'),
+    ('abcdefghijklmnopqrst', 'abcdefghijklmnopxxxt.py', 'abcdefghijklmnoxxxxt.py'),
+]
+
+
+@pytest.fixture
+def root():
+    root = IndexRoot('z')
+    store = root.store
+    store.add_files('/data', [name for _, within, past in THRESHOLDS for name in (within, past)])
+    store.add_files('/data/docs', ['report.txt', 'report.md', 'reprt.txt', 'summary.txt'])
+    yield root
+    root.shard_executor.shutdown()
+
+
+def matched_names(root, query, walk=False):
+    fuzzy_index = root.fuzzy_index
+    if walk:
+        query = fuzzy_key(query)
+        matches = fuzzy_index._match_walk(query, max_distance(query))
+    else:
+        matches = fuzzy_index.match(query)
+    return {root.store.names[name_id] for _, name_id in matches}
+
+
+@pytest.mark.parametrize('query, within, past', THRESHOLDS)
+@pytest.mark.parametrize('walk', [False, True])
+def test_match_thresholds(root, query, within, past, walk):
+    # Longer queries go through the trigram postings, which have to agree
+    # with walking every stem.
+    names = matched_names(root, query, walk)
+    assert within in names
+    assert past not in names
+
+
+def test_match_ignores_the_extension(root):
+    assert matched_names(root, 'reprot') == {'report.txt', 'report.md', 'reprt.txt'}
+    assert matched_names(root, 'reprot.pdf') == {'report.txt', 'report.md', 'reprt.txt'}
+
+
+def test_search_needs_the_same_extension(root):
+    results = asyncio.run(search_fuzzy([root], 'Report.txt'))
+    # Closest first.
+    assert results == ['/data/docs/report.txt', '/data/docs/reprt.txt']
+    assert sorted(asyncio.run(search_fuzzy([root], 'reprot'))) == [
+        '/data/docs/report.md', '/data/docs/report.txt', '/data/docs/reprt.txt']
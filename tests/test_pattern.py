@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from search.search import search_pattern
+from utlis.roots import IndexRoot
+
+
+@pytest.fixture
+def root():
+    root = IndexRoot('p')
+    store = root.store
+    root.meta['root'] = '/data'
+    for dir_path, names in (('/data', ['setup.py', 'notes.log']),
+                            ('/data/src', ['main.py', 'util.py', 'readme.md']),
+                            ('/data/src/pkg', ['core.py']),
+                            ('/data/lib/src', ['other.py']),
+                            ('/data/logs', ['a.log', 'b.log']),
+                            ('/data/logs/old', ['c.log'])):
+        store.add_folder(dir_path)
+        store.add_files(dir_path, names)
+    yield root
+    root.shard_executor.shutdown()
+
+
+def search(root, query, regex=False):
+    return sorted(asyncio.run(search_pattern([root], query, regex)))
+
+
+# (query, expected paths)
+CASES = [
+    ('*.py', ['/data/lib/src/other.py', '/data/setup.py', '/data/src/main.py', '/data/src/pkg/core.py',
+              '/data/src/util.py']),
+    # A path glob may start at any folder, and '*' crosses separators.
+    ('src/*.py', ['/data/lib/src/other.py', '/data/src/main.py', '/data/src/pkg/core.py', '/data/src/util.py']),
+    ('pkg/core.py', ['/data/src/pkg/core.py']),
+    ('*/src/*.py', ['/data/lib/src/other.py', '/data/src/main.py', '/data/src/pkg/core.py', '/data/src/util.py']),
+    # Starting at the boundary only: 'rc/*.py' is not part of a folder name.
+    ('rc/*.py', []),
+    # A leading slash anchors the glob at the start of the path.
+    ('/data/src/*.py', ['/data/src/main.py', '/data/src/pkg/core.py', '/data/src/util.py']),
+    ('/src/*.py', []),
+    # --in limits a glob to one folder's subtree.
+    ('*.log --in /data/logs', ['/data/logs/a.log', '/data/logs/b.log', '/data/logs/old/c.log']),
+    ('logs/*.log --in /data/logs', ['/data/logs/a.log', '/data/logs/b.log', '/data/logs/old/c.log']),
+    ('old/*.log --in /data/logs', ['/data/logs/old/c.log']),
+    ('src/*.py --in /data/lib', ['/data/lib/src/other.py']),
+]
+
+
+@pytest.mark.parametrize('query, expected', CASES)
+def test_glob(root, query, expected):
+    assert search(root, query) == expected
+
+
+def test_regex_on_paths(root):
+    assert search(root, r'src/[a-m]\w*\.py$', regex=True) == ['/data/src/main.py']
+    assert search(root, r'src/.*\.py$ --in /data/lib', regex=True) == ['/data/lib/src/other.py']
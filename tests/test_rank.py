@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from search.rank import TIER_EXACT, TIER_NAME, TIER_PREFIX, name_tier, top_ranked
+from search.search import search_combined
+from utlis.roots import IndexRoot
+
+TIERS = [['bbb', 'a'], ['cc', 'd'], ['eeee']]
+
+
+# (limit, page, page entries, offset, more)
+PAGES = [
+    (2, 1, ['a', 'bbb'], 0, True),
+    (2, 2, ['d', 'cc'], 2, True),
+    (2, 3, ['eeee'], 4, False),
+    (2, 4, [], 6, False),
+    (4, 1, ['a', 'bbb', 'd', 'cc'], 0, True),
+    (5, 1, ['a', 'bbb', 'd', 'cc', 'eeee'], 0, False),
+    (3, 2, ['cc', 'eeee'], 3, False),
+    (None, 1, ['a', 'bbb', 'd', 'cc', 'eeee'], 0, False),
+]
+
+
+@pytest.mark.parametrize('limit, page, entries, offset, more', PAGES)
+def test_pages(limit, page, entries, offset, more):
+    assert top_ranked([list(tier) for tier in TIERS], len, limit, page) == (entries, offset, more)
+
+
+def test_later_tiers_are_not_generated_once_the_page_is_full():
+    def tiers():
+        yield ['a', 'b', 'c']
+        raise AssertionError("second tier generated")
+
+    assert top_ranked(tiers(), len, 2, 1) == (['a', 'b'], 0, True)
+
+
+@pytest.mark.parametrize('name, tier', [
+    ('report', TIER_EXACT),
+    ('report.txt', TIER_PREFIX),
+    ('old_report.txt', TIER_NAME),
+])
+def test_name_tier(name, tier):
+    assert name_tier(name, 'report') == tier
+
+
+@pytest.fixture
+def root():
+    root = IndexRoot('r')
+    store = root.store
+    for dir_path, names in (('/d', ['old_report.txt', 'report.txt', 'report']),
+                            ('/d/deeper/dir', ['report', 'report_2024.csv']),
+                            ('/d/report', ['x.txt'])):
+        store.add_folder(dir_path)
+        store.add_files(dir_path, names)
+    yield root
+    root.shard_executor.shutdown()
+
+
+def search(root, limit=None, page=1):
+    return asyncio.run(search_combined([root], 'report', limit, page))
+
+
+def test_tiers_then_path_length(root):
+    assert search(root) == [
+        # Exact names, shortest path first.
+        '/d/report', '/d/deeper/dir/report',
+        # Prefix, substring, then matches on the folder part only.
+        '/d/report.txt', '/d/deeper/dir/report_2024.csv',
+        '/d/old_report.txt',
+        '/d/report/x.txt',
+    ]
+
+
+def test_pages_of_a_search(root):
+    first = search(root, 4, 1)
+    second = search(root, 4, 2)
+    assert (first.offset, first.more, second.offset, second.more) == (0, True, 4, False)
+    assert first + second == search(root)
+    assert search(root, 3, 2).more is False
+    assert search(root, 2, 2).more is True
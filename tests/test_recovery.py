@@ -0,0 +1,177 @@
+import os
+import shutil
+import pytest
+import utlis.load
+import utlis.save
+from core.segment import write_sections
+from utlis.config import INDEX_DIR
+from utlis.load import load_root
+from utlis.roots import IndexRoot
+from utlis.save import save_data
+
+
+@pytest.fixture(autouse=True)
+def clean_index_dir():
+    shutil.rmtree(INDEX_DIR, ignore_errors=True)
+    yield
+    shutil.rmtree(INDEX_DIR, ignore_errors=True)
+
+
+def snapshot(store):
+    files = {(store.file_path(file_id), store.file_size[file_id], store.file_mtime[file_id],
+              store.file_kind[file_id]) for file_id in store.iter_files()}
+    folders = {store.dir_path(dir_id) for dir_id in store.iter_folders()}
+    return files, folders
+
+
+def new_root():
+    root = IndexRoot('t')
+    root.meta['root'] = '/data'
+    root.store.add_files('/data', ['a.txt', 'b.py'], [(10, 100, 0), (20, 200, 0)])
+    root.store.add_folder('/data/src')
+    root.store.add_files('/data/src', ['main.py'], [(30, 300, 0)])
+    return root
+
+
+def reload():
+    root = load_root('t', log=lambda message: None)
+    assert root is not None
+    return snapshot(root.store)
+
+
+def log_lines(root):
+    with open(root.log_file, 'rb') as f:
+        return f.read().split(b'\n')
+
+
+def test_log_is_replayed_on_top_of_the_base():
+    root = new_root()
+    save_data(root, full=True)
+    store = root.store
+    store.add_files('/data/src', ['util.py'], [(40, 400, 0)])
+    store.remove_file(store.find_file('/data/a.txt'))
+    save_data(root)
+    assert len(log_lines(root)) > 2
+    assert reload() == snapshot(store)
+
+
+def test_replay_keeps_the_order_of_changes():
+    root = new_root()
+    save_data(root, full=True)
+    store = root.store
+    # Added, removed and added again: only the last state may survive.
+    store.add_files('/data', ['c.txt'], [(1, 1, 0)])
+    store.remove_file(store.find_file('/data/c.txt'))
+    store.add_files('/data', ['c.txt'], [(2, 2, 0)])
+    store.set_file_stat(store.find_file('/data/b.py'), 21, 201)
+    store.remove_folder(store.find_dir('/data/src'))
+    store.add_folder('/data/src')
+    save_data(root)
+    assert reload() == snapshot(store)
+
+
+def test_torn_last_record_is_dropped():
+    root = new_root()
+    save_data(root, full=True)
+    store = root.store
+    store.add_files('/data', ['kept.txt'], [(5, 5, 0)])
+    save_data(root)
+    expected = snapshot(store)
+    store.add_files('/data', ['lost.txt'], [(6, 6, 0)])
+    save_data(root)
+    # A crash in the middle of the last append.
+    size = os.path.getsize(root.log_file)
+    last = log_lines(root)[-2]
+    with open(root.log_file, 'r+b') as f:
+        f.truncate(size - len(last) // 2 - 1)
+
+    loaded = load_root('t', log=lambda message: None)
+    assert snapshot(loaded.store) == expected
+    # The next save writes over the torn tail rather than after it.
+    loaded.store.add_files('/data', ['after.txt'], [(7, 7, 0)])
+    save_data(loaded)
+    assert reload() == snapshot(loaded.store)
+
+
+def test_log_of_another_base_is_ignored():
+    root = new_root()
+    save_data(root, full=True)
+    expected = snapshot(root.store)
+    root.store.add_files('/data', ['c.txt'], [(1, 1, 0)])
+    save_data(root)
+    lines = log_lines(root)
+    lines[0] = b'{"base": "0000000000000000"}'
+    with open(root.log_file, 'wb') as f:
+        f.write(b'\n'.join(lines))
+    assert reload() == expected
+
+
+@pytest.mark.parametrize('min_bytes, ratio, compacted', [
+    (1024 * 1024, 0.25, False),
+    (0, 0.0, True),
+])
+def test_compaction_threshold(monkeypatch, min_bytes, ratio, compacted):
+    monkeypatch.setattr(utlis.save, 'LOG_COMPACT_MIN_BYTES', min_bytes)
+    monkeypatch.setattr(utlis.save, 'LOG_COMPACT_RATIO', ratio)
+    root = new_root()
+    save_data(root, full=True)
+    token = root.delta_log.token
+    root.store.add_files('/data', ['c.txt'], [(1, 1, 0)])
+    save_data(root)
+    if root.compaction is not None:
+        root.compaction.join()
+    # Compaction writes a new base and starts an empty log for it.
+    assert (root.delta_log.token != token) == compacted
+    assert (len(log_lines(root)) == 2) == compacted
+    assert reload() == snapshot(root.store)
+
+
+def test_backup_holds_the_previous_base():
+    root = new_root()
+    save_data(root, full=True)
+    first = snapshot(root.store)
+    root.store.add_files('/data', ['c.txt'], [(1, 1, 0)])
+    save_data(root, full=True)
+    assert not os.path.exists(root.index_file + '.tmp')
+    assert not os.path.exists(root.backup_file + '.tmp')
+
+    backup = IndexRoot('t')
+    utlis.load.load_segment(backup, root.backup_file)
+    assert snapshot(backup.store) == first
+    assert reload() == snapshot(root.store)
+
+
+def test_unreadable_base_falls_back_to_the_backup():
+    root = new_root()
+    save_data(root, full=True)
+    first = snapshot(root.store)
+    root.store.add_files('/data', ['c.txt'], [(1, 1, 0)])
+    save_data(root, full=True)
+    with open(root.index_file, 'r+b') as f:
+        f.write(b'garbage!')
+
+    recovered = load_root('t')
+    assert snapshot(recovered.store) == first
+    assert os.path.exists(root.index_file + '.corrupt')
+
+
+def test_live_file_stays_in_place_when_the_swap_fails(monkeypatch, tmp_path):
+    path = str(tmp_path / 'seg.pyidx')
+    backup = path + '.bak'
+    write_sections(path, [('data', b'old')], backup=backup)
+    with open(path, 'rb') as f:
+        old = f.read()
+    real_replace = os.replace
+
+    def crash_on_swap(src, dst):
+        if dst == path:
+            raise OSError("simulated crash")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', crash_on_swap)
+    with pytest.raises(OSError):
+        write_sections(path, [('data', b'new')], backup=backup)
+    with open(path, 'rb') as f:
+        assert f.read() == old
+    with open(backup, 'rb') as f:
+        assert f.read() == old
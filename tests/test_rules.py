@@ -0,0 +1,129 @@
+import os
+import pytest
+from core.rules import ScanRules
+from core.scanner import scan_tree
+
+ROOT = os.path.abspath(os.sep + 'data')
+
+# (patterns, path below the root, is_dir, excluded)
+CASES = [
+    # Unanchored names match at any depth.
+    (['*.log'], 'a.log', False, True),
+    (['*.log'], 'src/deep/a.log', False, True),
+    (['*.log'], 'a.log.txt', False, False),
+    (['?.txt'], 'a.txt', False, True),
+    (['?.txt'], 'ab.txt', False, False),
+    (['node_modules'], 'web/node_modules', True, True),
+    (['node_modules'], 'web/node_modules', False, True),
+    # A trailing slash only matches folders.
+    (['build/'], 'build', True, True),
+    (['build/'], 'src/build', True, True),
+    (['build/'], 'build', False, False),
+    (['[Aa]pp[Dd]ata/'], 'Users/me/AppData', True, True),
+    (['[Aa]pp[Dd]ata/'], 'Users/me/appdata', True, True),
+    (['[Aa]pp[Dd]ata/'], 'AppData', False, False),
+    # A leading or inner slash anchors the pattern at the rules' folder.
+    (['/build'], 'build', True, True),
+    (['/build'], 'src/build', True, False),
+    (['docs/*.md'], 'docs/a.md', False, True),
+    (['docs/*.md'], 'x/docs/a.md', False, False),
+    (['docs/*.md'], 'docs/sub/a.md', False, False),
+    (['/out/'], 'out', True, True),
+    (['/out/'], 'out', False, False),
+    # '**' spans any number of folders.
+    (['**/tmp'], 'tmp', True, True),
+    (['**/tmp'], 'a/b/tmp', True, True),
+    (['a/**/z'], 'a/z', False, True),
+    (['a/**/z'], 'a/b/c/z', False, True),
+    (['a/**/z'], 'b/a/z', False, False),
+    (['logs/**'], 'logs/x/y.txt', False, True),
+    # The last matching rule wins, so negation only undoes earlier rules.
+    (['*.log', '!keep.log'], 'keep.log', False, False),
+    (['*.log', '!keep.log'], 'drop.log', False, True),
+    (['!keep.log', '*.log'], 'keep.log', False, True),
+    (['build/', '!build/'], 'build', True, False),
+    (['*.py', '!/main.py'], 'main.py', False, False),
+    (['*.py', '!/main.py'], 'src/main.py', False, True),
+    # Escapes, comments and blank lines.
+    (['\\!bang'], '!bang', False, True),
+    (['\\#hash'], '#hash', False, True),
+    (['# comment', '', 'x'], '# comment', False, False),
+    (['# comment', '', 'x'], 'x', False, True),
+]
+
+
+def excluded(rules, relative, is_dir):
+    path = os.path.join(ROOT, *relative.split('/'))
+    return rules.matcher(os.path.dirname(path)).excluded(os.path.basename(path), path, is_dir) is not None
+
+
+@pytest.mark.parametrize('patterns, relative, is_dir, expected', CASES)
+def test_configured_patterns(patterns, relative, is_dir, expected):
+    assert excluded(ScanRules(patterns, ROOT), relative, is_dir) == expected
+
+
+def write(path, text=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, '.gitignore'), '*.tmp\n/out/\n')
+    write(os.path.join(root, 'sub', '.gitignore'), '# nested\n!keep.tmp\nlocal/\n')
+    for relative in ('a.txt', 'a.tmp', 'out/x.txt', 'local/x.txt', 'sub/b.tmp', 'sub/keep.tmp',
+                     'sub/out/x.txt', 'sub/local/x.txt', 'sub/deep/c.tmp', 'sub/deep/keep.tmp'):
+        write(os.path.join(root, *relative.split('/')))
+    return root
+
+
+# (path below the root, is_dir, excluded) with the tree's .gitignore files
+GITIGNORE_CASES = [
+    ('a.txt', False, False),
+    ('a.tmp', False, True),
+    ('out', True, True),
+    ('local', True, False),
+    # Rules of the inner file apply below it, after the outer file's.
+    ('sub/b.tmp', False, True),
+    ('sub/keep.tmp', False, False),
+    ('sub/deep/keep.tmp', False, False),
+    ('sub/deep/c.tmp', False, True),
+    ('sub/local', True, True),
+    # Anchored outer rules stay tied to the folder they come from.
+    ('sub/out', True, False),
+]
+
+
+@pytest.mark.parametrize('relative, is_dir, expected', GITIGNORE_CASES)
+def test_nested_gitignore(tree, relative, is_dir, expected):
+    path = os.path.join(tree, *relative.split('/'))
+    rules = ScanRules([], tree, gitignore=True)
+    assert (rules.matcher(os.path.dirname(path)).excluded(os.path.basename(path), path, is_dir)
+            is not None) == expected
+
+
+def test_gitignore_files_are_ignored_unless_enabled(tree):
+    rules = ScanRules([], tree)
+    path = os.path.join(tree, 'a.tmp')
+    assert rules.matcher(tree).excluded('a.tmp', path, False) is None
+
+
+def scanned_files(root, rules):
+    found = []
+
+    def emit(record):
+        dir_path, files = record[0], record[1]
+        found.extend(os.path.relpath(os.path.join(dir_path, name), root).replace(os.sep, '/') for name in files)
+
+    assert scan_tree(root, emit, rules, workers=2) == []
+    return sorted(found)
+
+
+def test_scanner_skips_excluded_entries(tree):
+    rules = ScanRules(['.*'], tree, gitignore=True)
+    assert scanned_files(tree, rules) == ['a.txt', 'local/x.txt', 'sub/deep/keep.tmp', 'sub/keep.tmp',
+                                          'sub/out/x.txt']
+    # Excluded folders are never entered, so their files are not counted.
+    assert sum(rules.hits.values()) == 7
@@ -0,0 +1,160 @@
+import contextlib
+import json
+import os
+import sys
+from utlis.config import LEGACY_INDEX_FILE, ensure_index_dir, metrics
+from utlis.roots import saved_root_names, select_roots
+from utlis.console import parse_paging, parse_roots
+from core.index import index
+from core.reindex import reindex_file, reindex_roots
+from search.search import search_files
+from search.exSearch import search_ext
+from search.grep import search_content
+from search.filters import search_filter
+from utlis.load import load_data
+from utlis.save import wait_for_compaction
+
+# Commands a script can run; they print results only, everything else goes
+# to stderr.
+QUERIES = {
+    'search': search_files,
+    'folders': lambda query, *args: search_files('-f ' + query, *args),
+    'exsearch': search_ext,
+    'filter': search_filter,
+    'grep': search_content,
+}
+FORMATS = ('plain', 'null', 'jsonl')
+
+
+class ResultWriter:
+    # Writes result paths to a binary stream as plain lines, NUL-terminated
+    # records or JSON lines, one write per page. In batch mode every query's
+    # results are followed by an empty record (a blank line or a lone NUL);
+    # JSON lines carry the query instead.
+    def __init__(self, out, fmt, batch=False, line_buffered=False):
+        self.out = out
+        self.fmt = fmt
+        self.batch = batch
+        self.line_buffered = line_buffered
+
+    def write(self, query, results):
+        offset = getattr(results, 'offset', 0)
+        if self.fmt == 'jsonl':
+            quoted = json.dumps(query)
+            data = ''.join(f'{{"query": {quoted}, "rank": {rank}, "path": {json.dumps(path)}}}\n'
+                           for rank, path in enumerate(results, offset + 1)).encode()
+        else:
+            end = '\0' if self.fmt == 'null' else '\n'
+            data = ''.join(path + end for path in results)
+            if self.batch:
+                data += end
+            # Undecodable bytes in file names come back as they were on disk.
+            data = data.encode('utf-8', 'surrogateescape')
+        self.out.write(data)
+        if self.line_buffered:
+            self.out.flush()
+
+
+def parse_line(line):
+    # "<command> <text> [--limit N] [--page P] [--all] [--root a,b]"; a line
+    # without a known command is a name search.
+    command, _, text = line.partition(' ')
+    if command not in QUERIES:
+        command, text = 'search', line
+    text, root_names = parse_roots(text)
+    text, limit, page = parse_paging(text)
+    return command, text, limit, page, root_names
+
+async def load_index():
+    if not saved_root_names() and not os.path.exists(LEGACY_INDEX_FILE):
+        print("No index found. Run 'main.py index <path>' first.")
+        return False
+    await load_data()
+    return True
+
+async def run_query(writer, command, text, limit, page, root_names):
+    results = await QUERIES[command](text, limit, page, root_names)
+    writer.write(text, results)
+    return len(results)
+
+async def run_batch(writer, lines, limit, root_names):
+    # Every line runs against the one loaded index; options on a line
+    # override the command line's.
+    answered = 0
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        command, text, line_limit, page, line_roots = parse_line(line)
+        if not text:
+            print(f"Empty query: {line}")
+            continue
+        words = line.split()
+        if '--limit' not in words and '--all' not in words:
+            line_limit = limit
+        await run_query(writer, command, text, line_limit, page, line_roots or root_names)
+        answered += 1
+    return answered
+
+async def run_command(args, out):
+    # Returns the exit status: 0 when something was found or done, 1 when a
+    # query found nothing, 2 on errors.
+    ensure_index_dir()
+    metrics.quiet = True
+    if args.command == 'index':
+        if saved_root_names():
+            await load_data()
+        exclude = None
+        if args.exclude or args.include:
+            exclude = args.exclude + ['!' + pattern.lstrip('!') for pattern in args.include]
+        built = await index(args.paths, args.name, exclude, args.gitignore)
+        wait_for_compaction()
+        return 0 if built else 2
+
+    if not await load_index():
+        return 2
+    root_names = [name for name in args.root.split(',') if name] if args.root else None
+    if root_names:
+        try:
+            select_roots(root_names)
+        except ValueError as e:
+            print(f"Invalid root: {e}")
+            return 2
+
+    if args.command == 'reindex':
+        if args.path:
+            await reindex_file(args.path)
+        else:
+            await reindex_roots(select_roots(root_names))
+        wait_for_compaction()
+        return 0
+
+    limit = None if args.all or args.limit == 0 else args.limit
+    writer = ResultWriter(out, args.format, batch=args.command == 'batch', line_buffered=args.line_buffered)
+    if args.command == 'batch':
+        if args.file in (None, '-'):
+            await run_batch(writer, sys.stdin, limit, root_names)
+        else:
+            with open(args.file, encoding='utf-8') as f:
+                await run_batch(writer, f, limit, root_names)
+        return 0
+    query = ' '.join(args.query)
+    if getattr(args, 'mode', None):
+        query = f'{args.mode} {query}'
+    if getattr(args, 'scope', None):
+        query += f' --in {args.scope}'
+    found = await run_query(writer, args.command, query, limit, args.page, root_names)
+    return 0 if found else 1
+
+async def run_cli(args):
+    out = sys.stdout.buffer
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            status = await run_command(args, out)
+            out.flush()
+        except BrokenPipeError:
+            # The reader went away, e.g. "| head": stop quietly and keep the
+            # interpreter from complaining about the closed pipe at exit.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            status = 0
+    return status
@@ -1,9 +1,69 @@
 import os
+import threading
+from core.cache import QueryCache
+from core.dupes import HashCache
+from core.metrics import Metrics
 
-INDEX_DIR = os.path.join(os.path.dirname(__file__), '..', 'index_data')
-INDEX_FILE = os.path.join(INDEX_DIR, 'file_index.json')
-file_index = {}
-folder_index = {}
+INDEX_DIR = os.environ.get('PYINDEX_INDEX_DIR') or os.path.join(os.path.dirname(__file__), '..', 'index_data')
+# Every named root keeps its own files, e.g. file_index.srv.pyidx; the root
+# named 'default' uses the plain names an index had before roots existed.
+DEFAULT_ROOT = 'default'
+INDEX_FILE = os.path.join(INDEX_DIR, 'file_index.pyidx')
+LEGACY_INDEX_FILE = os.path.join(INDEX_DIR, 'file_index.json')
+INDEX_BACKUP_FILE = INDEX_FILE + '.bak'
+DELTA_LOG_FILE = os.path.join(INDEX_DIR, 'file_index.log')
+CONTENT_FILE = os.path.join(INDEX_DIR, 'content_index.pyidx')
+HASH_CACHE_FILE = os.path.join(INDEX_DIR, 'hash_cache.pyidx')
+SCAN_WORKERS = int(os.environ.get('PYINDEX_SCAN_WORKERS', min(32, (os.cpu_count() or 1) * 4)))
+SCAN_QUEUE_SIZE = 256
+# Entries every root leaves out, in .gitignore syntax; excluded folders are
+# never entered. PYINDEX_EXCLUDE adds comma-separated patterns, and
+# PYINDEX_GITIGNORE=1 makes new roots honor the .gitignore files they contain.
+EXCLUDE_RULES = ['.*', '[Aa]pp[Dd]ata/'] + [rule.strip() for rule in os.environ.get('PYINDEX_EXCLUDE', '').split(',')
+                                             if rule.strip()]
+GITIGNORE = os.environ.get('PYINDEX_GITIGNORE', '0') == '1'
+INDEX_FLUSH_FILES = 100_000
+WATCH_ON_START = True
+WATCH_BATCH_INTERVAL = 1.0
+WATCH_POLL_INTERVAL = 30.0
+WATCH_PERSIST_INTERVAL = 60.0
+SEARCH_LIMIT = 50
+# Worker processes for full-index scans; 0 keeps every query in-process.
+QUERY_WORKERS = int(os.environ.get('PYINDEX_QUERY_WORKERS', 0))
+QUERY_PARALLEL_MIN = 500_000
+# Saves append to the delta log until it outgrows this share of the base
+# segment (and the minimum), then a background rewrite folds it back in.
+LOG_COMPACT_RATIO = 0.25
+LOG_COMPACT_MIN_BYTES = 1024 * 1024
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Full-text indexing of file contents for 'grep'; off unless asked for.
+CONTENT_INDEX = os.environ.get('PYINDEX_CONTENT_INDEX', '0') == '1'
+CONTENT_MAX_BYTES = 1024 * 1024
+CONTENT_WORKERS = os.cpu_count() or 1
+CONTENT_SKIP_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.ico', '.webp', '.mp3', '.mp4', '.avi', '.mkv', '.mov',
+    '.wav', '.flac', '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.tar', '.iso', '.exe', '.dll',
+    '.so', '.dylib', '.o', '.a', '.lib', '.pyc', '.class', '.jar', '.pdf', '.doc', '.docx', '.xls',
+    '.xlsx', '.ppt', '.pptx', '.db', '.sqlite', '.bin', '.dat', '.pyidx',
+}
+# Duplicate finder: threads hashing files and the size of the head and tail
+# blocks compared before a file is read in full.
+DUPES_WORKERS = int(os.environ.get('PYINDEX_DUPES_WORKERS', min(16, (os.cpu_count() or 1) * 2)))
+DUPES_BLOCK = 64 * 1024
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+SERVER_CHUNK = 500
+# Leaves out per-query timing lines and scan progress; 'quiet' toggles it.
+QUIET = os.environ.get('PYINDEX_QUIET', '0') == '1'
+
+# Shared by every root: each root's store feeds its changes into the cache.
+query_cache = QueryCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+hash_cache = HashCache(HASH_CACHE_FILE)
+metrics = Metrics(QUIET)
+# Held by the console while it runs a command and by the watcher while it
+# applies a batch, so queries never see a half-applied update.
+index_lock = threading.RLock()
 
 def ensure_index_dir():
     if not os.path.exists(INDEX_DIR):
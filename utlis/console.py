@@ -1,16 +1,27 @@
 import os
-from utlis.config import INDEX_FILE, file_index, ensure_index_dir
-from core.index import index
-from core.reindex import reindex_file
+import shlex
+from utlis.config import (HASH_CACHE_FILE, LEGACY_INDEX_FILE, SEARCH_LIMIT, WATCH_ON_START, index_lock,
+                          metrics, query_cache, hash_cache, ensure_index_dir)
+from utlis.roots import (ROOT_NAME, IndexRoot, remove_root, root_for_path, roots, saved_root_names, select_roots,
+                         total_files)
+from core.index import index_jobs
+from core.jobs import active_job, jobs, running_jobs, wait_for_jobs
+from core.reindex import reindex_jobs
+from core.watcher import IndexWatcher
 from search.search import search_files
 from search.exSearch import search_ext
+from search.grep import search_content
+from search.dupes import search_dupes
+from search.filters import parse_size, search_filter
 from utlis.load import load_data
+from utlis.save import wait_for_compaction
 
 def print_banner():
     print("=" * 60)
     print(" 🔍 FILE SEARCH ENGINE")
     print("=" * 60)
-    print(" Commands: search, exsearch, index, reindex, load, delete, help, exit")
+    print(" Commands: search, exsearch, filter, grep, dupes, index, reindex, status, load, roots, rules,")
+    print("           watch, cache, stats, quiet, delete, help, exit")
     print("=" * 60)
 
 def display(results, query):
@@ -18,33 +29,316 @@ def display(results, query):
         print(f"No files found matching '{query}'")
         return
 
-    print(f"Found {len(results)} matches:")
+    offset = getattr(results, 'offset', 0)
+    if offset or getattr(results, 'more', False):
+        print(f"Showing matches {offset + 1}-{offset + len(results)}:")
+    else:
+        print(f"Found {len(results)} matches:")
     print("-" * 40)
-    for i, file_path in enumerate(results, 1):
+    for i, file_path in enumerate(results, offset + 1):
         clean_path = file_path.replace('\\', '/')
         filename = os.path.basename(file_path)
         print(f"{i:2d}. {filename}")
 
         print(f"    {clean_path}...")
     print("-" * 40)
+    if getattr(results, 'more', False):
+        page = offset // len(results) + 2
+        print(f"More matches available, add --page {page} to see them.")
+
+def parse_paging(text):
+    # Strips --limit N, --page N and --all from a query. Returns the remaining
+    # query, the page size (None for everything) and the page number.
+    limit, page = SEARCH_LIMIT, 1
+    words = []
+    tokens = text.split(' ')
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ('--limit', '--page') and i + 1 < len(tokens) and tokens[i + 1].isdigit():
+            value = max(1, int(tokens[i + 1]))
+            if token == '--limit':
+                limit = value
+            else:
+                page = value
+            i += 2
+            continue
+        if token == '--all':
+            limit = None
+        else:
+            words.append(token)
+        i += 1
+    return ' '.join(words).strip(), limit, page
+
+def parse_roots(text):
+    # Strips --root a,b from a query. Returns the remaining query and the
+    # root names, None for every loaded root.
+    names = None
+    words = []
+    tokens = text.split(' ')
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == '--root' and i + 1 < len(tokens):
+            names = (names or []) + [name for name in tokens[i + 1].split(',') if name]
+            i += 2
+            continue
+        words.append(tokens[i])
+        i += 1
+    return ' '.join(words).strip(), names
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+def display_dupes(groups, limit, page):
+    if not groups:
+        print("No duplicate files found.")
+        return
+    wasted = sum(size * (len(paths) - 1) for size, paths in groups)
+    print(f"{len(groups)} groups of identical files, {format_size(wasted)} reclaimable:")
+    offset = (page - 1) * limit if limit else 0
+    shown = groups[offset:offset + limit] if limit else groups
+    print("-" * 40)
+    for i, (size, paths) in enumerate(shown, offset + 1):
+        print(f"{i:2d}. {len(paths)} copies of {format_size(size)}")
+        for path in paths:
+            print(f"    {path.replace(chr(92), '/')}")
+    print("-" * 40)
+    if limit and offset + limit < len(groups):
+        print(f"More groups available, add --page {page + 1} to see them.")
 
 def show_help():
     print("\nAvailable commands:")
     print("  search <query>     - Search for files by name")
+    print("  search -z <query>  - Search for files by name, allowing typos")
+    print("  search -g <glob>   - Search with a glob, e.g. *.log --in <folder>")
+    print("  search -r <regex>  - Search with a regular expression")
     print("  exsearch <ext>     - Search for files by extension")
-    print("  index              - Build/rebuild file index")
-    print("  reindex            - Reindex existing files")
-    print("  load               - Load existing index file")
-    print("  delete             - Delete the index file")
+    print("  filter <terms>     - Filter files by metadata, e.g. size>1G mtime<7d ext:.log")
+    print("  grep <words>       - Search file contents (word*, needs PYINDEX_CONTENT_INDEX=1)")
+    print("  dupes [min size]   - Find files with identical contents, e.g. dupes 10M")
+    print(f"      --limit N      - Show N results per page (default {SEARCH_LIMIT})")
+    print("      --page P       - Show page P of the results")
+    print("      --all          - Show every result")
+    print("      --root a,b     - Only search the named roots")
+    print("  index [paths]      - Build/rebuild a root per path in the background (--name N for one path)")
+    print("      --exclude a,b  - Leave out entries matching these .gitignore-style patterns (--include to keep)")
+    print("      --gitignore    - Honor the .gitignore files inside the root (--no-gitignore to stop)")
+    print("  reindex [path]     - Reindex the root a path lies in in the background (--root a,b or --all)")
+    print("  status             - Show the progress of running and recent index builds")
+    print("  load [roots]       - Load every saved root, or reload the named ones")
+    print("  roots [remove N]   - List the indexed roots / delete one of them")
+    print("  rules [roots]      - Show each root's exclusion rules and what they left out")
+    print("  watch [stop]       - Keep the index updated live / stop watching")
+    print("  cache [clear]      - Show result cache statistics / empty the cache")
+    print("  stats [json|prom]  - Show timings, scan counters, query latencies and memory (add a file to save them)")
+    print("  stats reset        - Start the statistics over")
+    print("  quiet [on|off]     - Leave out per-query timings and scan progress")
+    print("  delete             - Delete every index file")
     print("  help               - Show this help")
     print("  exit               - Exit program")
 
+watchers = {}
+# Roots whose watcher comes back once their build finishes.
+paused = set()
+
+def watch_root(root):
+    if not root.path or not os.path.isdir(root.path):
+        return
+    watcher = IndexWatcher(root)
+    watcher.start()
+    watchers[root.name] = watcher
+    print(f"Watching {root.path} for changes ({watcher.mode}).")
+
+def start_watcher():
+    # Roots with a build running are picked up when it finishes.
+    stop_watcher()
+    for root in list(roots.values()):
+        if active_job(root.name) is None:
+            watch_root(root)
+    if not watchers:
+        print("No indexed root to watch. Use 'index' first.")
+
+def stop_watcher(names=None):
+    for name in list(watchers if names is None else names):
+        watcher = watchers.pop(name, None)
+        if watcher is not None:
+            watcher.stop()
+
+def job_done(job):
+    # Runs on the job's thread. A watcher on the replaced root would write to
+    # files that now belong to the new one, so it was stopped at the start.
+    for name in job.removed:
+        stop_watcher([name])
+    if job.phase == 'done':
+        print(f"\n{job.kind.capitalize()} of root '{job.name}' finished: {job.files} files in {job.elapsed():.1f}s.")
+    else:
+        print(f"\n{job.kind.capitalize()} of root '{job.name}' failed; see 'status'.")
+    root = roots.get(job.name)
+    if job.name in paused and root is not None:
+        watch_root(root)
+    paused.discard(job.name)
+
+def start_jobs(planned):
+    for job in planned:
+        if job.name in watchers or WATCH_ON_START:
+            paused.add(job.name)
+        stop_watcher([job.name])
+        job.start()
+    if planned:
+        print(f"Started {len(planned)} job{'s' if len(planned) > 1 else ''} in the background; "
+              f"use 'status' to follow progress.")
+
+def show_status():
+    if not jobs:
+        print("No index builds since startup.")
+    for job in jobs:
+        print(f"  {job.kind:<8} {job.name:<16} {job.phase:<9} {job.path}")
+        print(f"  {'':<8} {'':<16} {job.dirs} directories, {job.files} files, {job.elapsed():.1f}s")
+        if job.messages:
+            print(f"  {'':<8} {'':<16} {job.messages[-1]}")
+        if job.error:
+            print(f"  {'':<8} {'':<16} error: {job.error}")
+    print(f"Serving {len(roots)} roots, {total_files()} files.")
+
+def busy(action):
+    if running_jobs():
+        print(f"Index builds are still running; wait for them ('status') before you {action}.")
+        return True
+    return False
+
+def show_watch_status():
+    running = [watcher for watcher in watchers.values() if watcher.is_running()]
+    if not running:
+        print("Watcher is not running.")
+        return
+    for watcher in running:
+        print(f"Watching {watcher.path} ({watcher.mode}) for root '{watcher.root.name}'")
+        print(f"  events: {watcher.events}, batches: {watcher.batches}")
+        print(f"  files added: {watcher.added}, removed: {watcher.removed}")
+        print(f"  last saved: {watcher.last_persist or 'not yet'}")
+
+def show_roots():
+    saved = saved_root_names()
+    if not roots and not saved:
+        print("No roots indexed. Use 'index' to add one.")
+        return
+    for name in dict.fromkeys(list(roots) + saved):
+        root = roots.get(name)
+        if root is None:
+            print(f"  {name:<16} saved, not loaded ('load {name}')")
+            continue
+        state = '' if root.meta.get('complete', True) else ', incomplete'
+        print(f"  {name:<16} {root.path or '?'}")
+        print(f"  {'':<16} {root.store.file_count} files, {root.store.folder_count} folders, "
+              f"scanned {root.meta.get('scan_timestamp', 'unknown')}{state}")
+
+def parse_index_args(text):
+    # "index /data /srv" or "index /data --name data --exclude node_modules/,build/
+    # --include !keep.log --gitignore". Quote paths with spaces. Returns the
+    # paths, the name and the scan settings that were given.
+    words = shlex.split(text)
+    name = None
+    options = {}
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word in ('--name', '--exclude', '--include'):
+            if i + 1 >= len(words):
+                raise ValueError(f"{word} needs a value")
+            value = words[i + 1]
+            del words[i:i + 2]
+            if word == '--name':
+                name = value
+            else:
+                patterns = [pattern.strip() for pattern in value.split(',') if pattern.strip()]
+                if word == '--include':
+                    patterns = ['!' + pattern.lstrip('!') for pattern in patterns]
+                options['exclude'] = options.get('exclude', []) + patterns
+        elif word in ('--gitignore', '--no-gitignore'):
+            options['gitignore'] = word == '--gitignore'
+            del words[i]
+        else:
+            i += 1
+    if name is not None and not ROOT_NAME.fullmatch(name):
+        raise ValueError("root names may only use letters, digits, '-' and '_'")
+    return words, name, options
+
+def show_rules(names):
+    try:
+        selected = select_roots(names)
+    except ValueError as e:
+        print(f"Invalid root: {e}")
+        return
+    if not selected:
+        print("No roots loaded. Use 'index' or 'load' first.")
+        return
+    for root in selected:
+        rules = root.rules
+        print(f"Root '{root.name}' ({root.path}), .gitignore files {'honored' if rules.gitignore else 'ignored'}:")
+        excluded = root.meta.get('excluded', {})
+        for pattern in rules.patterns:
+            print(f"  {pattern:<30} {excluded.get(pattern, 0):>10} entries")
+        # Rules from .gitignore files, by what they excluded.
+        found = sorted(((hits, label) for label, hits in excluded.items() if label not in rules.patterns), reverse=True)
+        for hits, label in found[:20]:
+            print(f"  {label:<30} {hits:>10} entries")
+        if len(found) > 20:
+            print(f"  ... and {len(found) - 20} more .gitignore rules")
+
+def show_stats():
+    stats = metrics.snapshot()
+    print(f"Statistics for the last {stats['uptime']:.0f}s:")
+    if stats['phases']:
+        print(f"  {'phase':<10}{'runs':>8}{'total s':>12}{'last s':>12}{'max s':>12}")
+        for phase, timing in sorted(stats['phases'].items()):
+            print(f"  {phase:<10}{timing['runs']:>8}{timing['seconds']:>12.3f}{timing['last_seconds']:>12.3f}"
+                  f"{timing['max_seconds']:>12.3f}")
+    counters = stats['counters']
+    print(f"  scanned: {counters['dirs_scanned']} directories, {counters['files_scanned']} files, "
+          f"{counters['stat_calls']} stat calls, {counters['scan_errors']} unreadable directories")
+    print(f"  changes: {counters['files_added']} files added, {counters['files_removed']} removed")
+    scan = stats['last_scan']
+    if scan is not None and scan['seconds']:
+        print(f"  last scan: {scan['dirs_per_second']} directories/s, {scan['files_per_second']} files/s")
+    if stats['queries']:
+        print(f"  {'queries':<10}{'count':>8}{'p50 ms':>12}{'p90 ms':>12}{'p99 ms':>12}{'max ms':>12}")
+        for mode, latency in sorted(stats['queries'].items()):
+            print(f"  {mode:<10}{latency['count']:>8}{latency['p50_ms']:>12.3f}{latency['p90_ms']:>12.3f}"
+                  f"{latency['p99_ms']:>12.3f}{latency['max_ms']:>12.3f}")
+    peak = stats['memory']['peak_rss_bytes']
+    if peak is not None:
+        phases = ', '.join(f"{phase} {value / 1024 ** 2:.0f} MB"
+                           for phase, value in sorted(stats['memory']['peak_rss_bytes_by_phase'].items()))
+        print(f"  peak memory: {peak / 1024 ** 2:.1f} MB" + (f" (at the end of {phases})" if phases else ""))
+
+def dump_stats(words):
+    # "stats json" / "stats prom", optionally followed by a file to write.
+    text = metrics.to_json() if words[0] == 'json' else metrics.to_prometheus()
+    if len(words) > 1:
+        with open(words[1], 'w', encoding='utf-8') as f:
+            f.write(text if text.endswith('\n') else text + '\n')
+        print(f"Statistics written to {words[1]}")
+    else:
+        print(text.rstrip('\n'))
+
+def show_cache_stats():
+    stats = query_cache.stats()
+    print(f"Cached queries: {stats['entries']} ({stats['bytes'] / 1024:.0f} KB)")
+    print(f"  hits: {stats['hits']}, misses: {stats['misses']}, hit rate: {stats['hit_rate']:.1%}")
+    print(f"  evictions: {stats['evictions']}, invalidations: {stats['invalidations']}")
+
 async def run_console():
     ensure_index_dir()
     print_banner()
 
-    if os.path.exists(INDEX_FILE):
+    if saved_root_names() or os.path.exists(LEGACY_INDEX_FILE):
         await load_data()
+        if WATCH_ON_START and roots:
+            start_watcher()
     else:
         print("Index file not found. Use 'index' command to create one.")
 
@@ -59,68 +353,220 @@ async def run_console():
             command = parts[0].lower()
 
             if command in ['exit', 'quit', 'q']:
+                if running_jobs():
+                    print("Waiting for running index builds...")
+                wait_for_jobs()
+                stop_watcher()
+                wait_for_compaction()
                 print("Goodbye!")
                 break
             elif command == 'help':
                 show_help()
+            elif command == 'status':
+                show_status()
             elif command == 'delete':
-                if os.path.exists(INDEX_FILE):
-                    confirm = input(f"Delete index file? (y/n): ").strip().lower()
+                if busy('delete the index'):
+                    continue
+                if roots or saved_root_names():
+                    confirm = input(f"Delete the index files of every root? (y/n): ").strip().lower()
                     if confirm in ['y', 'yes']:
-                        os.remove(INDEX_FILE)
-                        file_index.clear()
+                        stop_watcher()
+                        wait_for_compaction()
+                        for name in saved_root_names():
+                            roots.setdefault(name, IndexRoot(name))
+                        for name in list(roots):
+                            remove_root(name)
+                        if os.path.exists(HASH_CACHE_FILE):
+                            os.remove(HASH_CACHE_FILE)
+                        hash_cache.load()
                         print("Index file deleted successfully!")
                     else:
                         print("Delete cancelled.")
                 else:
                     print("No index file found to delete.")
             elif command == 'index':
-                path = input('Enter path to index: ').strip()
-                if path and os.path.exists(path):
-                    print(f"Building file index for: {path}")
-                    await index(path)
-                    print("Index complete!")
-                elif path:
-                    print(f"Path not found: {path}")
+                try:
+                    paths, name, options = parse_index_args(parts[1] if len(parts) > 1 else '')
+                except ValueError as e:
+                    print(f"Invalid arguments: {e}")
+                    continue
+                if not paths:
+                    path = input('Enter path to index: ').strip()
+                    paths = [path] if path else []
+                if name is not None and len(paths) > 1:
+                    print("--name can only be used with a single path")
+                    continue
+                missing = [path for path in paths if not os.path.exists(path)]
+                if missing:
+                    print(f"Path not found: {', '.join(missing)}")
+                elif paths:
+                    print(f"Building file index for: {', '.join(paths)}")
+                    start_jobs(index_jobs(paths, name, job_done, **options))
                 else:
                     print("No path provided")
             elif command == 'reindex':
-                path = input('Enter path to reindex: ').strip()
+                text, names = parse_roots(parts[1] if len(parts) > 1 else '')
+                if names is not None or text == '--all':
+                    try:
+                        selected = select_roots(names)
+                    except ValueError as e:
+                        print(f"Invalid root: {e}")
+                        continue
+                    if not selected:
+                        print("No roots loaded. Use 'index' or 'load' first.")
+                        continue
+                    print(f"Reindexing roots: {', '.join(root.name for root in selected)}")
+                    start_jobs(reindex_jobs([(root, root.path) for root in selected if root.path], job_done))
+                    continue
+                path = text or input('Enter path to reindex: ').strip()
                 if path and os.path.exists(path):
+                    root = root_for_path(path)
+                    if root is None:
+                        print(f"{path} is not inside an indexed root. Use 'index' to add it.")
+                        continue
                     print(f"Reindexing: {path}")
-                    await reindex_file(path)
-                    print("Reindex complete!")
+                    start_jobs(reindex_jobs([(root, path)], job_done))
                 elif path:
                     print(f"Path not found: {path}")
                 else:
                     print("No path provided")
             elif command == 'load':
-                if os.path.exists(INDEX_FILE):
-                    await load_data()
+                names = parts[1].split() if len(parts) > 1 else None
+                if busy('reload'):
+                    continue
+                if saved_root_names() or os.path.exists(LEGACY_INDEX_FILE):
+                    stop_watcher()
+                    with index_lock:
+                        wait_for_compaction()
+                        await load_data(names)
                     print("Index reloaded successfully!")
+                    if WATCH_ON_START and roots:
+                        start_watcher()
+                else:
+                    print("No saved index found. Use 'index' command to create one.")
+            elif command == 'rules':
+                show_rules(parts[1].replace(',', ' ').split() if len(parts) > 1 else None)
+            elif command == 'roots':
+                words = parts[1].split() if len(parts) > 1 else []
+                if len(words) == 2 and words[0].lower() == 'remove':
+                    name = words[1]
+                    if name not in roots and name not in saved_root_names():
+                        print(f"Unknown root: {name}")
+                        continue
+                    if active_job(name) is not None:
+                        print(f"Root '{name}' is being built; wait for it ('status') before removing it.")
+                        continue
+                    confirm = input(f"Delete the index of root '{name}'? (y/n): ").strip().lower()
+                    if confirm in ['y', 'yes']:
+                        stop_watcher([name])
+                        with index_lock:
+                            roots.setdefault(name, IndexRoot(name))
+                            remove_root(name)
+                        print(f"Root '{name}' removed.")
+                    else:
+                        print("Remove cancelled.")
+                elif words:
+                    print("Usage: roots [remove <name>]")
                 else:
-                    print(f"Index file not found: {INDEX_FILE}")
+                    show_roots()
             elif command == 'search':
                 if len(parts) > 1:
                     query = parts[1]
                 else:
                     query = input('Enter search query: ').strip()
+                query, root_names = parse_roots(query)
+                query, limit, page = parse_paging(query)
                 if query:
-                    results = await search_files(query)
+                    with index_lock:
+                        results = await search_files(query, limit, page, root_names)
                     display(results, query)
             elif command == 'exsearch':
                 if len(parts) > 1:
                     extension = parts[1]
                 else:
                     extension = input('Enter file extension: ').strip()
+                extension, root_names = parse_roots(extension)
+                extension, limit, page = parse_paging(extension)
                 if extension:
-                    results = await search_ext(extension)
+                    with index_lock:
+                        results = await search_ext(extension, limit, page, root_names)
                     display(results, extension)
+            elif command == 'filter':
+                if len(parts) > 1:
+                    terms = parts[1]
+                else:
+                    terms = input('Enter filter terms: ').strip()
+                terms, root_names = parse_roots(terms)
+                terms, limit, page = parse_paging(terms)
+                if terms:
+                    with index_lock:
+                        results = await search_filter(terms, limit, page, root_names)
+                    display(results, terms)
+            elif command == 'grep':
+                if len(parts) > 1:
+                    term = parts[1]
+                else:
+                    term = input('Enter words to search for: ').strip()
+                term, root_names = parse_roots(term)
+                term, limit, page = parse_paging(term)
+                if term:
+                    with index_lock:
+                        results = await search_content(term, limit, page, root_names)
+                    display(results, term)
+            elif command == 'dupes':
+                text, root_names = parse_roots(parts[1] if len(parts) > 1 else '')
+                text, limit, page = parse_paging(text)
+                try:
+                    min_size = max(1, parse_size(text)) if text else 1
+                except ValueError:
+                    print(f"Invalid size: '{text}'")
+                    continue
+                with index_lock:
+                    groups = await search_dupes(min_size, root_names)
+                display_dupes(groups, limit, page)
+            elif command == 'cache':
+                if len(parts) > 1 and parts[1].strip().lower() == 'clear':
+                    with index_lock:
+                        query_cache.invalidate_all()
+                    print("Result cache cleared.")
+                else:
+                    show_cache_stats()
+            elif command == 'stats':
+                words = parts[1].split() if len(parts) > 1 else []
+                if not words:
+                    show_stats()
+                elif words[0].lower() == 'reset':
+                    metrics.reset()
+                    print("Statistics reset.")
+                elif words[0].lower() in ('json', 'prom') and len(words) <= 2:
+                    words[0] = words[0].lower()
+                    dump_stats(words)
+                else:
+                    print("Usage: stats [json|prom [file] | reset]")
+            elif command == 'quiet':
+                option = parts[1].strip().lower() if len(parts) > 1 else ''
+                if option not in ('', 'on', 'off'):
+                    print("Usage: quiet [on|off]")
+                    continue
+                metrics.quiet = option != 'off' if option else not metrics.quiet
+                print(f"Quiet mode {'on' if metrics.quiet else 'off'}.")
+            elif command == 'watch':
+                option = parts[1].strip().lower() if len(parts) > 1 else ''
+                if option == 'stop':
+                    stop_watcher()
+                    print("Watcher stopped.")
+                elif option == 'status' or any(watcher.is_running() for watcher in watchers.values()):
+                    show_watch_status()
+                else:
+                    start_watcher()
             else:
                 print(f"Unknown command: '{command}'")
                 print("Type 'help' for available commands")
 
         except KeyboardInterrupt:
+            wait_for_jobs()
+            stop_watcher()
+            wait_for_compaction()
             print("\nGoodbye!")
             break
         except Exception as e:
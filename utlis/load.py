@@ -1,38 +1,153 @@
-from utlis.config import INDEX_FILE, file_index, folder_index
+from core.segment import StringTable, read_segment
+from core.store import id_array
+from utlis.config import DEFAULT_ROOT, LEGACY_INDEX_FILE, metrics, query_cache
+from utlis.roots import IndexRoot, roots, saved_root_names
+from utlis.save import save_data
 import os
 import json
+import struct
 
-async def load_data():
-    if os.path.exists(INDEX_FILE):
+META_KEYS = ('root', 'complete', 'scan_timestamp', 'exclude', 'gitignore', 'excluded')
+
+def import_json_index(root, path):
+    with open(path, 'r', encoding='utf-8') as f:
+        index_data = json.load(f)
+    store = root.store
+    store.clear()
+    if 'store' in index_data:
+        # Columnar JSON written before the binary segment format existed.
+        columns = index_data['store']
+        names = StringTable()
+        for name in columns.pop('names'):
+            names.append(name)
+        folder_flags = bytearray(columns.pop('folder_flags'))
+        store.load_columns(names, {attr: id_array(values) for attr, values in columns.items()}, folder_flags)
+        for listener in store.listeners:
+            listener.rebuild()
+    else:
+        # The original format kept every absolute path in name -> paths dicts.
+        for folder_paths in index_data.get('folder_index', {}).values():
+            for folder_path in folder_paths:
+                store.add_folder(folder_path)
+        for name, paths in index_data.get('file_index', {}).items():
+            for file_path in paths:
+                store.add_file(name, file_path)
+    root.meta.clear()
+    for key in META_KEYS:
+        if key in index_data:
+            root.meta[key] = index_data[key]
+
+def load_content_index(root):
+    content_index = root.content_index
+    try:
+        loaded = content_index.load()
+    except (ValueError, KeyError, OSError) as e:
+        print(f"Content index could not be read ({e}); it will be rebuilt.")
+        content_index.clear()
+        loaded = False
+    if not loaded and content_index.enabled:
+        # Picked up by the next reindex.
+        content_index.queue_all()
+
+def load_segment(root, path):
+    store = root.store
+    meta, postings = read_segment(path, store)
+    for listener in store.listeners:
+        if not listener.load_posting_lists(postings):
+            listener.rebuild()
+    root.meta.clear()
+    for key in META_KEYS:
+        if key in meta:
+            root.meta[key] = meta[key]
+    # Workers read the base segment, so it is marked before the log is
+    # replayed on top of it.
+    root.shard_executor.mark_saved()
+    return meta
+
+def recover_backup(root, error):
+    # Set aside rather than deleted: the previous base is usually a far
+    # better start than an empty index. Returns whether the backup loaded.
+    index_file, backup_file = root.index_file, root.backup_file
+    print(f"Index file could not be read ({error}).")
+    try:
+        os.replace(index_file, index_file + '.corrupt')
+        print(f"Moved it to {index_file}.corrupt.")
+    except OSError as e:
+        print(f"Could not move the unreadable index aside: {e}")
+        return False
+    if os.path.exists(backup_file):
         try:
-            with open(INDEX_FILE, 'r', encoding='utf-8') as f:
-                index_data = json.load(f)
-            loaded_file_index = index_data.get('file_index', {})
-            loaded_folder_index = index_data.get('folder_index', {})
-            file_index.clear()
-            folder_index.clear()
-            file_index.update(loaded_file_index)
-            folder_index.update(loaded_folder_index)
-            print(f"Loaded index from {INDEX_FILE}: {len(file_index)} unique filenames, {len(folder_index)} unique folder names.")
-        except UnicodeDecodeError:
-            print(f"Index file appears to be corrupted or in wrong format. Deleting and starting fresh.")
-            try:
-                os.remove(INDEX_FILE)
-                file_index.clear()
-                folder_index.clear()
-                print("Corrupted index file removed. Use 'index' command to create a new one.")
-            except Exception as e:
-                print(f"Could not remove corrupted file: {e}")
-        except json.JSONDecodeError:
-            print(f"Index file contains invalid JSON. Deleting and starting fresh.")
-            try:
-                os.remove(INDEX_FILE)
-                file_index.clear()
-                folder_index.clear()
-                print("Invalid index file removed. Use 'index' command to create a new one.")
-            except Exception as e:
-                print(f"Could not remove invalid file: {e}")
-        except Exception as e:
-            print(f"Failed to load index: {e}")
+            load_segment(root, backup_file)
+            save_data(root, full=True)
+            print(f"Restored the previous index from {backup_file}. Run 'reindex' to bring it up to date.")
+            return True
+        except (ValueError, KeyError, OSError, struct.error) as e:
+            print(f"The backup could not be read either ({e}).")
+    root.store.clear()
+    print("Use 'index' command to create a new one.")
+    return False
+
+def load_root(name, log=print):
+    # Reads one root from disk. Returns it, or None when nothing usable was
+    # found.
+    root = IndexRoot(name)
+    store = root.store
+    try:
+        with metrics.timer('load'):
+            meta = load_segment(root, root.index_file)
+            replayed = root.delta_log.replay(meta.get('log_token'))
+            load_content_index(root)
+        log(f"Loaded root '{name}' ({root.path}) from {root.index_file}: {store.file_names()} unique filenames, {store.folder_names()} unique folder names.")
+        if replayed:
+            log(f"Applied {replayed} changes from {root.log_file}.")
+        if root.meta.get('complete') is False:
+            log(f"Warning: root '{name}' was saved mid-scan and is incomplete. Run 'index' or 'reindex' to finish it.")
+    except (ValueError, KeyError, OSError, struct.error) as e:
+        if not recover_backup(root, e):
+            return None
+    except Exception as e:
+        log(f"Failed to load index: {e}")
+        return None
+    return root
+
+def import_legacy_index():
+    print(f"Importing JSON index from {LEGACY_INDEX_FILE}...")
+    root = IndexRoot(DEFAULT_ROOT)
+    try:
+        import_json_index(root, LEGACY_INDEX_FILE)
+        save_data(root)
+        print(f"Imported {root.store.file_count} files into {root.index_file}. The JSON file can now be deleted.")
+        return root
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        print(f"JSON index file is corrupted, skipping import.")
+    except Exception as e:
+        print(f"Failed to import JSON index: {e}")
+    return None
+
+async def load_data(names=None):
+    # Loads every saved root, replacing what is in memory, or only the named
+    # ones next to the roots already loaded.
+    saved = saved_root_names()
+    if names:
+        missing = [name for name in names if name not in saved]
+        if missing:
+            print(f"No saved index for root {', '.join(missing)}.")
+        wanted = [name for name in saved if name in names]
     else:
+        roots.clear()
+        wanted = saved
+    for name in wanted:
+        roots.pop(name, None)
+        root = load_root(name)
+        if root is not None:
+            root.attach_cache()
+            roots[name] = root
+    if DEFAULT_ROOT not in saved and os.path.exists(LEGACY_INDEX_FILE) and (not names or DEFAULT_ROOT in names):
+        root = import_legacy_index()
+        if root is not None:
+            root.attach_cache()
+            roots[DEFAULT_ROOT] = root
+    elif not saved and not names:
         print(f"No index file found. Starting with empty index.")
+    # Results cached from the roots that were replaced.
+    query_cache.invalidate_all()
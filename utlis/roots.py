@@ -0,0 +1,162 @@
+import copy
+import os
+import re
+from core.content import ContentIndex
+from core.deltalog import DeltaLog
+from core.extindex import ExtensionIndex
+from core.folderindex import FolderPathIndex
+from core.fuzzy import FuzzyIndex
+from core.rules import ScanRules
+from core.shards import ShardExecutor
+from core.store import PathStore
+from core.trigram import TrigramIndex
+from utlis.config import (CONTENT_FILE, CONTENT_INDEX, CONTENT_MAX_BYTES, CONTENT_SKIP_EXTENSIONS, CONTENT_WORKERS,
+                          DEFAULT_ROOT, DELTA_LOG_FILE, EXCLUDE_RULES, GITIGNORE, INDEX_DIR, INDEX_FILE,
+                          QUERY_PARALLEL_MIN, QUERY_WORKERS, query_cache)
+
+ROOT_NAME = re.compile(r'[A-Za-z0-9_-]+')
+SEGMENT_NAME = re.compile(r'file_index\.([A-Za-z0-9_-]+)\.pyidx')
+
+
+class IndexRoot:
+    # One named root: a store with its own secondary indexes, delta log and
+    # files on disk. Roots share nothing but the result cache, so each one is
+    # built, reindexed, saved and loaded without touching the others.
+    def __init__(self, name):
+        self.name = name
+        if name == DEFAULT_ROOT:
+            self.index_file, self.log_file, self.content_file = INDEX_FILE, DELTA_LOG_FILE, CONTENT_FILE
+        else:
+            self.index_file = os.path.join(INDEX_DIR, f'file_index.{name}.pyidx')
+            self.log_file = os.path.join(INDEX_DIR, f'file_index.{name}.log')
+            self.content_file = os.path.join(INDEX_DIR, f'content_index.{name}.pyidx')
+        self.backup_file = self.index_file + '.bak'
+        self.store = store = PathStore()
+        self.trigram_index = TrigramIndex(store)
+        self.ext_index = ExtensionIndex(store)
+        self.folder_path_index = FolderPathIndex(store)
+        self.fuzzy_index = FuzzyIndex(store, self.trigram_index)
+        self.content_index = ContentIndex(store, self.content_file, CONTENT_INDEX, CONTENT_MAX_BYTES,
+                                          CONTENT_WORKERS, CONTENT_SKIP_EXTENSIONS)
+        self.delta_log = DeltaLog(store, self.log_file)
+        store.listeners.extend((self.trigram_index, self.ext_index, self.folder_path_index, self.fuzzy_index,
+                                self.content_index, self.delta_log))
+        # Attached by attach_cache once the root serves queries.
+        self.cache_feed = query_cache.feed(store)
+        self.shard_executor = ShardExecutor(store, self.index_file, QUERY_WORKERS, QUERY_PARALLEL_MIN)
+        self.meta = {}
+        self.compaction = None
+        self._rules = None
+        self._rules_key = None
+
+    def attach_cache(self):
+        # Changes to a root being built or refreshed on a job thread must not
+        # reach the shared result cache, which only the query side may touch
+        # and which forgets everything once the root is swapped in anyway.
+        if self.cache_feed not in self.store.listeners:
+            self.store.listeners.append(self.cache_feed)
+
+    def clone(self):
+        # An in-memory copy sharing nothing that changes, so a reindex can
+        # refresh it while this root keeps answering queries. Called with the
+        # index lock held.
+        clone = IndexRoot(self.name)
+        clone.store.copy_from(self.store)
+        postings = {}
+        for listener in self.store.listeners:
+            for kind, lists in listener.posting_lists().items():
+                postings[kind] = {key: ids[:] for key, ids in lists.items()}
+        for listener in clone.store.listeners:
+            if not listener.load_posting_lists(postings):
+                listener.rebuild()
+        clone.meta = copy.deepcopy(self.meta)
+        clone.content_index.copy_from(self.content_index)
+        clone.delta_log.copy_from(self.delta_log)
+        clone.shard_executor.copy_saved(self.shard_executor)
+        return clone
+
+    @property
+    def path(self):
+        return self.meta.get('root')
+
+    @property
+    def rules(self):
+        # Compiled from the configured patterns and the root's own settings,
+        # again whenever those change.
+        key = (self.path, tuple(self.meta.get('exclude', ())), self.meta.get('gitignore', GITIGNORE))
+        if self._rules is None or self._rules_key != key:
+            self._rules = ScanRules(EXCLUDE_RULES + list(key[1]), key[0] or '', key[2])
+            self._rules_key = key
+        return self._rules
+
+    def files(self):
+        # Everything this root keeps on disk.
+        return (self.index_file, self.backup_file, self.log_file, self.content_file)
+
+    def contains(self, path):
+        root = self.path
+        if not root:
+            return False
+        try:
+            return os.path.commonpath([os.path.abspath(root), os.path.abspath(path)]) == os.path.abspath(root)
+        except ValueError:
+            return False
+
+
+# Loaded roots by name, in the order they were loaded or built.
+roots = {}
+
+
+def saved_root_names():
+    names = []
+    if not os.path.isdir(INDEX_DIR):
+        return names
+    for entry in sorted(os.listdir(INDEX_DIR)):
+        if entry == os.path.basename(INDEX_FILE):
+            names.insert(0, DEFAULT_ROOT)
+        else:
+            match = SEGMENT_NAME.fullmatch(entry)
+            if match and match.group(1) != DEFAULT_ROOT:
+                names.append(match.group(1))
+    return names
+
+def root_for_path(path):
+    # The loaded root a path lies in, the innermost one if roots nest.
+    matches = [root for root in roots.values() if root.contains(path)]
+    return max(matches, key=lambda root: len(root.path), default=None)
+
+def name_for_path(path, reserved=()):
+    # A free root name derived from the folder name, e.g. /mnt/data -> data.
+    base = re.sub(r'[^A-Za-z0-9_-]+', '_', os.path.basename(os.path.abspath(path).rstrip('/\\'))).strip('_')
+    base = base or 'root'
+    taken = set(roots) | set(saved_root_names()) | set(reserved)
+    name = base
+    suffix = 2
+    while name in taken:
+        name = f'{base}-{suffix}'
+        suffix += 1
+    return name
+
+def select_roots(names=None):
+    # The loaded roots a query runs over: all of them, or the named subset.
+    if not names:
+        return list(roots.values())
+    unknown = [name for name in names if name not in roots]
+    if unknown:
+        raise ValueError(f"unknown root {', '.join(unknown)}; loaded: {', '.join(roots) or 'none'}")
+    return [roots[name] for name in dict.fromkeys(names)]
+
+def remove_root(name):
+    # Forgets a root and deletes its files; the other roots are untouched.
+    root = roots.pop(name)
+    if root.compaction is not None:
+        root.compaction.join()
+    root.shard_executor.shutdown()
+    for path in root.files():
+        if os.path.exists(path):
+            os.remove(path)
+    query_cache.invalidate_all()
+    return root
+
+def total_files(selected=None):
+    return sum(root.store.file_count for root in (roots.values() if selected is None else selected))
@@ -0,0 +1,65 @@
+import os
+import threading
+from core.segment import write_segment
+from utlis.config import LOG_COMPACT_MIN_BYTES, LOG_COMPACT_RATIO, index_lock, ensure_index_dir, metrics
+from utlis.roots import roots
+
+def save_data(root, full=False):
+    with metrics.timer('persist'):
+        persist(root, full)
+
+def persist(root, full):
+    # Appends the changes since the last save to the root's delta log when
+    # the base segment on disk is the one memory was built from, and rewrites
+    # the base otherwise or when asked to.
+    ensure_index_dir()
+    delta_log = root.delta_log
+    if not full and delta_log.active and os.path.exists(root.index_file):
+        delta_log.flush()
+        if delta_log.size > max(LOG_COMPACT_MIN_BYTES, os.path.getsize(root.index_file) * LOG_COMPACT_RATIO):
+            start_compaction(root)
+    else:
+        write_base(root)
+    # An existing content index is rewritten even when disabled, so it never
+    # refers to file ids of an older store.
+    if root.content_index.enabled or os.path.exists(root.content_file):
+        root.content_index.save()
+
+def write_base(root):
+    store = root.store
+    postings = {}
+    for listener in store.listeners:
+        postings.update(listener.posting_lists())
+    token = os.urandom(8).hex()
+    write_segment(root.index_file, store, postings, {
+        "total_files": store.file_count,
+        "total_folders": store.folder_count,
+        "log_token": token,
+        **root.meta,
+    }, backup=root.backup_file)
+    # A crash before the reset leaves a log for the old base, which the next
+    # load ignores.
+    root.delta_log.reset(token)
+    root.shard_executor.mark_saved()
+
+def compact(root):
+    with index_lock:
+        if not root.delta_log.active:
+            return
+        try:
+            with metrics.timer('compact'):
+                write_base(root)
+        except Exception as e:
+            print(f"\nCould not compact the index log of '{root.name}': {e}")
+
+def start_compaction(root):
+    if root.compaction is not None and root.compaction.is_alive():
+        return
+    root.compaction = threading.Thread(target=compact, args=(root,), name=f'index-compaction-{root.name}',
+                                       daemon=True)
+    root.compaction.start()
+
+def wait_for_compaction():
+    for root in list(roots.values()):
+        if root.compaction is not None:
+            root.compaction.join()
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import signal
+import time
+from urllib.parse import parse_qs, urlsplit
+from utlis.config import (LEGACY_INDEX_FILE, SEARCH_LIMIT, SERVER_CHUNK, WATCH_ON_START, ensure_index_dir,
+                          index_lock, metrics, query_cache)
+from utlis.roots import roots, saved_root_names, select_roots
+from core.watcher import IndexWatcher
+from search.search import search_files
+from search.exSearch import search_ext
+from search.grep import search_content
+from search.filters import search_filter
+from utlis.load import load_data
+from utlis.save import wait_for_compaction
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+def query_paging(params):
+    # ?limit=N&page=P, with limit=0 or all=1 returning every match.
+    try:
+        limit = int(params.get('limit', SEARCH_LIMIT))
+        page = max(1, int(params.get('page', 1)))
+    except ValueError:
+        raise ValueError("limit and page must be integers")
+    if limit <= 0 or params.get('all') in ('1', 'true'):
+        limit = None
+    return limit, page
+
+
+def query_roots(params):
+    # ?roots=a,b limits a query to those roots; every loaded root otherwise.
+    names = [name for name in params.get('roots', '').split(',') if name]
+    if names:
+        select_roots(names)
+    return names or None
+
+
+async def run_query(path, params):
+    limit, page = query_paging(params)
+    root_names = query_roots(params)
+    if path == '/search':
+        query = params.get('q', '').strip()
+        if not query:
+            raise ValueError("missing q")
+        with index_lock:
+            return query, await search_files(query, limit, page, root_names)
+    if path == '/folders':
+        query = params.get('q', '').strip()
+        if not query:
+            raise ValueError("missing q")
+        with index_lock:
+            return query, await search_files('-f ' + query, limit, page, root_names)
+    if path == '/exsearch':
+        extension = params.get('ext', '').strip()
+        if not extension:
+            raise ValueError("missing ext")
+        with index_lock:
+            return extension, await search_ext(extension, limit, page, root_names)
+    if path == '/filter':
+        terms = params.get('q', '').strip()
+        if not terms:
+            raise ValueError("missing q")
+        with index_lock:
+            return terms, await search_filter(terms, limit, page, root_names)
+    if path == '/grep':
+        term = params.get('q', '').strip()
+        if not term:
+            raise ValueError("missing q")
+        with index_lock:
+            return term, await search_content(term, limit, page, root_names)
+    return None, None
+
+
+class QueryServer:
+    # A small HTTP/1.1 server over the shared in-memory index. Every
+    # connection is handled by its own task; queries run under the index lock
+    # and their results are streamed back as a chunked JSON body, so a slow
+    # client never holds the lock while it reads.
+    def __init__(self):
+        self.watchers = {}
+        self.requests = 0
+        self.started = time.time()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.respond(request_line.decode('latin-1').split(), writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, request, writer):
+        self.requests += 1
+        if len(request) < 2:
+            await self.send_json(writer, 400, {"error": "malformed request"})
+            return
+        method, target = request[0], request[1]
+        if method != 'GET':
+            await self.send_json(writer, 405, {"error": "only GET is supported"})
+            return
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == '/status':
+            await self.send_json(writer, 200, self.status())
+            return
+        if url.path == '/metrics':
+            data = metrics.to_prometheus().encode()
+            self.send_head(writer, 200, False, 'text/plain; version=0.0.4; charset=utf-8')
+            writer.write(f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+            await writer.drain()
+            return
+        start = time.time()
+        try:
+            query, results = await run_query(url.path, params)
+        except ValueError as e:
+            await self.send_json(writer, 400, {"error": str(e)})
+            return
+        if results is None:
+            await self.send_json(writer, 404, {"error": f"unknown endpoint {url.path}"})
+            return
+        await self.stream_results(writer, query, results, time.time() - start)
+
+    def status(self):
+        return {
+            "files": sum(root.store.file_count for root in roots.values()),
+            "folders": sum(root.store.folder_count for root in roots.values()),
+            "roots": {name: {
+                "path": root.path,
+                "files": root.store.file_count,
+                "folders": root.store.folder_count,
+                "complete": root.meta.get('complete'),
+                "scan_timestamp": root.meta.get('scan_timestamp'),
+                "watching": name in self.watchers and self.watchers[name].is_running(),
+            } for name, root in roots.items()},
+            "requests": self.requests,
+            "cache": query_cache.stats(),
+            "uptime": round(time.time() - self.started, 1),
+            "metrics": metrics.snapshot(),
+        }
+
+    def send_head(self, writer, code, chunked, content_type='application/json; charset=utf-8'):
+        head = [f"HTTP/1.1 {code} {REASONS[code]}", f"Content-Type: {content_type}"]
+        if chunked:
+            head.append("Transfer-Encoding: chunked")
+        writer.write(('\r\n'.join(head) + '\r\n').encode())
+
+    async def send_json(self, writer, code, body):
+        data = json.dumps(body).encode()
+        self.send_head(writer, code, False)
+        writer.write(f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+        await writer.drain()
+
+    async def stream_results(self, writer, query, results, elapsed):
+        self.send_head(writer, 200, True)
+        writer.write(b'\r\n')
+
+        def chunk(text):
+            data = text.encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b'\r\n')
+
+        chunk(f'{{"query": {json.dumps(query)}, "offset": {getattr(results, "offset", 0)}, "results": [')
+        for i in range(0, len(results), SERVER_CHUNK):
+            prefix = ', ' if i else ''
+            chunk(prefix + ', '.join(json.dumps(path) for path in results[i:i + SERVER_CHUNK]))
+            await writer.drain()
+        more = 'true' if getattr(results, 'more', False) else 'false'
+        chunk(f'], "count": {len(results)}, "more": {more}, "time": {elapsed:.4f}}}')
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    def start_watcher(self):
+        if not WATCH_ON_START:
+            return
+        for root in roots.values():
+            if root.path and os.path.isdir(root.path):
+                watcher = self.watchers[root.name] = IndexWatcher(root)
+                watcher.start()
+                print(f"Watching {root.path} for changes ({watcher.mode}).")
+
+    def stop_watcher(self):
+        for watcher in self.watchers.values():
+            watcher.stop()
+        self.watchers.clear()
+
+
+async def run_server(host, port, unix_path=None):
+    ensure_index_dir()
+    if saved_root_names() or os.path.exists(LEGACY_INDEX_FILE):
+        await load_data()
+    else:
+        print("Index file not found. Run 'index' from the console first.")
+
+    server = QueryServer()
+    if unix_path:
+        # A socket left behind by a killed server would make the bind fail.
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        listener = await asyncio.start_unix_server(server.handle, path=unix_path)
+        print(f"Serving on unix socket {unix_path}")
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+        print(f"Serving on http://{host}:{port}")
+    print("Endpoints: /search?q=  /folders?q=  /exsearch?ext=  /filter?q=  /grep?q=  /status  /metrics  (limit, page, all, roots)")
+    server.start_watcher()
+    serving = asyncio.ensure_future(listener.serve_forever())
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serving.cancel)
+    except (NotImplementedError, AttributeError):
+        pass
+    try:
+        async with listener:
+            await serving
+    except asyncio.CancelledError:
+        pass
+    finally:
+        server.stop_watcher()
+        wait_for_compaction()
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)